@@ -1,4 +1,6 @@
+import asyncio
 from dataclasses import dataclass
+from typing import List, Optional
 
 
 @dataclass
@@ -13,11 +15,61 @@ class LLMBackend:
     This base exposes both `chat` and `generate` to accomodate
     differing client APIs. Implementations SHOULD implement `chat`.
     If a backend provides `generate`, it should behave like `chat`.
+
+    `achat`/`agenerate` are the async counterparts. By default they run the
+    blocking call in a worker thread; backends with a native async client
+    should override them.
+
+    `chat_json`/`achat_json` ask for a JSON answer. Backends with a native
+    JSON mode set `supports_json_mode` and constrain the output (optionally
+    to a JSON Schema); the default is a plain `chat`/`achat`.
+
+    `chat_batch`/`achat_batch` answer several prompts in one call. The
+    default loops over `chat`/`achat` (`chat_json`/`achat_json` for prompts
+    given a schema); backends that can batch natively
+    (local models) should override them and raise `batch_size`.
     """
 
+    # Prompt size limit in tokens; None falls back to the per-model table in document_processing.chunker
+    context_window = None
+    # How ChunkProcessor prompts this backend: "split" (summary + key info calls) or "combined" (one JSON call)
+    chunk_mode = "split"
+    # Requests the backend can usefully serve at once; ChunkProcessor.process_chunks keeps this many in flight
+    max_concurrency = 4
+    # Prompts ChunkProcessor groups into one chat_batch call; 1 means no batching
+    batch_size = 1
+    # Whether chat_json actually constrains output to JSON
+    supports_json_mode = False
+
+    def generation_params(self) -> dict:
+        """Settings besides the model that change a response; part of CachedBackend's key."""
+        return {}
+
     def chat(self, prompt: str) -> str:
         raise NotImplementedError
 
     def generate(self, prompt: str) -> str:
         # default to chat for backward compatibility
         return self.chat(prompt)
+
+    async def achat(self, prompt: str) -> str:
+        return await asyncio.to_thread(self.chat, prompt)
+
+    async def agenerate(self, prompt: str) -> str:
+        return await asyncio.to_thread(self.generate, prompt)
+
+    def chat_json(self, prompt: str, schema: Optional[dict] = None) -> str:
+        return self.chat(prompt)
+
+    async def achat_json(self, prompt: str, schema: Optional[dict] = None) -> str:
+        return await self.achat(prompt)
+
+    def chat_batch(self, prompts: List[str], schemas: Optional[List[Optional[dict]]] = None) -> List[str]:
+        """schemas: per-prompt JSON Schema as for chat_json; None (or a None entry) means free text."""
+        schemas = schemas or [None] * len(prompts)
+        return [self.chat(p) if s is None else self.chat_json(p, s) for p, s in zip(prompts, schemas)]
+
+    async def achat_batch(self, prompts: List[str], schemas: Optional[List[Optional[dict]]] = None) -> List[str]:
+        schemas = schemas or [None] * len(prompts)
+        calls = (self.achat(p) if s is None else self.achat_json(p, s) for p, s in zip(prompts, schemas))
+        return list(await asyncio.gather(*calls))
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from ai.backend.llm_base import LLMBackend
+from ai.json_repair import extract_json
+from storage.disk_cache import DiskCache
+
+# Bump when prompt templates or response handling change in a way that makes old answers unusable.
+CACHE_VERSION = 1
+
+
+class ResponseCache:
+    """
+    Two-tier store of LLM responses: an in-process LRU in front of an optional DiskCache.
+
+    The memory tier serves repeats within one worker; the disk tier is shared
+    by every worker process pointed at the same directory. Safe to share
+    between threads and between CachedBackends (keys include provider and model).
+    Entries expire `ttl` seconds after they were first stored, in both tiers
+    (default: the store's ttl).
+    """
+
+    def __init__(
+        self,
+        memory_size: int = 1024,
+        store: Optional[DiskCache] = None,
+        ttl: Optional[float] = None,
+        clock=time.time,
+    ):
+        self.memory_size = memory_size
+        self.store = store
+        self.ttl = ttl if ttl is not None else getattr(store, "ttl", None)
+        self.clock = clock
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        now = self.clock()
+        with self._lock:
+            if key in self._memory:
+                response, expires = self._memory[key]
+                if expires is None or now < expires:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return response
+                del self._memory[key]
+        entry = self.store.get(key) if self.store is not None else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, entry["response"], entry.get("created", now))
+        return entry["response"]
+
+    def set(self, key: str, response: str):
+        now = self.clock()
+        with self._lock:
+            self._remember(key, response, now)
+        if self.store is not None:
+            self.store.set(key, {"response": response, "created": now})
+
+    def _remember(self, key: str, response: str, created: float):
+        self._memory[key] = (response, created + self.ttl if self.ttl is not None else None)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+
+class CachedBackend(LLMBackend):
+    """
+    Wraps any LLMBackend and answers repeated prompts from a ResponseCache.
+
+    Keys cover the provider (backend class), model, generation params, call
+    type and a hash of the prompt. Only successful responses are stored, and
+    JSON answers only when they parse (see extract_json): a caller's retry of
+    a broken answer must reach the model rather than the cache.
+    """
+
+    def __init__(self, backend: LLMBackend, cache: Optional[ResponseCache] = None):
+        self.backend = backend
+        self.cache = cache or ResponseCache()
+        # expose the wrapped backend's tuning so chunking and scheduling are unchanged
+        self.model = getattr(backend, "model", None)
+        self.context_window = backend.context_window
+        self.chunk_mode = backend.chunk_mode
+        self.max_concurrency = backend.max_concurrency
+        self.batch_size = backend.batch_size
+        self.supports_json_mode = backend.supports_json_mode
+
+    def __getattr__(self, name):
+        # backend-specific extras (e.g. CascadeBackend.escalate, stats) pass through uncached
+        if name == "backend":
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+    def generation_params(self) -> dict:
+        return self.backend.generation_params()
+
+    def key(self, method: str, prompt: str) -> str:
+        payload = {
+            "provider": type(self.backend).__name__,
+            "model": self.model,
+            "params": self.backend.generation_params(),
+            "method": method,
+            "prompt": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+            "version": CACHE_VERSION,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _store(self, key: str, method: str, response: str):
+        if method.startswith("chat_json") and not isinstance(extract_json(response), dict):
+            return
+        self.cache.set(key, response)
+
+    def _cached(self, method: str, prompt: str, call):
+        key = self.key(method, prompt)
+        response = self.cache.get(key)
+        if response is None:
+            response = call(prompt)
+            self._store(key, method, response)
+        return response
+
+    async def _acached(self, method: str, prompt: str, call):
+        key = self.key(method, prompt)
+        response = self.cache.get(key)
+        if response is None:
+            response = await call(prompt)
+            self._store(key, method, response)
+        return response
+
+    def chat(self, prompt: str) -> str:
+        return self._cached("chat", prompt, self.backend.chat)
+
+    def generate(self, prompt: str) -> str:
+        return self._cached("generate", prompt, self.backend.generate)
+
+    async def achat(self, prompt: str) -> str:
+        return await self._acached("chat", prompt, self.backend.achat)
+
+    async def agenerate(self, prompt: str) -> str:
+        return await self._acached("generate", prompt, self.backend.agenerate)
+
+    def chat_json(self, prompt: str, schema: Optional[dict] = None) -> str:
+        return self._cached(_json_method(schema), prompt, lambda p: self.backend.chat_json(p, schema))
+
+    async def achat_json(self, prompt: str, schema: Optional[dict] = None) -> str:
+        return await self._acached(_json_method(schema), prompt, lambda p: self.backend.achat_json(p, schema))
+
+    def _lookup_batch(self, prompts: List[str], schemas):
+        # keyed like chat / chat_json, so single and batched calls share entries
+        methods = ["chat" if s is None else _json_method(s) for s in schemas]
+        keys = [self.key(m, p) for m, p in zip(methods, prompts)]
+        responses = [self.cache.get(k) for k in keys]
+        missing = [i for i, r in enumerate(responses) if r is None]
+        return methods, keys, responses, missing
+
+    def _store_batch(self, methods, keys, responses, missing, fresh) -> List[str]:
+        for i, response in zip(missing, fresh):
+            responses[i] = response
+            self._store(keys[i], methods[i], response)
+        return responses
+
+    def chat_batch(self, prompts: List[str], schemas: Optional[List[Optional[dict]]] = None) -> List[str]:
+        # only the misses go to the model, still as one batch
+        schemas = schemas or [None] * len(prompts)
+        methods, keys, responses, missing = self._lookup_batch(prompts, schemas)
+        fresh = (
+            self.backend.chat_batch([prompts[i] for i in missing], schemas=[schemas[i] for i in missing])
+            if missing
+            else []
+        )
+        return self._store_batch(methods, keys, responses, missing, fresh)
+
+    async def achat_batch(self, prompts: List[str], schemas: Optional[List[Optional[dict]]] = None) -> List[str]:
+        schemas = schemas or [None] * len(prompts)
+        methods, keys, responses, missing = self._lookup_batch(prompts, schemas)
+        fresh = (
+            await self.backend.achat_batch([prompts[i] for i in missing], schemas=[schemas[i] for i in missing])
+            if missing
+            else []
+        )
+        return self._store_batch(methods, keys, responses, missing, fresh)
+
+
+def _json_method(schema: Optional[dict]) -> str:
+    return "chat_json:" + json.dumps(schema, sort_keys=True)
+
+
+def default_response_cache() -> Optional[ResponseCache]:
+    """
+    Cache configured through SMARTDOC_LLM_CACHE_DIR / _MAX_BYTES / _TTL / _MEMORY_ENTRIES,
+    or None when SMARTDOC_LLM_CACHE_DIR is unset.
+    """
+    directory = os.environ.get("SMARTDOC_LLM_CACHE_DIR")
+    if not directory:
+        return None
+    max_bytes = int(os.environ.get("SMARTDOC_LLM_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+    ttl = os.environ.get("SMARTDOC_LLM_CACHE_TTL")
+    store = DiskCache(directory, max_bytes=max_bytes, ttl=float(ttl) if ttl else None)
+    return ResponseCache(memory_size=int(os.environ.get("SMARTDOC_LLM_CACHE_MEMORY_ENTRIES", "1024")), store=store)
@@ -0,0 +1,180 @@
+import threading
+from typing import List, Optional, Tuple
+
+from ai.backend.llm_base import LLMBackend
+from ai.json_repair import extract_json
+from document_processing.chunker import context_window_for
+
+# Responses reporting a "confidence" below this are re-asked of the large model.
+DEFAULT_MIN_CONFIDENCE = 0.5
+
+
+def escalation_reason(
+    output: str, min_confidence: float = DEFAULT_MIN_CONFIDENCE, expect_json: bool = True
+) -> Optional[str]:
+    """
+    Why a small-model answer isn't good enough ("invalid_json", "low_confidence"), or None.
+
+    expect_json=False is for free-text prompts: only a JSON answer reporting a
+    low confidence escalates, prose or other non-JSON answers never do.
+    """
+    parsed = extract_json(output)
+    if not isinstance(parsed, dict):
+        return "invalid_json" if expect_json else None
+    confidence = parsed.get("confidence")
+    if isinstance(confidence, (int, float)) and confidence < min_confidence:
+        return "low_confidence"
+    return None
+
+
+class CascadeBackend(LLMBackend):
+    """
+    Asks a small, fast model first and escalates to a large one only when needed.
+
+    A small-model answer is escalated when it reports a confidence below
+    `min_confidence`, or, for JSON prompts (chat_json and batch prompts with
+    a schema), when it isn't valid JSON. Callers with their own criteria (such
+    as DocumentReasoner's borderline full-read decision) can pass them to
+    `cascade` as `escalate_if`, or send a prompt straight to the large model
+    with `escalate`; either way the large model answers a prompt at most
+    once and the escalation counts as "requested". `stats()` reports how often
+    each reason fired across this backend's lifetime; `stats_delta` turns two
+    snapshots into the counts for the calls in between.
+    """
+
+    def __init__(self, small: LLMBackend, large: LLMBackend, min_confidence: float = DEFAULT_MIN_CONFIDENCE):
+        self.small = small
+        self.large = large
+        self.min_confidence = min_confidence
+        self.model = getattr(small, "model", None)
+        self.chunk_mode = small.chunk_mode
+        # prompts must fit either model
+        self.context_window = min(context_window_for(small), context_window_for(large))
+        self.max_concurrency = small.max_concurrency
+        self.batch_size = small.batch_size
+        self.supports_json_mode = small.supports_json_mode
+        self._lock = threading.Lock()
+        self._counts = {"calls": 0, "escalated": 0, "invalid_json": 0, "low_confidence": 0, "requested": 0}
+
+    def generation_params(self) -> dict:
+        return {
+            "small": [type(self.small).__name__, getattr(self.small, "model", None), self.small.generation_params()],
+            "large": [type(self.large).__name__, getattr(self.large, "model", None), self.large.generation_params()],
+            "min_confidence": self.min_confidence,
+        }
+
+    def _count(self, reason: Optional[str]):
+        with self._lock:
+            self._counts["calls"] += 1
+            if reason:
+                self._counts["escalated"] += 1
+                self._counts[reason] += 1
+
+    def _check(self, output: str, expect_json: bool = False, escalate_if=None) -> Optional[str]:
+        reason = escalation_reason(output, self.min_confidence, expect_json)
+        if reason is None and escalate_if is not None and escalate_if(output):
+            reason = "requested"
+        self._count(reason)
+        return reason
+
+    def chat(self, prompt: str) -> str:
+        output = self.small.chat(prompt)
+        return self.large.chat(prompt) if self._check(output) else output
+
+    def generate(self, prompt: str) -> str:
+        output = self.small.generate(prompt)
+        return self.large.generate(prompt) if self._check(output) else output
+
+    async def achat(self, prompt: str) -> str:
+        output = await self.small.achat(prompt)
+        return await self.large.achat(prompt) if self._check(output) else output
+
+    async def agenerate(self, prompt: str) -> str:
+        output = await self.small.agenerate(prompt)
+        return await self.large.agenerate(prompt) if self._check(output) else output
+
+    def chat_json(self, prompt: str, schema: Optional[dict] = None) -> str:
+        output = self.small.chat_json(prompt, schema)
+        return self.large.chat_json(prompt, schema) if self._check(output, expect_json=True) else output
+
+    async def achat_json(self, prompt: str, schema: Optional[dict] = None) -> str:
+        output = await self.small.achat_json(prompt, schema)
+        return await self.large.achat_json(prompt, schema) if self._check(output, expect_json=True) else output
+
+    def chat_batch(self, prompts: List[str], schemas: Optional[List[Optional[dict]]] = None) -> List[str]:
+        schemas = schemas or [None] * len(prompts)
+        outputs = self.small.chat_batch(prompts, schemas=schemas)
+        retry = [i for i, (o, s) in enumerate(zip(outputs, schemas)) if self._check(o, expect_json=s is not None)]
+        if retry:
+            large = self.large.chat_batch([prompts[i] for i in retry], schemas=[schemas[i] for i in retry])
+            for i, output in zip(retry, large):
+                outputs[i] = output
+        return outputs
+
+    async def achat_batch(self, prompts: List[str], schemas: Optional[List[Optional[dict]]] = None) -> List[str]:
+        schemas = schemas or [None] * len(prompts)
+        outputs = await self.small.achat_batch(prompts, schemas=schemas)
+        retry = [i for i, (o, s) in enumerate(zip(outputs, schemas)) if self._check(o, expect_json=s is not None)]
+        if retry:
+            large = await self.large.achat_batch([prompts[i] for i in retry], schemas=[schemas[i] for i in retry])
+            for i, output in zip(retry, large):
+                outputs[i] = output
+        return outputs
+
+    def cascade(self, prompt: str, schema: Optional[dict] = None, escalate_if=None) -> Tuple[str, bool]:
+        """
+        Answer `prompt` (in JSON mode with a schema) and say whether the large model gave the answer.
+
+        escalate_if: the caller's own test of a small-model answer, e.g. a
+        borderline decision; it is not applied to the large model's answer.
+        """
+        output = self.small.generate(prompt) if schema is None else self.small.chat_json(prompt, schema)
+        if not self._check(output, expect_json=schema is not None, escalate_if=escalate_if):
+            return output, False
+        return self._ask_large(prompt, schema), True
+
+    async def acascade(self, prompt: str, schema: Optional[dict] = None, escalate_if=None) -> Tuple[str, bool]:
+        if schema is None:
+            output = await self.small.agenerate(prompt)
+        else:
+            output = await self.small.achat_json(prompt, schema)
+        if not self._check(output, expect_json=schema is not None, escalate_if=escalate_if):
+            return output, False
+        return await self._aask_large(prompt, schema), True
+
+    def escalate(self, prompt: str, schema: Optional[dict] = None) -> str:
+        """
+        Answer `prompt` with the large model, for an escalation decided by the caller.
+        With a schema the large model answers in JSON mode where it supports it.
+        """
+        self._count("requested")
+        return self._ask_large(prompt, schema)
+
+    async def aescalate(self, prompt: str, schema: Optional[dict] = None) -> str:
+        self._count("requested")
+        return await self._aask_large(prompt, schema)
+
+    def _ask_large(self, prompt: str, schema: Optional[dict]) -> str:
+        if schema is not None and self.large.supports_json_mode:
+            return self.large.chat_json(prompt, schema)
+        return self.large.generate(prompt)
+
+    async def _aask_large(self, prompt: str, schema: Optional[dict]) -> str:
+        if schema is not None and self.large.supports_json_mode:
+            return await self.large.achat_json(prompt, schema)
+        return await self.large.agenerate(prompt)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+        return _with_rate(counts)
+
+    @staticmethod
+    def stats_delta(before: dict, after: dict) -> dict:
+        """Counts for the calls between two `stats()` snapshots."""
+        return _with_rate({k: after[k] - before.get(k, 0) for k in after if k != "escalation_rate"})
+
+
+def _with_rate(counts: dict) -> dict:
+    counts["escalation_rate"] = round(counts["escalated"] / counts["calls"], 3) if counts["calls"] else 0.0
+    return counts
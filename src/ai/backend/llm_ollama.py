@@ -1,31 +1,142 @@
 try:
+    import httpx
     import ollama
 
     OLLAMA_AVAILABLE = True
 except Exception:
+    httpx = None
     ollama = None
     OLLAMA_AVAILABLE = False
 
+import asyncio
+import weakref
+from typing import Optional, Union
+
 from ai.backend.llm_base import LLMBackend
 
 
 class OllamaBackend(LLMBackend):
-    def __init__(self, model: str = "gemma3"):
+    supports_json_mode = True
+
+    def __init__(
+        self,
+        model: str = "gemma3",
+        chunk_mode: str = "combined",
+        host: Optional[str] = None,
+        timeout: Optional[float] = 300.0,
+        connect_timeout: float = 5.0,
+        max_connections: int = 16,
+        max_concurrency: int = 4,
+        keep_alive: Optional[Union[float, str]] = "30m",
+        options: Optional[dict] = None,
+    ):
+        """
+        host: Ollama server URL (default: OLLAMA_HOST or http://localhost:11434)
+        timeout: seconds to wait for a response; generation can be slow
+        connect_timeout: seconds to wait for a connection
+        max_connections: HTTP connection pool size, kept alive between calls
+        max_concurrency: requests ChunkProcessor keeps in flight (match the server's OLLAMA_NUM_PARALLEL)
+        keep_alive: how long the server keeps the model loaded after a call
+        options: Ollama generation options, e.g. {"num_ctx": 8192, "temperature": 0}
+        """
         if not OLLAMA_AVAILABLE:
             raise RuntimeError("Ollama SDK not installed; install `ollama` or use another backend.")
         self.model = model
+        self.chunk_mode = chunk_mode
+        self.host = host
+        self.keep_alive = keep_alive
+        self.options = options or {}
+        self.max_concurrency = max_concurrency
+        if self.options.get("num_ctx"):
+            self.context_window = self.options["num_ctx"]
+
+        # One pooled client for the backend's lifetime, reused across chunks, documents and requests
+        self._client_kwargs = {
+            "host": host,
+            "timeout": httpx.Timeout(timeout, connect=connect_timeout),
+            "limits": httpx.Limits(
+                max_connections=max(max_connections, max_concurrency), max_keepalive_connections=max_connections
+            ),
+        }
+        self.client = ollama.Client(**self._client_kwargs)
+        # httpx async clients are bound to the event loop they were first used on
+        self._async_clients = weakref.WeakKeyDictionary()
+        # short-timeout client for health probes, kept so probes don't each open a connection pool
+        self._probe_client = None
+        self._probe_timeout = None
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = ollama.AsyncClient(**self._client_kwargs)
+        return client
+
+    def _request_kwargs(self) -> dict:
+        kwargs = {"model": self.model, "keep_alive": self.keep_alive}
+        if self.options:
+            kwargs["options"] = self.options
+        return kwargs
+
+    def health_check(self, timeout: float = 2.0) -> bool:
+        """Whether the server answers a cheap request (the list of running models) within `timeout`."""
+        try:
+            if self._probe_client is None or self._probe_timeout != timeout:
+                if self._probe_client is not None:
+                    self._probe_client.close()
+                self._probe_client = ollama.Client(
+                    host=self.host, timeout=httpx.Timeout(timeout), limits=httpx.Limits(max_connections=1)
+                )
+                self._probe_timeout = timeout
+            self._probe_client.ps()
+            return True
+        except Exception:
+            return False
+
+    def generation_params(self) -> dict:
+        return dict(self.options)
 
     def chat(self, prompt: str) -> str:
-        response = ollama.chat(
-            model=self.model,
+        response = self.client.chat(
             messages=[{"role": "user", "content": prompt}],
+            **self._request_kwargs(),
         )
         return response["message"]["content"]
 
     def generate(self, prompt: str) -> str:
-        client = ollama.Client()
-        response = client.generate(
-            model=self.model,
+        response = self.client.generate(
+            prompt=prompt,
+            **self._request_kwargs(),
+        )
+        return response["response"]
+
+    def chat_json(self, prompt: str, schema: Optional[dict] = None) -> str:
+        # Ollama constrains decoding to valid JSON, or to the given JSON Schema
+        response = self.client.chat(
+            messages=[{"role": "user", "content": prompt}],
+            format=schema or "json",
+            **self._request_kwargs(),
+        )
+        return response["message"]["content"]
+
+    async def achat_json(self, prompt: str, schema: Optional[dict] = None) -> str:
+        response = await self._async_client().chat(
+            messages=[{"role": "user", "content": prompt}],
+            format=schema or "json",
+            **self._request_kwargs(),
+        )
+        return response["message"]["content"]
+
+    async def achat(self, prompt: str) -> str:
+        response = await self._async_client().chat(
+            messages=[{"role": "user", "content": prompt}],
+            **self._request_kwargs(),
+        )
+        return response["message"]["content"]
+
+    async def agenerate(self, prompt: str) -> str:
+        response = await self._async_client().generate(
             prompt=prompt,
+            **self._request_kwargs(),
         )
         return response["response"]
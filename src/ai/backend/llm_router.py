@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, List, Optional
+
+from ai.backend.llm_base import LLMBackend
+from document_processing.chunker import context_window_for
+
+logger = logging.getLogger(__name__)
+
+# 4xx statuses that say the host is busy rather than that the request is bad
+_RETRYABLE_CLIENT_STATUSES = (408, 429)
+
+
+def _is_client_error(error: Exception) -> bool:
+    """A 4xx answer (prompt too long, unknown model): the request is at fault, not the host."""
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in _RETRYABLE_CLIENT_STATUSES
+
+
+class _Member:
+    def __init__(self, backend: LLMBackend, name: str):
+        self.backend = backend
+        self.name = name
+        self.outstanding = 0
+        self.failures = 0  # consecutive
+        self.open_until = 0.0  # circuit open (member skipped) until this time
+        self.served = 0
+
+
+class RouterBackend(LLMBackend):
+    """
+    Spreads calls over a pool of equivalent backends (e.g. one OllamaBackend per host).
+
+    Each call goes to the available member with the fewest requests in
+    flight. A member failing `failure_threshold` times in a row has its
+    circuit opened for `cooldown` seconds and is skipped; afterwards it gets
+    a health probe (if it has `health_check`) before taking traffic again.
+    A failed call fails over to the next best member and only raises once
+    every member has been tried. Client errors (a 4xx `status_code`, such
+    as a prompt that is too long) are raised at once and don't count as
+    member failures; every host would reject the request the same way. `probe_interval` starts a daemon thread
+    that health-checks all members periodically.
+    """
+
+    def __init__(
+        self,
+        backends: List[LLMBackend],
+        names: Optional[List[str]] = None,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        probe_interval: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if not backends:
+            raise ValueError("RouterBackend needs at least one backend")
+        names = names or [getattr(b, "host", None) or f"backend-{i}" for i, b in enumerate(backends)]
+        self.members = [_Member(b, str(n)) for b, n in zip(backends, names)]
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._turn = 0  # rotates ties between equally loaded members
+
+        first = backends[0]
+        self.model = getattr(first, "model", None)
+        self.chunk_mode = first.chunk_mode
+        self.context_window = min(context_window_for(b) for b in backends)
+        self.max_concurrency = sum(b.max_concurrency for b in backends)
+        self.supports_json_mode = all(b.supports_json_mode for b in backends)
+
+        self._stop_probing = threading.Event()
+        if probe_interval:
+            threading.Thread(target=self._probe_loop, args=(probe_interval,), daemon=True).start()
+
+    @classmethod
+    def from_hosts(cls, hosts: List[str], router_options: Optional[dict] = None, **backend_options):
+        """One OllamaBackend per host URL, all with the same model and options."""
+        from ai.backend.llm_ollama import OllamaBackend
+
+        backends = [OllamaBackend(host=host, **backend_options) for host in hosts]
+        return cls(backends, names=list(hosts), **(router_options or {}))
+
+    def generation_params(self) -> dict:
+        return self.members[0].backend.generation_params()
+
+    # ---------------------------
+    # Member selection and health
+    # ---------------------------
+
+    def _acquire(self, tried: set) -> Optional[_Member]:
+        """Reserve the least loaded member not yet tried for this call; None when all are out."""
+        now = self.clock()
+        with self._lock:
+            candidates = [m for m in self.members if m.name not in tried and m.open_until <= now]
+            if not candidates:
+                # every circuit is open: try the one closest to reopening rather than fail outright
+                candidates = [m for m in self.members if m.name not in tried]
+                candidates = sorted(candidates, key=lambda m: m.open_until)[:1]
+            if not candidates:
+                return None
+            self._turn += 1
+            n = len(self.members)
+            member = min(candidates, key=lambda m: (m.outstanding, (self.members.index(m) - self._turn) % n))
+            half_open = member.failures >= self.failure_threshold
+            member.outstanding += 1
+        if half_open and not self._probe(member):
+            self._release(member, ok=False)
+            tried.add(member.name)
+            return self._acquire(tried)
+        return member
+
+    def _release(self, member: _Member, ok: bool):
+        with self._lock:
+            member.outstanding -= 1
+            if ok:
+                member.failures = 0
+                member.open_until = 0.0
+                member.served += 1
+                return
+            member.failures += 1
+            if member.failures >= self.failure_threshold:
+                if member.open_until <= self.clock():
+                    logger.warning("Opening circuit for %s after %d failures", member.name, member.failures)
+                member.open_until = self.clock() + self.cooldown
+
+    def _probe(self, member: _Member) -> bool:
+        check = getattr(member.backend, "health_check", None)
+        return True if check is None else bool(check())
+
+    def check_health(self) -> dict:
+        """Probe every member now; unhealthy ones get an open circuit, healthy ones a closed one."""
+        status = {}
+        for member in self.members:
+            healthy = self._probe(member)
+            with self._lock:
+                if healthy:
+                    member.failures = 0
+                    member.open_until = 0.0
+                else:
+                    member.failures = max(member.failures, self.failure_threshold)
+                    member.open_until = self.clock() + self.cooldown
+            status[member.name] = healthy
+        return status
+
+    def _probe_loop(self, interval: float):
+        while not self._stop_probing.wait(interval):
+            try:
+                self.check_health()
+            except Exception:
+                logger.exception("Health probe failed")
+
+    def close(self):
+        self._stop_probing.set()
+
+    def stats(self) -> dict:
+        now = self.clock()
+        with self._lock:
+            return {
+                m.name: {
+                    "outstanding": m.outstanding,
+                    "served": m.served,
+                    "consecutive_failures": m.failures,
+                    "circuit_open": m.open_until > now,
+                }
+                for m in self.members
+            }
+
+    # ---------------------------
+    # Calls
+    # ---------------------------
+
+    def _route(self, method: str, prompt: str, **kwargs):
+        tried = set()
+        last_error = None
+        while True:
+            member = self._acquire(tried)
+            if member is None:
+                raise last_error or RuntimeError("No backend available")
+            tried.add(member.name)
+            try:
+                response = getattr(member.backend, method)(prompt, **kwargs)
+            except Exception as e:
+                if _is_client_error(e):
+                    self._release(member, ok=True)
+                    raise
+                self._release(member, ok=False)
+                logger.warning("%s failed on %s, failing over: %s", method, member.name, e)
+                last_error = e
+                continue
+            self._release(member, ok=True)
+            return response
+
+    async def _aroute(self, method: str, prompt: str, **kwargs):
+        tried = set()
+        last_error = None
+        while True:
+            # a half-open member's probe is a blocking call
+            member = await asyncio.to_thread(self._acquire, tried)
+            if member is None:
+                raise last_error or RuntimeError("No backend available")
+            tried.add(member.name)
+            try:
+                response = await getattr(member.backend, method)(prompt, **kwargs)
+            except Exception as e:
+                if _is_client_error(e):
+                    self._release(member, ok=True)
+                    raise
+                self._release(member, ok=False)
+                logger.warning("%s failed on %s, failing over: %s", method, member.name, e)
+                last_error = e
+                continue
+            self._release(member, ok=True)
+            return response
+
+    def chat(self, prompt: str) -> str:
+        return self._route("chat", prompt)
+
+    def generate(self, prompt: str) -> str:
+        return self._route("generate", prompt)
+
+    async def achat(self, prompt: str) -> str:
+        return await self._aroute("achat", prompt)
+
+    def chat_json(self, prompt: str, schema: Optional[dict] = None) -> str:
+        return self._route("chat_json", prompt, schema=schema)
+
+    async def achat_json(self, prompt: str, schema: Optional[dict] = None) -> str:
+        return await self._aroute("achat_json", prompt, schema=schema)
+
+    async def agenerate(self, prompt: str) -> str:
+        return await self._aroute("agenerate", prompt)
@@ -0,0 +1,189 @@
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from ai.backend.llm_cascade import CascadeBackend
+from ai.backend.llm_hf import HFBackend
+from ai.backend.llm_ollama import OllamaBackend
+from ai.backend.llm_router import RouterBackend
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_TUNING = ("host", "timeout", "keep_alive", "max_connections", "max_concurrency", "options")
+
+
+def _spec_dict(spec) -> dict:
+    if hasattr(spec, "model_dump"):
+        return spec.model_dump()
+    if hasattr(spec, "dict"):
+        return spec.dict()
+    return dict(spec)
+
+
+def build_backend(spec) -> Optional[Any]:
+    """
+    Construct the backend a BackendSpec describes, or None for an unknown provider.
+
+    spec may look like:
+      BackendSpec(provider="ollama", model="gemma3")
+      BackendSpec(provider="hf", model="mistralai/Mistral-7B-Instruct-v0.2")
+      BackendSpec(provider="ollama", model="gemma3", hosts=["http://gpu1:11434", "http://gpu2:11434"])
+      BackendSpec(provider="ollama", model="gemma3:1b", escalate_to={"provider": "ollama", "model": "gemma3:27b"})
+    """
+    fields = _spec_dict(spec)
+    if fields.get("escalate_to"):
+        small = build_backend({k: v for k, v in fields.items() if k not in ("escalate_to", "min_confidence")})
+        large = build_backend(fields["escalate_to"])
+        if small is None or large is None:
+            return None
+        options = {"min_confidence": fields["min_confidence"]} if fields.get("min_confidence") is not None else {}
+        return CascadeBackend(small, large, **options)
+    p = str(fields.get("provider", "")).lower()
+    model = fields.get("model")
+    options = {"chunk_mode": fields["chunk_mode"]} if fields.get("chunk_mode") else {}
+    if p == "ollama":
+        options.update({k: fields[k] for k in OLLAMA_TUNING if fields.get(k) is not None})
+        if fields.get("hosts"):
+            options.pop("host", None)
+            return RouterBackend.from_hosts(
+                fields["hosts"], router_options=fields.get("router"), model=model or "gemma3", **options
+            )
+        return OllamaBackend(model=model or "gemma3", **options)
+    if p in ("hf", "huggingface"):
+        if fields.get("batch_size"):
+            options["batch_size"] = fields["batch_size"]
+        return HFBackend(model_name=model or "mistralai/Mistral-7B-Instruct-v0.2", **options)
+    return None
+
+
+class _Entry:
+    def __init__(self):
+        # serializes construction, so concurrent requests for a cold spec load it once
+        self.lock = threading.Lock()
+        self.backend = None
+        self.memory_bytes = 0
+        self.last_used = 0.0
+        self.pinned = False
+
+
+class BackendRegistry:
+    """
+    Process-wide pool of warm backend instances keyed by BackendSpec.
+
+    Backends are created on first use and reused afterwards. Instances idle
+    for longer than `idle_ttl` seconds are dropped (preloaded ones are
+    pinned), and when loaded local models exceed `memory_budget_bytes` the
+    least recently used ones are dropped first. Requests still holding a
+    dropped backend keep using it; the memory is released when they finish.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[Any], Any] = build_backend,
+        idle_ttl: Optional[float] = 900.0,
+        memory_budget_bytes: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.factory = factory
+        self.idle_ttl = idle_ttl
+        self.memory_budget_bytes = memory_budget_bytes
+        self.clock = clock
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    def key(self, spec) -> str:
+        return json.dumps(_spec_dict(spec), sort_keys=True, default=str)
+
+    def get(self, spec, pin: bool = False):
+        """Warm backend for `spec`, creating it if needed. Factory errors propagate and nothing is cached."""
+        key = self.key(spec)
+        self.evict_idle()
+        with self._lock:
+            entry = self._entries.setdefault(key, _Entry())
+
+        with entry.lock:
+            if entry.backend is None:
+                started = self.clock()
+                backend = self.factory(spec)
+                if backend is None:
+                    with self._lock:
+                        self._entries.pop(key, None)
+                    return None
+                entry.backend = backend
+                entry.memory_bytes = _memory_footprint(backend)
+                self.created += 1
+                logger.info("Loaded backend %s in %.1fs", key, self.clock() - started)
+            else:
+                self.reused += 1
+            entry.last_used = self.clock()
+            entry.pinned = entry.pinned or pin
+            backend = entry.backend
+
+        self._enforce_memory_budget(keep=key)
+        return backend
+
+    def preload(self, specs: Iterable) -> None:
+        """Load and pin backends ahead of the first request (e.g. at API startup)."""
+        for spec in specs:
+            try:
+                self.get(spec, pin=True)
+            except Exception as e:
+                logger.exception("Failed to preload backend %s: %s", self.key(spec), e)
+
+    def evict_idle(self) -> None:
+        if self.idle_ttl is None:
+            return
+        now = self.clock()
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.backend is not None and not entry.pinned and now - entry.last_used > self.idle_ttl:
+                    self._drop(key)
+
+    def _enforce_memory_budget(self, keep: str) -> None:
+        if self.memory_budget_bytes is None:
+            return
+        with self._lock:
+            loaded = [(e.last_used, k) for k, e in self._entries.items() if e.backend is not None and e.memory_bytes]
+            total = sum(self._entries[k].memory_bytes for _, k in loaded)
+            for _, key in sorted(loaded):
+                if total <= self.memory_budget_bytes:
+                    break
+                if key == keep:
+                    continue
+                total -= self._entries[key].memory_bytes
+                self._drop(key)
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        # e.g. stops a RouterBackend's health probe thread; in-flight calls are unaffected
+        close = getattr(entry.backend, "close", None) if entry else None
+        if close is not None:
+            close()
+        self.evicted += 1
+        logger.info("Evicted backend %s", key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            loaded = [e for e in self._entries.values() if e.backend is not None]
+            return {
+                "loaded": len(loaded),
+                "memory_bytes": sum(e.memory_bytes for e in loaded),
+                "created": self.created,
+                "reused": self.reused,
+                "evicted": self.evicted,
+            }
+
+
+def _memory_footprint(backend) -> int:
+    measure = getattr(backend, "memory_footprint", None)
+    if measure is None:
+        return 0
+    try:
+        return int(measure())
+    except Exception:
+        return 0
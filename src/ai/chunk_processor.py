@@ -1,51 +1,308 @@
-import json
+import asyncio
+import logging
 import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import Callable, List, Optional
 from ai.backend.llm_ollama import OllamaBackend
+from ai.json_repair import ParseStats, extract_json, parse_json_response
 from ai.schema import ChunkResult
+from document_processing.chunker import estimate_tokens
+
+# "split": one summary call and one key-info call per chunk (chunk_summary.txt + chunk_keyinfo.txt)
+# "combined": a single call returning summary, topics and key info as one JSON object (chunk_combined.txt)
+CHUNK_MODES = ("split", "combined")
+KEY_INFO_FIELDS = ("entities", "facts", "numbers", "actions", "misc")
+# JSON Schemas passed to backends with a native JSON mode
+KEY_INFO_SCHEMA = {
+    "type": "object",
+    "properties": {field: {"type": "array", "items": {"type": "string"}} for field in KEY_INFO_FIELDS},
+}
+CHUNK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "topics": {"type": "array", "items": {"type": "string"}},
+        **KEY_INFO_SCHEMA["properties"],
+    },
+    "required": ["summary"],
+}
+# chunk_keyinfo.txt's answer for a chunk with nothing worth extracting
+NO_KEY_INFO = "NO KEY INFORMATION"
+
+logger = logging.getLogger(__name__)
 
 
 class ChunkProcessor:
-    def __init__(self, backend=None):
+    def __init__(self, backend=None, mode=None, max_json_retries=1):
+        """max_json_retries: extra calls for a JSON answer that local repair can't recover"""
         self.llm = backend or OllamaBackend(model="gemma3")
+        self.max_json_retries = max_json_retries
+        self.parse_stats = ParseStats()
+        self.mode = mode or getattr(self.llm, "chunk_mode", "split")
+        if self.mode not in CHUNK_MODES:
+            raise ValueError(f"Unknown chunk mode: {self.mode}")
 
         base = Path(__file__).parent / "prompts"
         self.summary_template = (base / "chunk_summary.txt").read_text()
         self.keyinfo_template = (base / "chunk_keyinfo.txt").read_text()
+        self.combined_template = (base / "chunk_combined.txt").read_text()
+
+    @property
+    def templates(self) -> List[str]:
+        if self.mode == "combined":
+            return [self.combined_template]
+        return [self.summary_template, self.keyinfo_template]
+
+    @property
+    def schemas(self) -> List[Optional[dict]]:
+        """JSON Schema of each template's answer, parallel to `templates`; None for free text."""
+        if self.mode == "combined":
+            return [CHUNK_SCHEMA]
+        return [None, KEY_INFO_SCHEMA]
+
+    @property
+    def calls_per_chunk(self) -> int:
+        return len(self.templates)
+
+    @property
+    def prompt_tokens(self) -> int:
+        """Template tokens sent along with every chunk, across all calls for that chunk."""
+        return sum(estimate_tokens(self.fill(t, "")) for t in self.templates)
 
     def fill(self, template: str, chunk: str) -> str:
         return template.replace("{{chunk_text}}", chunk)
 
     def _parse_json_if_possible(self, text: str):
-        cleaned = self.safe_parse_llm_output(text)
-        try:
-            return json.loads(cleaned)
-        except Exception:
-            return None
+        return extract_json(text)
 
-    def process_chunk(self, chunk_text: str, chunk_id: int) -> ChunkResult:
-        summary_prompt = self.fill(self.summary_template, chunk_text)
-        key_prompt = self.fill(self.keyinfo_template, chunk_text)
+    def _json_ok(self, output: str) -> bool:
+        return output.strip() == NO_KEY_INFO or isinstance(extract_json(output), dict)
 
+    def _ask(self, prompt: str, schema: Optional[dict], output: Optional[str] = None) -> str:
+        """
+        One prompt's answer; JSON answers that can't be repaired are re-asked up to max_json_retries times.
+        `output` is an answer already obtained (e.g. from a batch) to use as the first attempt.
+        """
+        if output is None:
+            output = self.llm.chat(prompt) if schema is None else self.llm.chat_json(prompt, schema)
+        if schema is None:
+            return output
+        for _ in range(self.max_json_retries):
+            if self._json_ok(output):
+                break
+            self.parse_stats.add("retried")
+            output = self.llm.chat_json(prompt, schema)
+        return output
+
+    async def _aask(self, prompt: str, schema: Optional[dict], output: Optional[str] = None) -> str:
+        if output is None:
+            output = await (self.llm.achat(prompt) if schema is None else self.llm.achat_json(prompt, schema))
+        if schema is None:
+            return output
+        for _ in range(self.max_json_retries):
+            if self._json_ok(output):
+                break
+            self.parse_stats.add("retried")
+            output = await self.llm.achat_json(prompt, schema)
+        return output
+
+    def low_information_result(self, chunk_text: str, chunk_id: int, noise_score: float = 1.0) -> ChunkResult:
+        """Synthetic result for a chunk the prefilter judged to be noise; no LLM call is made."""
+        return ChunkResult(
+            chunk_id=chunk_id,
+            text=chunk_text,
+            summary="LOW INFORMATION CONTENT",
+            key_info={"low_information": True, "noise_score": noise_score},
+            topics=[],
+        )
+
+    def error_result(self, chunk_text: str, chunk_id: int, error: Exception) -> ChunkResult:
+        """Placeholder result for a chunk whose analysis raised, so one failure doesn't sink the document."""
+        return ChunkResult(
+            chunk_id=chunk_id,
+            text=chunk_text,
+            summary="",
+            key_info={"error": "CHUNK_FAILED", "detail": f"{type(error).__name__}: {error}"},
+            topics=[],
+        )
+
+    def skipped_result(self, chunk_text: str, chunk_id: int, reason: str = "early_exit") -> ChunkResult:
+        """Placeholder for a chunk deliberately left unanalyzed (early exit, sampling)."""
+        return ChunkResult(
+            chunk_id=chunk_id, text=chunk_text, summary="", key_info={"skipped": True, "reason": reason}, topics=[]
+        )
+
+    def build_prompts(self, chunk_text: str) -> List[str]:
+        """Prompts to send for one chunk, in the order `build_result` expects their outputs."""
+        return [self.fill(t, chunk_text) for t in self.templates]
+
+    def process_chunk(self, chunk_text: str, chunk_id: int) -> ChunkResult:
         # Get raw outputs
-        summary_raw = self.llm.chat(summary_prompt)
-        key_info_raw = self.llm.chat(key_prompt)
+        prompts = self.build_prompts(chunk_text)
+        outputs = [self._ask(prompt, schema) for prompt, schema in zip(prompts, self.schemas)]
+        return self.build_result(chunk_text, chunk_id, outputs)
 
-        # Parse key info into structured dict if possible
-        key_info_clean = self.safe_parse_llm_output(key_info_raw)
+    async def aprocess_chunk(self, chunk_text: str, chunk_id: int) -> ChunkResult:
+        prompts = self.build_prompts(chunk_text)
+        outputs = [await self._aask(prompt, schema) for prompt, schema in zip(prompts, self.schemas)]
+        return self.build_result(chunk_text, chunk_id, outputs)
+
+    def process_batch(self, chunks: List[dict]) -> List[ChunkResult]:
+        """Analyze several chunks with one `chat_batch` call covering all their prompts."""
+        prompts = [p for c in chunks for p in self.build_prompts(c["text"])]
+        schemas = self.schemas * len(chunks)
+        outputs = self.llm.chat_batch(prompts, schemas=schemas)
+        # the batch answer is the first attempt; only unrecoverable JSON is re-asked
+        outputs = [self._ask(p, s, o) for p, s, o in zip(prompts, schemas, outputs)]
+        return self._split_batch(chunks, outputs)
+
+    async def aprocess_batch(self, chunks: List[dict]) -> List[ChunkResult]:
+        prompts = [p for c in chunks for p in self.build_prompts(c["text"])]
+        schemas = self.schemas * len(chunks)
+        outputs = await self.llm.achat_batch(prompts, schemas=schemas)
+        outputs = [await self._aask(p, s, o) for p, s, o in zip(prompts, schemas, outputs)]
+        return self._split_batch(chunks, outputs)
+
+    def _split_batch(self, chunks: List[dict], outputs: List[str]) -> List[ChunkResult]:
+        n = self.calls_per_chunk
+        return [self.build_result(c["text"], c["chunk_id"], outputs[i * n : (i + 1) * n]) for i, c in enumerate(chunks)]
+
+    def _batches(self, chunks: List[dict], batch_size: Optional[int]) -> List[List[dict]]:
+        """Group chunks for `chat_batch`; with batching off every chunk is its own group."""
+        size = max(1, batch_size or getattr(self.llm, "batch_size", 1))
+        return [chunks[i : i + size] for i in range(0, len(chunks), size)]
+
+    def _process_chunk_safely(self, chunk: dict) -> ChunkResult:
         try:
-            key_info = json.loads(key_info_clean)
-        except json.JSONDecodeError:
-            key_info = {"error": "INVALID_JSON", "raw": key_info_clean}
+            return self.process_chunk(chunk["text"], chunk["chunk_id"])
+        except Exception as e:
+            logger.warning("Chunk %s failed: %s", chunk["chunk_id"], e)
+            return self.error_result(chunk["text"], chunk["chunk_id"], e)
 
-        # Try to parse summary if it is a JSON blob (some LLMs may return structured summaries)
-        summary_parsed = self._parse_json_if_possible(summary_raw)
-        if isinstance(summary_parsed, dict):
-            summary_text = summary_parsed.get("summary", str(summary_parsed))
-            summary_topics = summary_parsed.get("topics", [])
+    async def _aprocess_chunk_safely(self, chunk: dict) -> ChunkResult:
+        try:
+            return await self.aprocess_chunk(chunk["text"], chunk["chunk_id"])
+        except Exception as e:
+            logger.warning("Chunk %s failed: %s", chunk["chunk_id"], e)
+            return self.error_result(chunk["text"], chunk["chunk_id"], e)
+
+    def _process_batch_safely(self, batch: List[dict], batched: bool) -> List[ChunkResult]:
+        if not batched:
+            return [self._process_chunk_safely(batch[0])]
+        try:
+            return self.process_batch(batch)
+        except Exception as e:
+            # retry one by one so a single bad chunk only costs its own result
+            logger.warning("Batch of %d chunks failed, retrying individually: %s", len(batch), e)
+            return [self._process_chunk_safely(c) for c in batch]
+
+    async def _aprocess_batch_safely(self, batch: List[dict], batched: bool) -> List[ChunkResult]:
+        if not batched:
+            return [await self._aprocess_chunk_safely(batch[0])]
+        try:
+            return await self.aprocess_batch(batch)
+        except Exception as e:
+            logger.warning("Batch of %d chunks failed, retrying individually: %s", len(batch), e)
+            return [await self._aprocess_chunk_safely(c) for c in batch]
+
+    def process_chunks(
+        self,
+        chunks: List[dict],
+        max_in_flight: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        on_result: Optional[Callable[[ChunkResult], None]] = None,
+        should_stop: Optional[Callable[[], bool]] = None,
+    ) -> List[ChunkResult]:
+        """
+        Analyze many chunks concurrently.
+
+        Chunks are grouped into batches of `batch_size` (default: the
+        backend's batch_size) sent through one `chat_batch` call each, and at
+        most `max_in_flight` batches (default: the backend's max_concurrency)
+        are being processed at once. Results come back in input order, and a
+        chunk that raises yields an error_result instead of aborting the rest.
+
+        `on_result` is called with each result as it completes (always from
+        the calling thread). Once `should_stop` returns True no new batches
+        are started; in-flight ones finish and the rest get a skipped_result.
+        """
+        limit = max(1, max_in_flight or getattr(self.llm, "max_concurrency", 1))
+        batches = self._batches(chunks, batch_size)
+        batched = any(len(b) > 1 for b in batches)
+        results: List[Optional[List[ChunkResult]]] = [None] * len(batches)
+
+        def stopped():
+            return should_stop is not None and should_stop()
+
+        def finish(index, batch_results):
+            results[index] = batch_results
+            if on_result is not None:
+                for r in batch_results:
+                    on_result(r)
+
+        if limit == 1:
+            for index, batch in enumerate(batches):
+                if stopped():
+                    break
+                finish(index, self._process_batch_safely(batch, batched))
+            return self._fill_skipped(batches, results)
+
+        with ThreadPoolExecutor(max_workers=limit) as pool:
+            pending = {}
+            next_index = 0
+            while pending or (next_index < len(batches) and not stopped()):
+                while next_index < len(batches) and len(pending) < limit and not stopped():
+                    pending[pool.submit(self._process_batch_safely, batches[next_index], batched)] = next_index
+                    next_index += 1
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(pending.pop(future), future.result())
+        return self._fill_skipped(batches, results)
+
+    async def aprocess_chunks(
+        self,
+        chunks: List[dict],
+        max_in_flight: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        on_result: Optional[Callable[[ChunkResult], None]] = None,
+        should_stop: Optional[Callable[[], bool]] = None,
+    ) -> List[ChunkResult]:
+        """Async counterpart of `process_chunks` with the same batching, ordering, failure isolation and hooks."""
+        limit = asyncio.Semaphore(max(1, max_in_flight or getattr(self.llm, "max_concurrency", 1)))
+
+        batches = self._batches(chunks, batch_size)
+        batched = any(len(b) > 1 for b in batches)
+        results: List[Optional[List[ChunkResult]]] = [None] * len(batches)
+
+        async def run(index, batch):
+            async with limit:
+                if should_stop is not None and should_stop():
+                    return
+                results[index] = await self._aprocess_batch_safely(batch, batched)
+                if on_result is not None:
+                    for r in results[index]:
+                        on_result(r)
+
+        await asyncio.gather(*(run(i, b) for i, b in enumerate(batches)))
+        return self._fill_skipped(batches, results)
+
+    def _fill_skipped(self, batches: List[List[dict]], results: list) -> List[ChunkResult]:
+        out = []
+        for batch, batch_results in zip(batches, results):
+            if batch_results is None:
+                batch_results = [self.skipped_result(c["text"], c["chunk_id"]) for c in batch]
+            out.extend(batch_results)
+        return out
+
+    def build_result(self, chunk_text: str, chunk_id: int, outputs: List[str]) -> ChunkResult:
+        """Turn the raw LLM outputs for a chunk's prompts into a ChunkResult."""
+        if self.mode == "combined":
+            summary_text, summary_topics, key_info = self._parse_combined(outputs[0])
         else:
-            summary_text = summary_raw
-            summary_topics = []
+            summary_text, summary_topics, key_info = self._parse_split(*outputs)
 
         # Build topics list from key_info 'entities' and summary topics
         topics = []
@@ -67,6 +324,35 @@ class ChunkProcessor:
 
         return ChunkResult(chunk_id=chunk_id, text=chunk_text, summary=summary_text, key_info=key_info, topics=topics)
 
+    def _parse_split(self, summary_raw: str, key_info_raw: str):
+        # Parse key info into structured dict if possible
+        key_info_clean = self.safe_parse_llm_output(key_info_raw)
+        if key_info_clean == NO_KEY_INFO:
+            key_info = {}
+        else:
+            key_info = parse_json_response(key_info_raw, self.parse_stats)
+            if key_info is None:
+                key_info = {"error": "INVALID_JSON", "raw": key_info_clean}
+
+        # Try to parse summary if it is a JSON blob (some LLMs may return structured summaries)
+        summary_parsed = self._parse_json_if_possible(summary_raw)
+        if isinstance(summary_parsed, dict):
+            summary_text = summary_parsed.get("summary", str(summary_parsed))
+            summary_topics = summary_parsed.get("topics", [])
+        else:
+            summary_text = summary_raw
+            summary_topics = []
+        return summary_text, summary_topics, key_info
+
+    def _parse_combined(self, raw: str):
+        parsed = parse_json_response(raw, self.parse_stats)
+        if not isinstance(parsed, dict):
+            return raw, [], {"error": "INVALID_JSON", "raw": self.safe_parse_llm_output(raw)}
+        # accept key info either flat or nested under "key_info"
+        source = parsed.get("key_info") if isinstance(parsed.get("key_info"), dict) else parsed
+        key_info = {field: source.get(field, []) for field in KEY_INFO_FIELDS}
+        return str(parsed.get("summary", "")), parsed.get("topics", []), key_info
+
     def safe_parse_llm_output(self, text):
         # 0. Remove ```json ... ``` wrappers if present
         cleaned = re.sub(r"```json\s*|\s*```", "", text, flags=re.IGNORECASE)
@@ -0,0 +1,81 @@
+import json
+from typing import Iterable, List
+
+from document_processing.chunker import estimate_tokens
+
+# Shrinks chunk key info before it goes into the document-level combine prompt:
+# overlapping and duplicated chunks repeat the same entities and facts, and
+# failed or noise chunks carry payloads the model can't use.
+
+LOW_INFORMATION_SUMMARY = "LOW INFORMATION CONTENT"
+
+
+def is_usable(key_info) -> bool:
+    """False for missing key info and the error / low-information / skipped placeholders."""
+    return (
+        isinstance(key_info, dict)
+        and "error" not in key_info
+        and not key_info.get("low_information")
+        and not key_info.get("skipped")
+    )
+
+
+def _norm(value) -> str:
+    text = value if isinstance(value, str) else json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return " ".join(text.split()).casefold()
+
+
+def merge_key_info(key_infos: Iterable) -> dict:
+    """
+    Merge key info dicts into one, deduplicating every list field.
+
+    Values are compared case- and whitespace-insensitively and keep the
+    first spelling seen; field order follows first appearance. Error and
+    low-information payloads are dropped, as are empty fields.
+    """
+    merged = {}
+    seen = {}
+    for key_info in key_infos:
+        if not is_usable(key_info):
+            continue
+        for field, values in key_info.items():
+            if not isinstance(values, list):
+                values = [values]
+            bucket = merged.setdefault(field, [])
+            keys = seen.setdefault(field, set())
+            for value in values:
+                if value in (None, "", [], {}):
+                    continue
+                k = _norm(value)
+                if k not in keys:
+                    keys.add(k)
+                    bucket.append(value)
+    return {field: values for field, values in merged.items() if values}
+
+
+def compact_summaries(summaries: Iterable[str]) -> List[str]:
+    """Non-empty summaries in order, without exact repeats or low-information placeholders."""
+    out = []
+    seen = set()
+    for summary in summaries:
+        summary = (summary or "").strip()
+        if not summary or summary == LOW_INFORMATION_SUMMARY or summary in seen:
+            continue
+        seen.add(summary)
+        out.append(summary)
+    return out
+
+
+def compact_json(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def compaction_report(key_infos: list) -> dict:
+    """Token estimate of the key info block before (pretty-printed, per chunk) and after compaction."""
+    raw = estimate_tokens(json.dumps(key_infos, indent=2))
+    compact = estimate_tokens(compact_json(merge_key_info(key_infos)))
+    return {
+        "key_info_tokens_raw": raw,
+        "key_info_tokens_compact": compact,
+        "key_info_tokens_saved": raw - compact,
+    }
@@ -1,9 +1,27 @@
+import hashlib
+import json
 import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ai.embeddings import default_embedder, max_similarity
+from document_processing.lexical import PhraseMatcher, tokenize
+
+# Numeric tuning knobs that may be set in context.md; parsed as floats.
+FLOAT_KEYS = ("noise_threshold", "early_exit_confidence", "topic_similarity")
 
 
 class ContextLoader:
-    def __init__(self, path="context.md"):
+    """
+    Reads context.md through a process-wide cache: file contents are re-read
+    only when the file's mtime or size changes, and rules are parsed once per
+    distinct content. `text` supplies the context directly, without a file.
+    """
+
+    def __init__(self, path="context.md", text=None):
         self.path = path
+        self.text = text
 
     def load(self):
         """Return the raw content of context.md as a string.
@@ -11,10 +29,9 @@ class ContextLoader:
         This method preserves the existing behavior used by DocumentReasoner
         (for injecting context notes into prompts).
         """
-        if os.path.exists(self.path):
-            with open(self.path, "r", encoding="utf-8") as f:
-                return f.read().strip()
-        return ""
+        if self.text is not None:
+            return self.text.strip()
+        return _read_context_file(self.path)
 
     def load_parsed(self):
         """Parse the context.md contents and return a dictionary of rules.
@@ -24,54 +41,250 @@ class ContextLoader:
           - focus: comma separated topics -> mapped to priority_topics
           - ignore: comma separated topics -> mapped to ignore_topics
           - custom_priority: comma separated list -> mapped to priority_topics
+          - noise_threshold: 0.0-1.0, chunks scoring at least this noisy skip the LLM
+          - early_exit_confidence: 0.0-1.0, enables progressive mode; chunk analysis stops
+            once the recommendation is stable at this confidence
+          - topic_similarity: 0.0-1.0, embedding similarity at which a document topic
+            matches a context topic (default: the embedder's own threshold)
 
-        The returned dict is suitable to pass into DecisionEngine.
+        The returned dict is suitable to pass into DecisionEngine. It is shared
+        with other callers and read-only (FrozenRules); copy it with dict() to modify.
         """
-        raw = self.load()
-        if not raw:
-            return {}
-
-        parsed = {"priority_topics": [], "ignore_topics": [], "raw": raw}
-        for ln in raw.splitlines():
-            ln = ln.strip()
-            if not ln or ln.startswith("#"):
-                continue
-            if "=" not in ln:
+        return parsed_rules(self.load())
+
+
+class FrozenRules(dict):
+    """Read-only dict of parsed context rules; lists inside are read-only too."""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("parsed context rules are shared and read-only; copy them with dict() first")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (FrozenRules, (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class _FrozenList(list):
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("parsed context rules are shared and read-only; copy them with list() first")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+
+    def __reduce__(self):
+        return (_FrozenList, (list(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def parse_context(raw: str) -> dict:
+    """Parse context.md text into a dict of rules (see ContextLoader.load_parsed)."""
+    if not raw:
+        return {}
+
+    parsed = {"priority_topics": [], "ignore_topics": [], "raw": raw}
+    for ln in raw.splitlines():
+        ln = ln.strip()
+        if not ln or ln.startswith("#"):
+            continue
+        if "=" not in ln:
+            continue
+        k, v = ln.split("=", 1)
+        k = k.strip().lower()
+        v = v.strip()
+        if k == "sensitivity":
+            # Accept numeric or descriptive sensitivity
+            try:
+                parsed["sensitivity"] = float(v)
+            except ValueError:
+                v_lower = v.lower()
+                if v_lower in ("high", "h", "1", "0.8"):
+                    parsed["sensitivity"] = 0.8
+                elif v_lower in ("medium", "med", "m"):
+                    parsed["sensitivity"] = 0.5
+                elif v_lower in ("low", "l"):
+                    parsed["sensitivity"] = 0.3
+                else:
+                    parsed["sensitivity"] = 0.5
+        elif k in ("focus", "priority", "priority_topics"):
+            topics = [t.strip() for t in v.split(",") if t.strip()]
+            parsed["priority_topics"].extend(topics)
+        elif k in ("ignore", "ignore_topics"):
+            topics = [t.strip() for t in v.split(",") if t.strip()]
+            parsed["ignore_topics"].extend(topics)
+        elif k in ("custom_priority",):
+            topics = [t.strip() for t in v.split(",") if t.strip()]
+            parsed["priority_topics"].extend(topics)
+        elif k in FLOAT_KEYS:
+            try:
+                parsed[k] = float(v)
+            except ValueError:
+                pass
+        else:
+            # generic passthrough
+            parsed[k] = v
+
+    # normalize unique lists
+    parsed["priority_topics"] = list({t for t in parsed.get("priority_topics", [])})
+    parsed["ignore_topics"] = list({t for t in parsed.get("ignore_topics", [])})
+    # ensure numeric sensitivity
+    if "sensitivity" not in parsed:
+        parsed["sensitivity"] = 0.5
+    return parsed
+
+
+# context files (path -> (mtime/size stamp, content)) and parsed
+# rules (content hash -> FrozenRules), shared by every ContextLoader in the process
+CONTEXT_CACHE_SIZE = 256
+_files: "OrderedDict[str, tuple]" = OrderedDict()
+_parsed: "OrderedDict[str, FrozenRules]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _remember(cache: OrderedDict, key, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > CONTEXT_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def _read_context_file(path: str) -> str:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return ""
+    key = os.path.abspath(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        cached = _files.get(key)
+        if cached is not None and cached[0] == stamp:
+            _files.move_to_end(key)
+            return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        raw = f.read().strip()
+    with _cache_lock:
+        _remember(_files, key, (stamp, raw))
+    return raw
+
+
+def _content_hash(raw: str) -> str:
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def parsed_rules(raw: str) -> FrozenRules:
+    """Read-only parsed rules for context text, parsed once per distinct content."""
+    key = _content_hash(raw)
+    with _cache_lock:
+        rules = _parsed.get(key)
+        if rules is not None:
+            _parsed.move_to_end(key)
+            return rules
+    parsed = parse_context(raw)
+    rules = FrozenRules({k: _FrozenList(v) if isinstance(v, list) else v for k, v in parsed.items()})
+    with _cache_lock:
+        _remember(_parsed, key, rules)
+    return rules
+
+
+class ContextRules:
+    """
+    Compiled form of the rules from ContextLoader.load_parsed(), built once per context.
+
+    A document topic matches a context topic when it contains it as a phrase
+    of stemmed words ("Legal Risks" matches "risk") or when their embeddings
+    are at least `similarity_threshold` apart in cosine similarity
+    ("invoices" matches "invoice"). Context topic vectors are computed once
+    here; document topics are embedded and compared in one matrix product per
+    call, and each distinct topic is classified once and remembered.
+    """
+
+    # remembered topic classifications before the memo starts over
+    MEMO_SIZE = 50000
+
+    def __init__(self, rules: Optional[dict] = None, embedder=None):
+        self.rules = dict(rules or {})
+        self.priority_topics = tuple(self.rules.get("priority_topics", []))
+        self.ignore_topics = tuple(self.rules.get("ignore_topics", []))
+        self.sensitivity = self.rules.get("sensitivity", 0.5)
+        self.embedder = embedder or default_embedder()
+        self.similarity_threshold = self.rules.get("topic_similarity", self.embedder.match_threshold)
+        self._priority = PhraseMatcher(tuple(tokenize(t)) for t in self.priority_topics)
+        self._ignore = PhraseMatcher(tuple(tokenize(t)) for t in self.ignore_topics)
+        self._priority_vectors = self.embedder.embed(self.priority_topics)
+        self._ignore_vectors = self.embedder.embed(self.ignore_topics)
+        self._memo: Dict[str, Tuple[bool, bool]] = {}
+
+    def classify_many(self, topics: Iterable[str]) -> Dict[str, Tuple[bool, bool]]:
+        """{topic: (matches a priority topic, matches an ignored topic)} for each distinct topic."""
+        memo = self._memo
+        hits = {t: memo.get(t) for t in dict.fromkeys(topics)}
+        new = [t for t, hit in hits.items() if hit is None]
+        if new:
+            vectors = self.embedder.embed(new)
+            priority = max_similarity(vectors, self._priority_vectors) >= self.similarity_threshold
+            ignored = max_similarity(vectors, self._ignore_vectors) >= self.similarity_threshold
+            if len(memo) + len(new) > self.MEMO_SIZE:
+                memo = self._memo = {}
+            for topic, p, i in zip(new, priority.tolist(), ignored.tolist()):
+                tokens = tokenize(topic)
+                hit = (p or self._priority.matches(tokens), i or self._ignore.matches(tokens))
+                hits[topic] = memo[topic] = hit
+        return hits
+
+    def classify(self, topic: str) -> Tuple[bool, bool]:
+        return self.classify_many([topic])[topic]
+
+    def read_worthiness(self, topics: Iterable[str]) -> float:
+        return self.read_worthiness_many([topics])[0]
+
+    def read_worthiness_many(self, topic_sets: Iterable[Iterable[str]]) -> List[float]:
+        """
+        Per topic set: share of topics matching a priority topic, weighted by
+        sensitivity, minus 0.3 per ignored topic; clamped to 0..1. All distinct
+        topics across the sets are classified together.
+        """
+        topic_sets = [list(topics) for topics in topic_sets]
+        hits = self.classify_many(t for topics in topic_sets for t in topics)
+        scores = []
+        for topics in topic_sets:
+            if not topics:
+                scores.append(0.0)
                 continue
-            k, v = ln.split("=", 1)
-            k = k.strip().lower()
-            v = v.strip()
-            if k == "sensitivity":
-                # Accept numeric or descriptive sensitivity
-                try:
-                    parsed["sensitivity"] = float(v)
-                except ValueError:
-                    v_lower = v.lower()
-                    if v_lower in ("high", "h", "1", "0.8"):
-                        parsed["sensitivity"] = 0.8
-                    elif v_lower in ("medium", "med", "m"):
-                        parsed["sensitivity"] = 0.5
-                    elif v_lower in ("low", "l"):
-                        parsed["sensitivity"] = 0.3
-                    else:
-                        parsed["sensitivity"] = 0.5
-            elif k in ("focus", "priority", "priority_topics"):
-                topics = [t.strip() for t in v.split(",") if t.strip()]
-                parsed["priority_topics"].extend(topics)
-            elif k in ("ignore", "ignore_topics"):
-                topics = [t.strip() for t in v.split(",") if t.strip()]
-                parsed["ignore_topics"].extend(topics)
-            elif k in ("custom_priority",):
-                topics = [t.strip() for t in v.split(",") if t.strip()]
-                parsed["priority_topics"].extend(topics)
-            else:
-                # generic passthrough
-                parsed[k] = v
-
-        # normalize unique lists
-        parsed["priority_topics"] = list({t for t in parsed.get("priority_topics", [])})
-        parsed["ignore_topics"] = list({t for t in parsed.get("ignore_topics", [])})
-        # ensure numeric sensitivity
-        if "sensitivity" not in parsed:
-            parsed["sensitivity"] = 0.5
-        return parsed
+            base = sum(1 for t in topics if hits[t][0]) / len(topics)
+            score = base * (0.5 + self.sensitivity) - 0.3 * sum(1 for t in topics if hits[t][1])
+            scores.append(max(0.0, min(score, 1.0)))
+        return scores
+
+
+_compiled: "OrderedDict[str, ContextRules]" = OrderedDict()
+_compiled_lock = threading.Lock()
+# contexts kept compiled; one per distinct context.md in use
+COMPILED_CACHE_SIZE = 32
+
+
+def compile_rules(rules: Optional[dict]) -> ContextRules:
+    """ContextRules for `rules`, reusing the compiled instance for identical rules."""
+    key = json.dumps(rules or {}, sort_keys=True, default=str)
+    with _compiled_lock:
+        compiled = _compiled.get(key)
+        if compiled is not None:
+            _compiled.move_to_end(key)
+            return compiled
+    compiled = ContextRules(rules)
+    with _compiled_lock:
+        _compiled[key] = compiled
+        while len(_compiled) > COMPILED_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return compiled
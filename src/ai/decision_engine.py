@@ -1,7 +1,21 @@
+from ai.context_loader import ContextRules, compile_rules
+from document_processing.lexical import any_of, topic_strengths
+
+# Score boundaries between recommendations (see final_recommendation).
+FULL_READ_THRESHOLD = 0.65
+KEY_INFO_THRESHOLD = 0.30
+# Progressive mode: stop issuing chunk calls once confidence in the recommendation reaches this.
+DEFAULT_EARLY_EXIT_CONFIDENCE = 0.8
+# Confidence lost when early exit skips every chunk (scaled by the share skipped).
+MAX_EARLY_EXIT_PENALTY = 0.3
+# Score lost when ignored topics are present (lexical_triage scales it by their strength).
+IGNORE_PENALTY = 0.3
+
+
 class DecisionEngine:
     def __init__(self, context_rules=None):
         """
-        context_rules: output of context.md parser
+        context_rules: output of context.md parser, or ContextRules compiled from it
         Example:
         {
             "priority_topics": [...],
@@ -9,7 +23,12 @@ class DecisionEngine:
             "sensitivity": 0.7
         }
         """
-        self.context = context_rules or {}
+        if isinstance(context_rules, ContextRules):
+            self.rules = context_rules
+            self.context = context_rules.rules
+        else:
+            self.context = context_rules or {}
+            self.rules = compile_rules(self.context)
 
     def combine_responses(self, chunk_summaries, metadata):
         """
@@ -28,41 +47,19 @@ class DecisionEngine:
         """Produces a score 0.0–1.0 indicating how valuable the document is.
 
         Implementation notes:
-        - If any priority topics are present, increase score.
+        - base score = fraction of topics that match priority_topics (stemmed phrases or
+          similar embeddings, see ContextRules).
         - Use sensitivity from context to boost or dampen the effective score.
-        - For the simple heuristic: base score = fraction of topics that match priority_topics.
+        - Each ignored topic present reduces the score.
         """
-        """
-        Produces a score 0.0–1.0 indicating how valuable the document is.
+        return self.rules.read_worthiness(combined["combined_topics"])
 
-        You will refine the scoring algorithm later.
+    def score_topic_sets(self, topic_sets):
         """
-        topics = combined["combined_topics"]
-        sensitivity = self.context.get("sensitivity", 0.5)
-
-        score = 0.0
-
-        # If there are no topics identified, default to a low score
-        if not topics:
-            base = 0.0
-        else:
-            # compute fraction of topics that are priority topics
-            priority = [x.lower() for x in self.context.get("priority_topics", [])]
-            ignored = [x.lower() for x in self.context.get("ignore_topics", [])]
-            match_count = sum(1 for t in topics if t.lower() in priority)
-            base = match_count / max(1, len(topics))
-
-        # Use sensitivity to increase weight of matched topics
-        score = base * (0.5 + sensitivity)
-
-        # Reduce score if ignored topics present
-        for t in topics:
-            if t.lower() in ignored:
-                score -= 0.3
-
-        # Clamp
-        score = max(0.0, min(score, 1.0))
-        return score
+        compute_read_worthiness for many documents at once, e.g. to re-score a
+        backlog after context.md changes. All topics are embedded and compared in one pass.
+        """
+        return self.rules.read_worthiness_many(topic_sets)
 
     def compute_confidence(self, chunk_summaries, metadata):
         """
@@ -76,15 +73,47 @@ class DecisionEngine:
         if len(chunk_summaries) < 2:
             confidence -= 0.1  # small docs less reliable
 
+        # only part of a large document was analyzed
+        confidence -= metadata.get("sampling", {}).get("confidence_penalty", 0.0)
+        # progressive mode stopped before the last chunks
+        confidence -= metadata.get("early_exit", {}).get("confidence_penalty", 0.0)
+
         return max(0.0, min(confidence, 1.0))
 
     def final_recommendation(self, score):
-        if score > 0.65:
+        if score > FULL_READ_THRESHOLD:
             return "Full Read Recommended"
-        if score > 0.30:
+        if score > KEY_INFO_THRESHOLD:
             return "Key Info Enough"
         return "Not Relevant"
 
+    def lexical_triage(self, chunk_texts):
+        """
+        LLM-free score straight from the chunk text, for pre-filtering documents.
+
+        Mirrors compute_read_worthiness: the chance that any priority topic is
+        present (from BM25-style topic strengths) is weighted by sensitivity,
+        and ignored topics subtract up to IGNORE_PENALTY.
+        """
+        chunk_texts = list(chunk_texts)
+        priority = topic_strengths(chunk_texts, self.rules.priority_topics)
+        ignored = topic_strengths(chunk_texts, self.rules.ignore_topics)
+
+        score = any_of(priority.values()) * (0.5 + self.rules.sensitivity) - IGNORE_PENALTY * any_of(ignored.values())
+        score = max(0.0, min(score, 1.0))
+        return {
+            "score": score,
+            "recommendation": self.final_recommendation(score),
+            "priority_topics": priority,
+            "ignore_topics": ignored,
+        }
+
+    def progressive(self, metadata, total_chunks, confidence_threshold=None):
+        """Tracker that re-scores as chunk results arrive; see ProgressiveDecision."""
+        if confidence_threshold is None:
+            confidence_threshold = self.context.get("early_exit_confidence", DEFAULT_EARLY_EXIT_CONFIDENCE)
+        return ProgressiveDecision(self, metadata, total_chunks, confidence_threshold)
+
     # ---------------------------
     # Internals
     # ---------------------------
@@ -96,4 +125,89 @@ class DecisionEngine:
         return list(set(topics))
 
     def _combine_text(self, summaries):
-        return "\n".join(s.get("summary", "") for s in summaries)
+        # skipped chunks (progressive mode) have no summary
+        return "\n".join(s.get("summary", "") for s in summaries if not s.get("key_info", {}).get("skipped"))
+
+
+def early_exit_confidence_penalty(analyzed: int, total: int) -> float:
+    if not total or analyzed >= total:
+        return 0.0
+    return round(MAX_EARLY_EXIT_PENALTY * (1.0 - analyzed / total), 3)
+
+
+class ProgressiveDecision:
+    """
+    Running read-worthiness score for the progressive (early-exit) mode.
+
+    Feed it chunk results with `on_result` as they arrive; `should_stop`
+    turns true once the recommendation has held for the last
+    `stable_window` results, at least `min_chunks` were seen, and the
+    confidence is at or above `confidence_threshold`. Confidence is the
+    engine's usual estimate less the penalty for the chunks that stopping
+    now would skip, scaled down while the score sits close to a
+    recommendation boundary, where one more chunk could flip it.
+    """
+
+    # a score this far from the nearest boundary counts as fully settled
+    SETTLED_MARGIN = 0.15
+
+    def __init__(
+        self,
+        engine,
+        metadata,
+        total_chunks,
+        confidence_threshold=DEFAULT_EARLY_EXIT_CONFIDENCE,
+        stable_window=3,
+        min_chunks=None,
+    ):
+        self.engine = engine
+        self.metadata = metadata
+        self.total_chunks = total_chunks
+        self.confidence_threshold = confidence_threshold
+        self.stable_window = stable_window
+        self.min_chunks = min_chunks if min_chunks is not None else max(3, total_chunks // 10)
+        self.results = []
+        self.topics = set()
+        self.score = 0.0
+        self.confidence = 0.0
+        self.recommendation = None
+        self.stable_for = 0
+
+    def on_result(self, result):
+        result = result.model_dump() if hasattr(result, "model_dump") else result
+        self.results.append(result)
+        self.topics.update(result.get("topics", []))
+        self.score = self.engine.compute_read_worthiness({"combined_topics": list(self.topics)})
+        recommendation = self.engine.final_recommendation(self.score)
+        self.stable_for = self.stable_for + 1 if recommendation == self.recommendation else 1
+        self.recommendation = recommendation
+
+        margin = min(abs(self.score - FULL_READ_THRESHOLD), abs(self.score - KEY_INFO_THRESHOLD))
+        base = max(0.0, self.engine.compute_confidence(self.results, self.metadata) - self.confidence_penalty)
+        self.confidence = round(base * min(1.0, margin / self.SETTLED_MARGIN), 3)
+
+    @property
+    def seen(self) -> int:
+        return len(self.results)
+
+    @property
+    def confidence_penalty(self) -> float:
+        """Penalty for the chunks left unanalyzed if analysis stopped now."""
+        return early_exit_confidence_penalty(self.seen, self.total_chunks)
+
+    def should_stop(self) -> bool:
+        return (
+            self.seen >= self.min_chunks
+            and self.seen < self.total_chunks
+            and self.stable_for >= self.stable_window
+            and self.confidence >= self.confidence_threshold
+        )
+
+    def report(self) -> dict:
+        return {
+            "analyzed": self.seen,
+            "score": round(self.score, 3),
+            "recommendation": self.recommendation,
+            "confidence": self.confidence,
+            "confidence_penalty": self.confidence_penalty,
+        }
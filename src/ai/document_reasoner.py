@@ -1,75 +1,234 @@
-import json
+import asyncio
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from ai.prompts.document_prompts import combine_chunks_prompt
 from ai.context_loader import ContextLoader
+from ai.compaction import compact_json, compact_summaries, compaction_report, merge_key_info
+from ai.json_repair import ParseStats, extract_json, parse_json_response
+from document_processing.chunker import PROMPT_RESERVE_TOKENS, context_window_for, estimate_tokens
+
+# decide_need_full_read thresholds, and how close to one counts as borderline
+LOW_CONFIDENCE = 0.4
+MIN_INSIGHTS = 3
+BORDERLINE_MARGIN = 0.1
+
+# JSON Schema of combine_chunks_prompt's answer, for backends with a native JSON mode
+DOC_RESULT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "insights": {"type": "array", "items": {"type": "string"}},
+        "uncertainties": {"type": "array", "items": {"type": "string"}},
+        "confidence": {"type": "number"},
+    },
+    "required": ["summary", "insights", "uncertainties", "confidence"],
+}
 
 
 class DocumentReasoner:
-    def __init__(self, ai_client, context_path="context.md"):
+    def __init__(self, ai_client, context_path="context.md", hierarchical=None, max_json_retries=1, context_text=None):
+        """
+        hierarchical: None combines in one call when the prompt fits the model's
+        context window and reduces hierarchically otherwise; True/False force a mode.
+        max_json_retries: extra calls for an answer that local JSON repair can't recover.
+        context_text: context.md text to use instead of reading context_path.
+        """
         self.ai_client = ai_client
-        self.context_loader = ContextLoader(context_path)
+        self.context_loader = ContextLoader(context_path, text=context_text)
+        self.hierarchical = hierarchical
+        self.max_json_retries = max_json_retries
+        # how combine answers were parsed: clean, repaired locally, retried, failed
+        self.parse_stats = ParseStats()
+        # filled by combine/acombine: {"levels": reduce rounds, "calls": LLM calls}, plus
+        # "escalated": calls answered by a cascade's large model
+        self.reduce_stats = {"levels": 0, "calls": 0}
+        self._stats_lock = threading.Lock()
+        # filled by combine/acombine: key info tokens before and after compaction
+        self.key_info_report = {}
 
     def combine(self, chunk_results):
-        # chunk_results may be pydantic dataclasses or plain dicts
-        chunk_summaries = [getattr(c, "summary", c.get("summary")) for c in chunk_results]
-        chunk_key_info = [getattr(c, "key_info", c.get("key_info")) for c in chunk_results]
+        """
+        Combine chunk results into one document-level result.
+
+        Long documents are reduced map-reduce style: chunk results are combined
+        in groups that fit the context window, the group results are combined
+        again, and so on until one group remains. Groups within a level run
+        concurrently, up to the backend's max_concurrency.
+        """
+        context_notes = self.context_loader.load()
+        items = self._items(chunk_results)
+        self.key_info_report = compaction_report([item["key_info"] for item in items])
+        groups = self._plan_level(items, context_notes)
+        self.reduce_stats = {"levels": 1, "calls": 0}
+        while len(groups) > 1:
+            prompts = [self._prompt_for(g, context_notes) for g in groups]
+            workers = max(1, min(len(prompts), getattr(self.ai_client, "max_concurrency", 1)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                outputs = list(pool.map(self._call, prompts))
+            groups = self._next_level(outputs, context_notes)
+
+        # cascade backends: a borderline full-read decision by the small model is re-asked of the large one
+        prompt = self._prompt_for(groups[0], context_notes)
+        return self.parse_output(self._call(prompt, escalate_if=self._borderline_answer))
+
+    async def acombine(self, chunk_results):
+        """Async counterpart of `combine`."""
+        context_notes = self.context_loader.load()
+        items = self._items(chunk_results)
+        self.key_info_report = compaction_report([item["key_info"] for item in items])
+        groups = self._plan_level(items, context_notes)
+        self.reduce_stats = {"levels": 1, "calls": 0}
+        limit = asyncio.Semaphore(max(1, getattr(self.ai_client, "max_concurrency", 1)))
+
+        async def run(prompt):
+            async with limit:
+                return await self._acall(prompt)
+
+        while len(groups) > 1:
+            outputs = await asyncio.gather(*(run(self._prompt_for(g, context_notes)) for g in groups))
+            groups = self._next_level(outputs, context_notes)
+
+        prompt = self._prompt_for(groups[0], context_notes)
+        return self.parse_output(await self._acall(prompt, escalate_if=self._borderline_answer))
+
+    def _borderline_answer(self, output: str) -> bool:
+        parsed = extract_json(output)
+        return isinstance(parsed, dict) and self.is_borderline(parsed)
+
+    def _count_calls(self, calls: int, escalated: bool = False):
+        with self._stats_lock:
+            self.reduce_stats["calls"] += calls
+            if escalated:
+                self.reduce_stats["escalated"] = self.reduce_stats.get("escalated", 0) + 1
+
+    def _call(self, prompt: str, escalate_if=None) -> str:
+        output = self._call_once(prompt, escalate_if)
+        for _ in range(self.max_json_retries):
+            if isinstance(extract_json(output), dict):
+                break
+            self.parse_stats.add("retried")
+            output = self._call_once(prompt, escalate_if)
+        return output
+
+    async def _acall(self, prompt: str, escalate_if=None) -> str:
+        output = await self._acall_once(prompt, escalate_if)
+        for _ in range(self.max_json_retries):
+            if isinstance(extract_json(output), dict):
+                break
+            self.parse_stats.add("retried")
+            output = await self._acall_once(prompt, escalate_if)
+        return output
 
-        # For compatibility with DecisionEngine, ensure we provide each chunk as a dict
-        chunk_dicts = []
+    def _call_once(self, prompt: str, escalate_if=None) -> str:
+        # cascade backends say whether the large model answered too, so every LLM call is counted
+        if hasattr(self.ai_client, "cascade"):
+            output, escalated = self.ai_client.cascade(prompt, DOC_RESULT_SCHEMA, escalate_if)
+            self._count_calls(2 if escalated else 1, escalated)
+            return output
+        self._count_calls(1)
+        # schema-constrained output where the backend supports it
+        if getattr(self.ai_client, "supports_json_mode", False):
+            return self.ai_client.chat_json(prompt, DOC_RESULT_SCHEMA)
+        # prefer generate, but fallback to chat for backends that only implement chat
+        if hasattr(self.ai_client, "generate"):
+            return self.ai_client.generate(prompt)
+        return self.ai_client.chat(prompt)
+
+    async def _acall_once(self, prompt: str, escalate_if=None) -> str:
+        if hasattr(self.ai_client, "acascade"):
+            output, escalated = await self.ai_client.acascade(prompt, DOC_RESULT_SCHEMA, escalate_if)
+            self._count_calls(2 if escalated else 1, escalated)
+            return output
+        self._count_calls(1)
+        if getattr(self.ai_client, "supports_json_mode", False):
+            return await self.ai_client.achat_json(prompt, DOC_RESULT_SCHEMA)
+        if hasattr(self.ai_client, "agenerate"):
+            return await self.ai_client.agenerate(prompt)
+        return await self.ai_client.achat(prompt)
+
+    def _next_level(self, outputs, context_notes) -> list:
+        """Turn one level's group outputs into the items of the next level."""
+        self.reduce_stats["levels"] += 1
+        items = []
+        for output in outputs:
+            parsed = self.parse_output(output)
+            items.append(
+                {
+                    "summary": str(parsed.get("summary", "")),
+                    "key_info": {
+                        "insights": parsed.get("insights", []),
+                        "uncertainties": parsed.get("uncertainties", []),
+                    },
+                }
+            )
+        return self._plan_level(items, context_notes)
+
+    def _items(self, chunk_results) -> list:
+        # chunk_results may be pydantic models or plain dicts
+        items = []
         for c in chunk_results:
-            if hasattr(c, "model_dump"):
-                chunk_dicts.append(c.model_dump())
-            elif hasattr(c, "dict"):
-                try:
-                    chunk_dicts.append(c.dict())
-                except Exception:
-                    # try model_dump as a fallback
-                    if hasattr(c, 'model_dump'):
-                        chunk_dicts.append(c.model_dump())
-                    else:
-                        chunk_dicts.append({'chunk_id': getattr(c, 'chunk_id', None), 'summary': getattr(c,'summary', None)})
-            elif isinstance(c, dict):
-                chunk_dicts.append(c)
+            if isinstance(c, dict):
+                items.append({"summary": c.get("summary") or "", "key_info": c.get("key_info")})
             else:
-                # try to make a light dict
-                chunk_dicts.append(
-                    {
-                        "chunk_id": getattr(c, "chunk_id", None),
-                        "summary": getattr(c, "summary", None),
-                        "topics": getattr(c, "topics", []),
-                    }
-                )
+                items.append({"summary": getattr(c, "summary", "") or "", "key_info": getattr(c, "key_info", None)})
+        return items
 
-        context_notes = self.context_loader.load()
+    def token_budget(self) -> int:
+        """Prompt tokens a combine call may use, leaving room for the model's answer."""
+        return max(512, context_window_for(self.ai_client) - PROMPT_RESERVE_TOKENS)
+
+    def _plan_level(self, items: list, context_notes: str) -> list:
+        """Split items into groups whose combine prompts fit the token budget."""
+        if self.hierarchical is False:
+            return [items]
+        budget = self.token_budget()
+        if self.hierarchical is None and estimate_tokens(self._prompt_for(items, context_notes)) <= budget:
+            return [items]
 
-        prompt = combine_chunks_prompt(
-            chunk_summaries="\n\n".join(chunk_summaries),
-            chunk_key_info=json.dumps(chunk_key_info, indent=2),
+        groups, current = [], []
+        for item in items:
+            # every group gets at least two items so each level shrinks
+            if len(current) >= 2 and estimate_tokens(self._prompt_for(current + [item], context_notes)) > budget:
+                groups.append(current)
+                current = []
+            current.append(item)
+        if len(current) == 1 and groups and len(groups[-1]) > 2:
+            # pair a lone trailing item with the previous group's last one
+            current.insert(0, groups[-1].pop())
+        groups.append(current)
+        return groups
+
+    def _prompt_for(self, items: list, context_notes: str) -> str:
+        return combine_chunks_prompt(
+            chunk_summaries="\n\n".join(compact_summaries(item["summary"] for item in items)),
+            chunk_key_info=compact_json(merge_key_info(item["key_info"] for item in items)),
             context_notes=context_notes,
         )
 
-        # prefer generate, but fallback to chat for backends that only implement chat
-        if hasattr(self.ai_client, "generate"):
-            llm_output = self.ai_client.generate(prompt)
-        else:
-            llm_output = self.ai_client.chat(prompt)
-
-        llm_output = self.safe_parse_llm_output(llm_output)
-
-        try:
-            parsed = json.loads(llm_output)
-            # If parsed is a dict and includes a summary, return as-is
-            if isinstance(parsed, dict):
-                # Ensure keys exist with defaults
-                parsed.setdefault("summary", "")
-                parsed.setdefault("insights", [])
-                parsed.setdefault("uncertainties", [])
-                parsed.setdefault("confidence", 0.3)
-                return parsed
-            # otherwise, wrap
-            return {"summary": str(parsed), "insights": [], "uncertainties": [], "confidence": 0.3}
-        except json.JSONDecodeError:
-            return {"summary": llm_output, "insights": [], "uncertainties": [], "confidence": 0.3}
+    def build_prompt(self, chunk_results) -> str:
+        """Single-call combine prompt over all chunk results."""
+        return self._prompt_for(self._items(chunk_results), self.context_loader.load())
+
+    def parse_output(self, llm_output: str) -> dict:
+        parsed = parse_json_response(llm_output, self.parse_stats)
+        if parsed is None:
+            return {
+                "summary": self.safe_parse_llm_output(llm_output),
+                "insights": [],
+                "uncertainties": [],
+                "confidence": 0.3,
+            }
+        # If parsed is a dict and includes a summary, return as-is
+        if isinstance(parsed, dict):
+            # Ensure keys exist with defaults
+            parsed.setdefault("summary", "")
+            parsed.setdefault("insights", [])
+            parsed.setdefault("uncertainties", [])
+            parsed.setdefault("confidence", 0.3)
+            return parsed
+        # otherwise, wrap
+        return {"summary": str(parsed), "insights": [], "uncertainties": [], "confidence": 0.3}
 
     def decide_need_full_read(self, combined_result):
         # summary = combined_result.get("summary", "")
@@ -82,15 +241,27 @@ class DocumentReasoner:
 
         if len(uncertainties) > 0:
             reasons.append("Document contains uncertainties.")
-        if confidence < 0.4:
+        if confidence < LOW_CONFIDENCE:
             reasons.append("Low AI confidence.")
-        if len(insights) < 3:
+        if len(insights) < MIN_INSIGHTS:
             reasons.append("Not enough insights extracted.")
 
         need_full_read = len(reasons) > 0
 
         return {"need_full_read": need_full_read, "reasons": reasons}
 
+    def is_borderline(self, combined_result) -> bool:
+        """
+        Whether decide_need_full_read hinges on a value right at its threshold,
+        so a slightly different answer would flip it. Uncertainties decide it outright.
+        """
+        if combined_result.get("uncertainties"):
+            return False
+        confidence = combined_result.get("confidence", 0.5)
+        insights = combined_result.get("insights", [])
+        near_confidence = isinstance(confidence, (int, float)) and abs(confidence - LOW_CONFIDENCE) < BORDERLINE_MARGIN
+        return near_confidence or len(insights) in (MIN_INSIGHTS - 1, MIN_INSIGHTS)
+
     def safe_parse_llm_output(self, text):
         # 0. Remove ```json ... ``` wrappers if present
         cleaned = re.sub(r"```json\s*|\s*```", "", text, flags=re.IGNORECASE)
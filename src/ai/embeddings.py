@@ -0,0 +1,158 @@
+# Local topic embeddings for matching LLM-generated topics to context.md topics.
+# sentence-transformers is optional; without it the hashing embedder is used.
+try:
+    from sentence_transformers import SentenceTransformer
+
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except Exception:
+    SentenceTransformer = None
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from document_processing.lexical import stem
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbedder:
+    """
+    Dependency-free embedding of short topic strings: hashed character n-grams
+    of each word plus its stem, L2-normalized. Captures spelling-level
+    similarity ("invoice"/"invoices", "finance"/"financial"), not meaning.
+
+    Each word's first letters weigh extra, so words that only share an
+    ending stay apart: "illegal"/"legal", "insecurity"/"security", "brisk"/"risk".
+    """
+
+    # cosine similarity at which two topics count as the same
+    match_threshold = 0.6
+    PREFIX_LENGTH = 4
+    PREFIX_WEIGHT = 3.0
+
+    def __init__(self, dim: int = 512, ngram: int = 3):
+        self.dim = dim
+        self.ngram = ngram
+        self.name = f"hashing-{dim}-{ngram}"
+
+    def _features(self, text: str) -> List[tuple]:
+        """(feature, weight) pairs."""
+        features = []
+        for word in _WORD_RE.findall(text.lower()):
+            features.append(("w:" + stem(word), 1.0))
+            features.append(("p:" + word[: self.PREFIX_LENGTH], self.PREFIX_WEIGHT))
+            padded = f"<{word}>"
+            features.extend((padded[i : i + self.ngram], 1.0) for i in range(len(padded) - self.ngram + 1))
+        return features
+
+    def _bucket(self, feature: str) -> int:
+        # stable across processes, unlike hash()
+        return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little") % self.dim
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                vectors[row, self._bucket(feature)] += weight
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class SentenceTransformerEmbedder:
+    """Small local sentence-transformers model (CPU by default) for meaning-level matches."""
+
+    match_threshold = 0.55
+
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", device: str = "cpu"):
+        if not SENTENCE_TRANSFORMERS_AVAILABLE:
+            raise RuntimeError("sentence-transformers not installed; SentenceTransformerEmbedder unavailable")
+        self.name = model_name
+        self.model = SentenceTransformer(model_name, device=device)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+class CachedEmbedder:
+    """
+    Remembers embeddings by string (LRU), so each distinct topic is embedded
+    once per process; only the misses of a call go to the model, as one batch.
+    """
+
+    def __init__(self, embedder, max_entries: int = 100000):
+        self.embedder = embedder
+        self.name = embedder.name
+        self.match_threshold = embedder.match_threshold
+        self.max_entries = max_entries
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, texts: Iterable[str]) -> np.ndarray:
+        texts = list(texts)
+        with self._lock:
+            found = {t: self._vectors.get(t) for t in dict.fromkeys(texts)}
+            missing = [t for t, v in found.items() if v is None]
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            for text, vector in zip(missing, self.embedder.embed(missing)):
+                found[text] = vector
+            with self._lock:
+                for text in missing:
+                    self._vectors[text] = found[text]
+                while len(self._vectors) > self.max_entries:
+                    self._vectors.popitem(last=False)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[t] for t in texts])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._vectors), "hits": self.hits, "misses": self.misses}
+
+
+def build_embedder(spec: Optional[str] = None):
+    """
+    Embedder from a spec string: "hashing" (default) or "sentence-transformers[:<model>]".
+    Falls back to hashing when sentence-transformers isn't installed.
+    """
+    spec = spec or "hashing"
+    if spec.startswith("sentence-transformers") and SENTENCE_TRANSFORMERS_AVAILABLE:
+        _, _, model = spec.partition(":")
+        return CachedEmbedder(SentenceTransformerEmbedder(model) if model else SentenceTransformerEmbedder())
+    if spec != "hashing":
+        logger.warning("Embedder %r unavailable, using hashing embedder", spec)
+    return CachedEmbedder(HashingEmbedder())
+
+
+_default_embedder = None
+_default_embedder_lock = threading.Lock()
+
+
+def default_embedder():
+    """Process-wide embedder chosen by SMARTDOC_EMBEDDER, so its cache is shared."""
+    global _default_embedder
+    with _default_embedder_lock:
+        if _default_embedder is None:
+            _default_embedder = build_embedder(os.environ.get("SMARTDOC_EMBEDDER"))
+        return _default_embedder
+
+
+def max_similarity(vectors: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """Best cosine similarity of each row of `vectors` to any row of `targets` (both L2-normalized)."""
+    if not len(vectors) or not len(targets):
+        return np.zeros(len(vectors), dtype=np.float32)
+    return (vectors @ targets.T).max(axis=1)
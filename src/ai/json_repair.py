@@ -0,0 +1,170 @@
+import json
+import re
+import threading
+from typing import Any, List, Optional
+
+# Tolerant recovery of JSON objects from LLM output. Models wrap JSON in code
+# fences, surround it with chatter ("Sure! Here is the JSON: ..."), leave
+# trailing commas, use Python literals or typographic quotes, or stop mid-object
+# when they hit the token limit. extract_json undoes the common cases locally
+# so a near-miss doesn't cost another LLM call.
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*|\s*```", re.IGNORECASE)
+_TRAILING_COMMA_RE = re.compile(r",(\s*[}\]])")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_PY_LITERAL_RE = re.compile(r"\b(True|False|None)\b")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+
+def strip_fences(text: str) -> str:
+    return _FENCE_RE.sub("", text or "").strip()
+
+
+def _balanced_span(text: str, start: int) -> str:
+    """The JSON value starting at text[start] up to its matching bracket, or to the end if unclosed."""
+    stack = []
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if not stack or stack.pop() != ch:
+                return text[start : i + 1]
+            if not stack:
+                return text[start : i + 1]
+    return text[start:]
+
+
+def _close_truncated(candidate: str, drop_last: bool = False) -> str:
+    """
+    Close strings and brackets left open by a response cut off mid-object.
+
+    drop_last also drops a trailing string that may be a key without its value.
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    for ch in candidate:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    closed = (candidate + ('"' if in_string else "")).rstrip()
+    # drop a dangling key or comma before closing
+    dangling = r'(,\s*"[^"]*"\s*:?\s*|,\s*)$' if drop_last else r'(,\s*"[^"]*"\s*:\s*|,\s*)$'
+    closed = re.sub(dangling, "", closed)
+    return closed + "".join(reversed(stack))
+
+
+def _repairs(candidate: str):
+    yield candidate
+    fixed = candidate.translate(_SMART_QUOTES)
+    fixed = _TRAILING_COMMA_RE.sub(r"\1", fixed)
+    fixed = _PY_LITERAL_RE.sub(lambda m: _PY_LITERALS[m.group(1)], fixed)
+    yield fixed
+    if '"' not in fixed:
+        # Python-style dict with single quotes
+        yield fixed.replace("'", '"')
+    yield _TRAILING_COMMA_RE.sub(r"\1", _close_truncated(fixed))
+    yield _TRAILING_COMMA_RE.sub(r"\1", _close_truncated(fixed, drop_last=True))
+
+
+def _bracketed_values(text: str) -> List[str]:
+    """Top-level bracketed values in text, in order; the last may be unclosed."""
+    values = []
+    i = 0
+    while True:
+        starts = [j for j in (text.find("{", i), text.find("[", i)) if j >= 0]
+        if not starts:
+            return values
+        span = _balanced_span(text, min(starts))
+        values.append(span)
+        i = min(starts) + len(span)
+
+
+def _parse_candidate(candidate: str) -> Optional[Any]:
+    for attempt in _repairs(candidate):
+        try:
+            return json.loads(attempt)
+        except (json.JSONDecodeError, ValueError):
+            continue
+    return None
+
+
+def extract_json(text: str) -> Optional[Any]:
+    """
+    Best-effort JSON object (or array) from an LLM response; None when nothing parses.
+
+    Tries the whole response first, then each bracketed value in it from the
+    last to the first, each as-is and with local repairs. An object wins over
+    an array found later in the text, since trailing prose such as
+    "References: [1]" parses as an array too.
+    """
+    cleaned = strip_fences(text)
+    if not cleaned:
+        return None
+    # the last bracketed value first: echoed prompts and preambles put examples before the answer
+    candidates = [cleaned] + _bracketed_values(cleaned)[::-1]
+    fallback = None
+    for candidate in candidates:
+        value = _parse_candidate(candidate)
+        if isinstance(value, dict):
+            return value
+        if fallback is None:
+            fallback = value
+    return fallback
+
+
+class ParseStats:
+    """Thread-safe counts of how JSON responses were recovered."""
+
+    FIELDS = ("parsed", "repaired", "retried", "failed")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, outcome: str):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def report(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        # a retried response ends up parsed or failed as well
+        total = counts["parsed"] + counts["repaired"] + counts["failed"]
+        counts["failure_rate"] = round(counts["failed"] / total, 3) if total else 0.0
+        return counts
+
+
+def parse_json_response(text: str, stats: Optional[ParseStats] = None) -> Optional[Any]:
+    """`extract_json`, counting whether the response was clean JSON, needed repair, or failed."""
+    try:
+        value = json.loads(strip_fences(text))
+        outcome = "parsed"
+    except (json.JSONDecodeError, ValueError):
+        value = extract_json(text)
+        outcome = "failed" if value is None else "repaired"
+    if stats is not None:
+        stats.add(outcome)
+    return value
@@ -7,7 +7,7 @@ except Exception:
     BaseModel = object
     PYDANTIC_AVAILABLE = False
 
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 if PYDANTIC_AVAILABLE:
     from typing import List
@@ -32,7 +32,27 @@ if PYDANTIC_AVAILABLE:
     class BackendSpec(BaseModel):
         provider: str
         model: str
-        
+        # "split" or "combined" chunk prompting; None keeps the backend's default
+        chunk_mode: Optional[str] = None
+        # Ollama connection tuning; None keeps the backend's default
+        host: Optional[str] = None
+        timeout: Optional[float] = None
+        keep_alive: Optional[str] = None
+        max_connections: Optional[int] = None
+        max_concurrency: Optional[int] = None
+        options: Optional[Dict[str, Any]] = None
+        # prompts per batched generation call (local HF models)
+        batch_size: Optional[int] = None
+        # several Ollama hosts serving the same model: calls are load balanced with failover
+        hosts: Optional[List[str]] = None
+        # RouterBackend settings: failure_threshold, cooldown, probe_interval
+        router: Optional[Dict[str, Any]] = None
+        # cascade: this spec is the small model; uncertain answers are re-asked of escalate_to
+        escalate_to: Optional["BackendSpec"] = None
+        min_confidence: Optional[float] = None
+
+    BackendSpec.model_rebuild()
+
 else:
     from dataclasses import dataclass, asdict
     from typing import List
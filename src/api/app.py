@@ -1,8 +1,10 @@
+import asyncio
 import json
 import os
 import shutil
 import tempfile
 import logging
+from contextlib import asynccontextmanager
 from typing import Any, Optional
 
 import json
@@ -18,10 +20,9 @@ from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette import status
 
-from main import process_document
+from main import aprocess_document, triage_document
 from ai.backend.stub_backend import StubBackend
-from ai.backend.llm_ollama import OllamaBackend
-from ai.backend.llm_hf import HFBackend
+from ai.backend.registry import BackendRegistry
 from ai.schema import BackendSpec # Import the new schema
 
 
@@ -37,6 +38,15 @@ if not logger.handlers:
 logger.setLevel(logging.INFO)
 
 
+# Warm backend instances shared by all requests in this worker process.
+BACKENDS = BackendRegistry(
+    idle_ttl=float(os.environ.get("SMARTDOC_BACKEND_IDLE_TTL", "900")),
+    memory_budget_bytes=int(os.environ["SMARTDOC_HF_MEMORY_BUDGET_BYTES"])
+    if os.environ.get("SMARTDOC_HF_MEMORY_BUDGET_BYTES")
+    else None,
+)
+
+
 def _load_backend(link: BackendSpec | None) -> Any:
     """Pick the full LLM backend using the provided options.
 
@@ -44,24 +54,37 @@ def _load_backend(link: BackendSpec | None) -> Any:
       BackendSpec(provider="ollama", model="gemma3")
       BackendSpec(provider="hf", model="mistralai/Mistral-7B-Instruct-v0.2")
 
-    If link is None or provider not known, return None (use default in main.process_document).
+    Instances come from the process-wide registry, so a model is loaded once
+    and reused across requests. If link is None or provider not known, return
+    None (use default in main.process_document).
     """
     if not link:
         return None
-    p = str(link.provider).lower()
-    model = link.model
     try:
-        if p == "ollama":
-            return OllamaBackend(model=model or "gemma3")
-        if p in ("hf", "huggingface"):
-            return HFBackend(model_name=model or "mistralai/Mistral-7B-Instruct-v0.2")
+        return BACKENDS.get(link)
     except Exception as e:
         logger.exception("Failed to initialize backend: %s", e)
         return None
-    return None
 
 
-app = FastAPI(title="AI Document Relevance Agent")
+def _preload_specs() -> list:
+    """Backends listed in SMARTDOC_PRELOAD_BACKENDS, a JSON list of BackendSpec objects."""
+    raw = os.environ.get("SMARTDOC_PRELOAD_BACKENDS")
+    if not raw:
+        return []
+    return [BackendSpec.model_validate(spec) for spec in json.loads(raw)]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    specs = _preload_specs()
+    if specs:
+        logger.info("Preloading %d backend(s)", len(specs))
+        await asyncio.to_thread(BACKENDS.preload, specs)
+    yield
+
+
+app = FastAPI(title="AI Document Relevance Agent", lifespan=lifespan)
 
 
 @app.get("/")
@@ -115,8 +138,12 @@ async def analyze(
     context: Optional[str] = Form(None),
     use_stub: Optional[bool] = Form(False),
     backend_spec: Optional[str] = Form(None),
+    mode: Optional[str] = Form(None),
 ):
-    logger.info("Analyze called: filename=%s use_stub=%s", getattr(file, "filename", None), use_stub)
+    """mode="lexical" triages the document without LLM calls (see main.triage_document)."""
+    logger.info("Analyze called: filename=%s use_stub=%s mode=%s", getattr(file, "filename", None), use_stub, mode)
+    if mode not in (None, "llm", "lexical"):
+        raise HTTPException(status_code=400, detail=f"Unknown mode: {mode}")
 
     # Save uploaded file to a temporary file
     try:
@@ -130,23 +157,6 @@ async def analyze(
         logger.exception("Failed to save uploaded file")
         raise HTTPException(status_code=400, detail=f"Failed to save uploaded file: {e}")
 
-    # Save context if provided
-    ctx_path = None
-    if context:
-        try:
-            tmp_ctx = tempfile.NamedTemporaryFile(delete=False, suffix=".md")
-            with tmp_ctx as f:
-                f.write(context.encode("utf-8"))
-            ctx_path = tmp_ctx.name
-            logger.debug("Saved context to %s", ctx_path)
-        except Exception as e:
-            logger.exception("Failed to save context file")
-            try:
-                os.unlink(file_path)
-            except Exception:
-                pass
-            raise HTTPException(status_code=400, detail=f"Failed to save context: {e}")
-
     # Choose backend
     backend = None
     if use_stub:
@@ -178,18 +188,27 @@ async def analyze(
     # If a backend spec JSON is provided via backend_spec (e.g. {"provider":"ollama","model":"gemma3"}), parse and load backend
     try:
         backend_options = None
-        if backend is None and backend_spec:
-            try:
-                # Use Pydantic to validate the JSON string
-                backend_options = BackendSpec.model_validate_json(backend_spec)
-                backend = _load_backend(backend_options)
-                logger.info("Loaded backend from spec: %s", backend_options.model_dump())
-            except Exception as e:
-                logger.warning("Failed to parse or validate backend_spec: %s", e)
-                raise HTTPException(status_code=400, detail=f"Invalid backend_spec format: {e}")
-
-        logger.info("Processing document %s with backend=%s", file_path, type(backend).__name__ if backend else None)
-        result = process_document(file_path, ctx_path or "context.md", backend=backend)
+        if mode == "lexical":
+            # LLM-free triage; use_stub and backend_spec don't apply
+            result = await asyncio.to_thread(triage_document, file_path, "context.md", context=context or None)
+        else:
+            if backend is None and backend_spec:
+                try:
+                    # Use Pydantic to validate the JSON string
+                    backend_options = BackendSpec.model_validate_json(backend_spec)
+                    # a cold model can take minutes to load; keep the event loop serving other requests
+                    backend = await asyncio.to_thread(_load_backend, backend_options)
+                    logger.info("Loaded backend from spec: %s", backend_options.model_dump())
+                except Exception as e:
+                    logger.warning("Failed to parse or validate backend_spec: %s", e)
+                    raise HTTPException(status_code=400, detail=f"Invalid backend_spec format: {e}")
+
+            logger.info(
+                "Processing document %s with backend=%s", file_path, type(backend).__name__ if backend else None
+            )
+            # the async pipeline keeps the event loop free for other requests while this document is analyzed
+            # context text is used as-is, without a temp file round trip
+            result = await aprocess_document(file_path, "context.md", backend=backend, context=context or None)
         logger.info("Processing complete for %s", file_path)
     except HTTPException:
         # Re-raise HTTPExceptions to be handled by FastAPI
@@ -201,11 +220,6 @@ async def analyze(
             os.unlink(file_path)
         except Exception:
             pass
-        if ctx_path:
-            try:
-                os.unlink(ctx_path)
-            except Exception:
-                pass
         # Raise a generic HTTPException which will be formatted by our handlers
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -214,11 +228,6 @@ async def analyze(
         os.unlink(file_path)
     except Exception:
         pass
-    if ctx_path:
-        try:
-            os.unlink(ctx_path)
-        except Exception:
-            pass
 
     return JSONResponse(content=result)
 
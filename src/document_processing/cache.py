@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+from typing import Optional
+
+from document_processing.processor import extract_document, preprocess_text
+from storage.disk_cache import DiskCache
+
+# Bump when extraction or preprocessing output changes so stale entries are ignored.
+CACHE_VERSION = 1
+
+
+def file_digest(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file's content, read in blocks."""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Content-addressed cache of extracted + preprocessed document text.
+
+    Keyed on the file's SHA-256 plus the options that affect the output,
+    so the same upload under a different name (or from another user) is a
+    hit. Backed by a DiskCache, which can be shared between worker processes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024 * 1024):
+        self.store = DiskCache(directory, max_bytes=max_bytes)
+
+    def key(self, digest: str, **options) -> str:
+        payload = json.dumps({"digest": digest, "options": options, "version": CACHE_VERSION}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def extract(self, file_path: str, use_ocr=False, workers: int = 1) -> dict:
+        """
+        Cached `extract_document` + `preprocess_text`.
+
+        Returns:
+            dict with "text" (preprocessed), "page_count", "ocr_pages" and "cache_hit"
+        """
+        ext = os.path.splitext(file_path)[1].lower()
+        key = self.key(file_digest(file_path), ext=ext, use_ocr=use_ocr)
+
+        cached = self.store.get(key)
+        if cached is not None:
+            return {**cached, "cache_hit": True}
+
+        extracted = extract_document(file_path, use_ocr=use_ocr, workers=workers)
+        entry = {
+            "text": preprocess_text(extracted["text"]),
+            "page_count": extracted["page_count"],
+            "ocr_pages": extracted["ocr_pages"],
+        }
+        self.store.set(key, entry)
+        return {**entry, "cache_hit": False}
+
+
+def default_extraction_cache() -> Optional[ExtractionCache]:
+    """Cache configured through SMARTDOC_EXTRACTION_CACHE_DIR / _MAX_BYTES, or None when unset."""
+    directory = os.environ.get("SMARTDOC_EXTRACTION_CACHE_DIR")
+    if not directory:
+        return None
+    max_bytes = int(os.environ.get("SMARTDOC_EXTRACTION_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+    return ExtractionCache(directory, max_bytes=max_bytes)
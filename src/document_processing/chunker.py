@@ -0,0 +1,212 @@
+import math
+import re
+from typing import Iterable, Iterator, List, Optional
+
+# Rough token estimate: ~4 characters per token for English text on common BPE vocabularies.
+CHARS_PER_TOKEN = 4
+
+# Context windows of the models we run. Ollama truncates prompts at its num_ctx
+# (4096 by default) rather than at the model's native window.
+DEFAULT_CONTEXT_WINDOW = 4096
+MODEL_CONTEXT_WINDOWS = {
+    "gemma3": 4096,
+    "llama3": 4096,
+    "mistral": 4096,
+    "mistralai/Mistral-7B-Instruct-v0.2": 32768,
+}
+# Room left in the context window for prompt instructions and the model's answer.
+PROMPT_RESERVE_TOKENS = 1024
+# Larger chunks make summaries vaguer without saving much more; cap them here.
+MAX_CHUNK_TOKENS = 2048
+DEFAULT_OVERLAP_TOKENS = 32
+
+_HEADING_RE = re.compile(
+    r"^(#{1,6}\s+\S"  # markdown heading
+    r"|(\d+(\.\d+)*|[IVXLC]+)[.)]?\s+[A-Z]\S*(\s+\S+){0,8}$"  # numbered heading: "2.1 Scope", "IV. Terms"
+    r"|[A-Z][A-Z0-9 ,&/()'-]{2,80}$)"  # ALL CAPS heading
+)
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap, tokenizer-free token count estimate."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def context_window_for(backend) -> int:
+    window = getattr(backend, "context_window", None)
+    if window:
+        return window
+    model = str(getattr(backend, "model", "") or "")
+    if model in MODEL_CONTEXT_WINDOWS:
+        return MODEL_CONTEXT_WINDOWS[model]
+    # "gemma3:12b" -> "gemma3"
+    return MODEL_CONTEXT_WINDOWS.get(model.split(":")[0], DEFAULT_CONTEXT_WINDOW)
+
+
+def chunk_token_budget(backend=None) -> int:
+    """Tokens of document text per chunk that fit the backend's context window alongside the prompt."""
+    return max(128, min(MAX_CHUNK_TOKENS, context_window_for(backend) - PROMPT_RESERVE_TOKENS))
+
+
+def _is_heading(line: str) -> bool:
+    return len(line) <= 100 and not line.endswith((".", ",", ";", ":")) and bool(_HEADING_RE.match(line))
+
+
+def starts_with_heading(text: str) -> bool:
+    """True for a chunk that opens a new section (its first line is a heading)."""
+    first_line = text.lstrip().split("\n", 1)[0].strip()
+    return bool(first_line) and _is_heading(first_line)
+
+
+def _iter_lines(pieces: Iterable[str]) -> Iterator[str]:
+    # Pieces are one continuous text; a line may straddle two pieces
+    partial = ""
+    for piece in pieces:
+        lines = (partial + piece).split("\n")
+        partial = lines.pop()
+        yield from lines
+    if partial:
+        yield partial
+
+
+def _iter_blocks(pieces: Iterable[str]) -> Iterator[tuple]:
+    """Yield (kind, text) blocks: "heading" lines and blank-line separated "paragraph"s."""
+    paragraph: List[str] = []
+    for line in _iter_lines(pieces):
+        line = line.strip()
+        if not line or _is_heading(line):
+            if paragraph:
+                yield "paragraph", "\n".join(paragraph)
+                paragraph = []
+            if line:
+                yield "heading", line
+        else:
+            paragraph.append(line)
+    if paragraph:
+        yield "paragraph", "\n".join(paragraph)
+
+
+def _split_oversized(text: str, max_tokens: int) -> List[str]:
+    """Split a block that exceeds the budget into sentences, and sentences into word windows."""
+    parts = []
+    for sentence in _SENTENCE_END_RE.split(text):
+        if estimate_tokens(sentence) <= max_tokens:
+            parts.append(sentence)
+            continue
+        words = sentence.split()
+        window: List[str] = []
+        size = 0
+        for word in words:
+            word_tokens = estimate_tokens(word) + 1
+            if window and size + word_tokens > max_tokens:
+                parts.append(" ".join(window))
+                window, size = [], 0
+            window.append(word)
+            size += word_tokens
+        if window:
+            parts.append(" ".join(window))
+    return parts
+
+
+def iter_token_chunks(
+    pieces: Iterable[str], max_tokens: int = MAX_CHUNK_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS
+) -> Iterator[dict]:
+    """
+    Pack a stream of text into chunks of about `max_tokens` estimated tokens.
+
+    Chunks end on paragraph or sentence boundaries, a new chunk is started
+    at a heading once the current one is at least half full, and a heading
+    is never left dangling at the end of a chunk unless the text ends there. The last sentences of a
+    chunk, up to `overlap_tokens`, are repeated at the start of the next.
+
+    Yields dicts with "chunk_id", "text", "tokens" and "overlap_tokens".
+    """
+    chunk_id = 0
+    units: List[tuple] = []  # (text, tokens, kind, starts_block)
+    size = 0
+    carried = 0  # leading units repeated from the previous chunk
+    carried_size = 0
+
+    def cut(with_overlap=True, final=False) -> Optional[dict]:
+        """Close the current chunk (None if it holds nothing new) and seed the next one with overlap."""
+        nonlocal chunk_id, units, size, carried, carried_size
+        # trailing headings open the next chunk; at the end of the text there is none, so they stay
+        headings = []
+        while not final and units and units[-1][2] == "heading":
+            headings.insert(0, units.pop())
+
+        chunk = None
+        tail: List[tuple] = []
+        if len(units) > carried:
+            text = ""
+            for i, (unit_text, _, _, starts_block) in enumerate(units):
+                text += ("" if i == 0 else "\n\n" if starts_block else " ") + unit_text
+            chunk = {"chunk_id": chunk_id, "text": text, "tokens": size - sum(u[1] for u in headings)}
+            chunk["overlap_tokens"] = carried_size
+            chunk_id += 1
+            budget = overlap_tokens if with_overlap else 0
+            for unit in reversed(units):
+                if unit[2] == "heading" or unit[1] > budget:
+                    break
+                tail.insert(0, unit)
+                budget -= unit[1]
+
+        carried = len(tail)
+        carried_size = sum(u[1] for u in tail)
+        units = tail + headings
+        size = sum(u[1] for u in units)
+        return chunk
+
+    for kind, text in _iter_blocks(pieces):
+        if kind == "heading" and size - carried_size >= max_tokens // 2:
+            # new section: no overlap across the section boundary
+            chunk = cut(with_overlap=False)
+            if chunk:
+                yield chunk
+
+        tokens = estimate_tokens(text)
+        parts = [text] if tokens <= max_tokens else _split_oversized(text, max_tokens)
+        for i, part in enumerate(parts):
+            part_tokens = tokens if len(parts) == 1 else estimate_tokens(part)
+            if units and size + part_tokens > max_tokens:
+                chunk = cut()
+                if chunk:
+                    yield chunk
+                if carried and size + part_tokens > max_tokens:
+                    # no room for the overlap next to this part
+                    units = units[carried:]
+                    size -= carried_size
+                    carried, carried_size = 0, 0
+            units.append((part, part_tokens, kind, i == 0))
+            size += part_tokens
+
+    chunk = cut(final=True)
+    if chunk:
+        yield chunk
+
+
+def token_chunk_text(
+    text: str, max_tokens: int = MAX_CHUNK_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS
+) -> List[dict]:
+    """Token-budgeted, boundary-respecting replacement for `chunk_text`."""
+    return list(iter_token_chunks([text], max_tokens=max_tokens, overlap_tokens=overlap_tokens))
+
+
+def chunking_report(chunks: List[dict], calls_per_chunk: int = 1, prompt_tokens: Optional[int] = 0) -> dict:
+    """
+    Summarize what a chunking will cost in LLM input.
+
+    Args:
+        chunks: output of iter_token_chunks/token_chunk_text
+        calls_per_chunk: LLM calls issued for every chunk
+        prompt_tokens: template tokens sent with every chunk across those calls
+    """
+    chunk_tokens = sum(c.get("tokens", estimate_tokens(c["text"])) for c in chunks)
+    overlap = sum(c.get("overlap_tokens", 0) for c in chunks)
+    return {
+        "chunk_count": len(chunks),
+        "chunk_tokens": chunk_tokens,
+        "overlap_tokens": overlap,
+        "llm_input_tokens": chunk_tokens * calls_per_chunk + (prompt_tokens or 0) * len(chunks),
+    }
@@ -0,0 +1,93 @@
+import hashlib
+import re
+import struct
+from collections import defaultdict
+from typing import Dict, List
+
+# MinHash signatures over word shingles, bucketed with LSH bands so only
+# likely-similar chunk pairs are compared. With 32 hashes in 8 bands of 4
+# rows, pairs above ~0.6 Jaccard similarity almost always share a bucket;
+# candidates are then confirmed by exact Jaccard similarity of their shingles.
+NUM_HASHES = 32
+BANDS = 8
+SHINGLE_WORDS = 3
+DEFAULT_THRESHOLD = 0.85
+
+_WORD_RE = re.compile(r"\w+")
+_MAX_HASH = 2**32 - 1
+
+
+def _shingles(text: str) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return {" ".join(words)}
+    return {" ".join(words[i : i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def minhash_signature(shingles: set) -> tuple:
+    """NUM_HASHES 32-bit MinHash values of a set of shingles."""
+    signature = [_MAX_HASH] * NUM_HASHES
+    per_digest = 16  # a 64-byte blake2b digest holds 16 32-bit hashes
+    for shingle in shingles:
+        data = shingle.encode("utf-8")
+        values = []
+        for seed in range(NUM_HASHES // per_digest):
+            digest = hashlib.blake2b(data, digest_size=64, salt=seed.to_bytes(16, "little")).digest()
+            values.extend(struct.unpack("<16I", digest))
+        signature = list(map(min, signature, values))
+    return tuple(signature)
+
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def cluster_near_duplicates(texts: List[str], threshold: float = DEFAULT_THRESHOLD) -> List[List[int]]:
+    """
+    Group near-identical texts.
+
+    Returns clusters of indices into `texts`, each sorted with its first
+    occurrence (the representative) first; clusters are ordered by
+    representative and every index appears in exactly one cluster.
+    """
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # Exact duplicates are common (repeated disclaimers) and need no hashing
+    first_seen: Dict[str, int] = {}
+    shingles: Dict[int, set] = {}
+    signatures: Dict[int, tuple] = {}
+    for i, text in enumerate(texts):
+        key = text.strip()
+        if key in first_seen:
+            parent[i] = first_seen[key]
+        else:
+            first_seen[key] = i
+            shingles[i] = _shingles(text)
+            signatures[i] = minhash_signature(shingles[i])
+
+    rows = NUM_HASHES // BANDS
+    buckets = defaultdict(list)
+    for i, sig in signatures.items():
+        for band in range(BANDS):
+            buckets[(band, sig[band * rows : (band + 1) * rows])].append(i)
+
+    for members in buckets.values():
+        for a_pos, a in enumerate(members):
+            for b in members[a_pos + 1 :]:
+                root_a, root_b = find(a), find(b)
+                if root_a == root_b:
+                    continue
+                if jaccard(shingles[a], shingles[b]) >= threshold:
+                    # keep the earliest chunk as the root/representative
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    clusters = defaultdict(list)
+    for i in range(len(texts)):
+        clusters[find(i)].append(i)
+    return [clusters[root] for root in sorted(clusters)]
@@ -0,0 +1,136 @@
+import math
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+# BM25-style lexical relevance of a document's chunks to context.md topics,
+# for triage without any LLM call. Each topic is matched as a sequence of
+# stemmed words ("red flags" needs both words in order); term frequency
+# saturates and is normalized by chunk length as in BM25. A topic's strength
+# is its best chunk, scaled to 0..1. Corpus IDF is left out: one document's chunks are too few
+# and too similar for document frequency to say much about a topic.
+
+# BM25 term-frequency saturation and length normalization
+K1 = 1.2
+B = 0.75
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    """
+    Light suffix stripping so inflections match: "risks" -> "risk", "policies" -> "policy",
+    "licensing"/"licensed"/"license" -> "licens". Not a full stemmer; both sides of a
+    comparison just need to land on the same stem.
+    """
+    if len(word) <= 3 or word.isdigit():
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("sses"):
+        word = word[:-2]
+    elif word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        word = word[:-1]
+    if word.endswith("ing") and len(word) > 5:
+        word = word[:-3]
+    elif word.endswith("ed") and len(word) > 4:
+        word = word[:-2]
+    if word.endswith("e") and len(word) > 4:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(w) for w in _WORD_RE.findall(text.lower())]
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over word tokens: finds every occurrence of every
+    phrase in one pass over a token list, however many phrases there are.
+    Phrases are token tuples (see tokenize); matches respect word boundaries.
+    """
+
+    def __init__(self, phrases: Iterable[Tuple[str, ...]]):
+        self.phrases = list(dict.fromkeys(p for p in phrases if p))
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for idx, phrase in enumerate(self.phrases):
+            node = 0
+            for token in phrase:
+                child = self._goto[node].get(token)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[node][token] = child
+                node = child
+            self._out[node].append(idx)
+
+        # failure links, breadth first; a node also emits the phrases of its failure node
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(token, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def iter_matches(self, tokens: Iterable[str]):
+        """Index into `phrases` of each match, in the order the matches end."""
+        node = 0
+        for token in tokens:
+            while node and token not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(token, 0)
+            yield from self._out[node]
+
+    def counts(self, tokens: Iterable[str]) -> List[int]:
+        counts = [0] * len(self.phrases)
+        for idx in self.iter_matches(tokens):
+            counts[idx] += 1
+        return counts
+
+    def matches(self, tokens: Iterable[str]) -> bool:
+        return next(self.iter_matches(tokens), None) is not None
+
+
+def bm25_tf(tf: int, length: int, avg_length: float, k1: float = K1, b: float = B) -> float:
+    """BM25's saturated, length-normalized term frequency, scaled to 0..1."""
+    if tf <= 0:
+        return 0.0
+    norm = k1 * (1 - b + b * length / avg_length) if avg_length else k1
+    return tf / (tf + norm)
+
+
+def topic_strengths(
+    chunk_texts: Iterable[str], topics: Iterable[str], k1: float = K1, b: float = B
+) -> Dict[str, float]:
+    """Strength (0..1) of each topic in the document: its BM25 weight in the best-matching chunk."""
+    phrases = {t: tuple(tokenize(t)) for t in topics}
+    phrases = {t: p for t, p in phrases.items() if p}
+    matcher = PhraseMatcher(phrases.values())
+    index = {phrase: i for i, phrase in enumerate(matcher.phrases)}
+    tokenized = [tokenize(text) for text in chunk_texts]
+    lengths = [len(words) for words in tokenized]
+    avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+    strengths = dict.fromkeys(phrases, 0.0)
+    for words, length in zip(tokenized, lengths):
+        counts = matcher.counts(words)
+        for topic, phrase in phrases.items():
+            weight = bm25_tf(counts[index[phrase]], length, avg_length, k1, b)
+            strengths[topic] = max(strengths[topic], weight)
+    return {t: round(s, 4) for t, s in strengths.items()}
+
+
+def any_of(strengths: Iterable[float]) -> float:
+    """Probability that at least one topic is present, reading strengths as independent probabilities."""
+    return 1.0 - math.prod(1.0 - s for s in strengths)
@@ -0,0 +1,136 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+# Optional dependencies: pdfplumber to render pages, pytesseract for OCR
+try:
+    import pdfplumber
+except Exception:
+    pdfplumber = None
+
+try:
+    import pytesseract
+
+    OCR_AVAILABLE = True
+except Exception:
+    pytesseract = None
+    OCR_AVAILABLE = False
+
+# Page classes
+PAGE_TEXT = "text"  # usable text layer, no OCR
+PAGE_SPARSE = "sparse"  # a little text on top of a large image (e.g. a stamped scan)
+PAGE_IMAGE_ONLY = "image_only"  # no text layer, embedded image(s)
+PAGE_NO_TEXT = "no_text"  # no text layer and no images, but vector drawing (outlined glyphs)
+PAGE_BLANK = "blank"  # nothing to read
+
+OCR_PAGE_CLASSES = (PAGE_SPARSE, PAGE_IMAGE_ONLY, PAGE_NO_TEXT)
+
+# Pages with fewer characters than this are candidates for OCR
+SPARSE_TEXT_CHARS = 80
+# Fraction of the page that images must cover before sparse text is considered a scan
+SPARSE_IMAGE_COVERAGE = 0.3
+
+MIN_DPI = 150
+MAX_DPI = 300
+DEFAULT_DPI = 200
+# Cap on rendered pixels per page so oversized pages don't blow up memory
+MAX_PIXELS = 25_000_000
+# Below this many pages the process pool start-up costs more than it saves.
+MIN_PAGES_PER_WORKER = 2
+
+
+def _image_coverage(page) -> float:
+    page_area = float(page.width * page.height) or 1.0
+    covered = 0.0
+    for img in page.images:
+        width = max(0.0, min(img["x1"], page.width) - max(img["x0"], 0))
+        height = max(0.0, min(img["bottom"], page.height) - max(img["top"], 0))
+        covered += width * height
+    return min(1.0, covered / page_area)
+
+
+def classify_page(page, text: str) -> str:
+    """
+    Decide whether a page needs OCR given its extracted text layer.
+
+    Returns one of PAGE_TEXT, PAGE_SPARSE, PAGE_IMAGE_ONLY, PAGE_NO_TEXT, PAGE_BLANK.
+    """
+    chars = len(text.strip()) if text else 0
+    if chars >= SPARSE_TEXT_CHARS:
+        return PAGE_TEXT
+    coverage = _image_coverage(page)
+    if chars:
+        return PAGE_SPARSE if coverage >= SPARSE_IMAGE_COVERAGE else PAGE_TEXT
+    if coverage > 0:
+        return PAGE_IMAGE_ONLY
+    if page.curves or page.rects or page.lines:
+        return PAGE_NO_TEXT
+    return PAGE_BLANK
+
+
+def choose_resolution(page) -> int:
+    """
+    Pick a render DPI for OCR.
+
+    Follows the native resolution of the largest embedded scan (no point
+    rendering a 150 DPI fax at 300), clamped to [MIN_DPI, MAX_DPI], and
+    lowered further for oversized pages to stay under MAX_PIXELS.
+    """
+    dpi = DEFAULT_DPI
+    images = [img for img in page.images if img.get("srcsize") and img["width"] > 0]
+    if images:
+        largest = max(images, key=lambda img: img["width"] * img["height"])
+        # srcsize is in pixels, width in points (1/72 inch)
+        native = largest["srcsize"][0] / (largest["width"] / 72.0)
+        dpi = int(min(MAX_DPI, max(MIN_DPI, native)))
+
+    area_sq_in = (page.width / 72.0) * (page.height / 72.0)
+    if area_sq_in > 0:
+        dpi = min(dpi, int(math.sqrt(MAX_PIXELS / area_sq_in)))
+    return dpi
+
+
+def ocr_page(page, resolution: int) -> str:
+    pil_image = page.to_image(resolution=resolution).original
+    return pytesseract.image_to_string(pil_image)
+
+
+def _ocr_page_batch(args: Tuple[str, List[Tuple[int, int]]]) -> List[Tuple[int, str]]:
+    """Worker entry point: OCR the given (page_index, dpi) pairs with a private pdfplumber handle."""
+    pdf_path, requests = args
+    with pdfplumber.open(pdf_path) as pdf:
+        results = []
+        for index, dpi in requests:
+            page = pdf.pages[index]
+            try:
+                results.append((index, ocr_page(page, dpi)))
+            finally:
+                page.close()
+        return results
+
+
+def ocr_pages(pdf_path: str, requests: List[Tuple[int, int]], workers: Optional[int] = 1) -> Dict[int, str]:
+    """
+    OCR selected pages of a PDF, in parallel when worth it.
+
+    Args:
+        pdf_path: path to the PDF file
+        requests: (page_index, dpi) pairs, typically from classify_page/choose_resolution
+        workers: processes to spread pages over (1 = in-process)
+
+    Returns:
+        Mapping of page index to OCR text
+    """
+    if not requests or not OCR_AVAILABLE:
+        return {}
+    workers = min(workers or 1, len(requests) // MIN_PAGES_PER_WORKER)
+    if workers <= 1:
+        return dict(_ocr_page_batch((pdf_path, requests)))
+
+    # Round-robin so expensive runs of consecutive scanned pages are spread out
+    batches = [requests[i::workers] for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = {}
+        for batch in pool.map(_ocr_page_batch, [(pdf_path, batch) for batch in batches]):
+            results.update(batch)
+        return results
@@ -0,0 +1,68 @@
+import re
+
+# Cheap, LLM-free detection of chunks that are obviously noise: page numbers,
+# table debris, OCR garbage, runs of headers. Prose has plenty of letters and
+# function words in reasonably long lines; noise lacks all three.
+
+DEFAULT_NOISE_THRESHOLD = 0.7
+
+_WORD_RE = re.compile(r"[A-Za-z]+")
+_STOPWORDS = frozenset(
+    """
+    a an and are as at be been but by can for from has have if in into is it its may must not of on or our shall
+    should such that the their there these this those to was were which will with would we you he she they
+    """.split()
+)
+
+
+def noise_features(text: str) -> dict:
+    """Character-class, stopword and line-length statistics of a chunk."""
+    chars = [ch for ch in text if not ch.isspace()]
+    n_chars = max(1, len(chars))
+    words = _WORD_RE.findall(text)
+    lines = [ln for ln in text.splitlines() if ln.strip()]
+    n_lines = max(1, len(lines))
+    return {
+        "alpha_ratio": sum(ch.isalpha() for ch in chars) / n_chars,
+        "digit_ratio": sum(ch.isdigit() for ch in chars) / n_chars,
+        "punct_ratio": sum(not ch.isalnum() for ch in chars) / n_chars,
+        # too few words to judge counts as lacking function words
+        "stopword_ratio": sum(w.lower() in _STOPWORDS for w in words) / max(20, len(words)),
+        "word_count": len(words),
+        "words_per_line": len(words) / n_lines,
+        "mean_line_length": sum(len(ln.strip()) for ln in lines) / n_lines,
+        "short_line_ratio": sum(len(ln.strip()) < 20 for ln in lines) / n_lines,
+    }
+
+
+def _ramp(value: float, start: float, end: float) -> float:
+    """0 at `start`, 1 at `end`, linear in between (works for start > end too)."""
+    if start == end:
+        return 0.0
+    return max(0.0, min(1.0, (value - start) / (end - start)))
+
+
+def noise_score(text: str) -> float:
+    """
+    Likelihood-like score in [0, 1] that a chunk carries no useful information.
+
+    Prose scores near 0; page-number runs, numeric table debris and OCR
+    garbage score near 1.
+    """
+    if not text.strip():
+        return 1.0
+    f = noise_features(text)
+    score = (
+        0.25 * _ramp(f["alpha_ratio"], 0.7, 0.3)
+        + 0.20 * _ramp(f["stopword_ratio"], 0.2, 0.03)
+        + 0.15 * _ramp(f["short_line_ratio"], 0.4, 0.9)
+        + 0.15 * _ramp(f["words_per_line"], 6, 1.5)
+        + 0.10 * _ramp(f["digit_ratio"], 0.15, 0.5)
+        + 0.10 * _ramp(f["punct_ratio"], 0.15, 0.4)
+        + 0.05 * _ramp(f["word_count"], 20, 3)
+    )
+    return round(score, 3)
+
+
+def is_low_information(text: str, threshold: float = DEFAULT_NOISE_THRESHOLD) -> bool:
+    return noise_score(text) >= threshold
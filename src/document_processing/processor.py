@@ -9,14 +9,6 @@ except Exception:
     pdfplumber = None
     PDF_AVAILABLE = False
 
-try:
-    import pytesseract
-
-    OCR_AVAILABLE = True
-except Exception:
-    pytesseract = None
-    OCR_AVAILABLE = False
-
 try:
     import docx
 
@@ -26,34 +18,109 @@ except Exception:
     DOCX_AVAILABLE = False
 
 import re
-from typing import List
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from document_processing.ocr import (
+    OCR_AVAILABLE,
+    OCR_PAGE_CLASSES,
+    classify_page,
+    choose_resolution,
+    ocr_page,
+    ocr_pages,
+)
 
+# Below this many pages the process pool start-up costs more than it saves.
+MIN_PAGES_PER_WORKER = 8
 
-def _extract_text_from_pdf(pdf_path: str, use_ocr=False) -> str:
+
+def _scan_page(page, use_ocr=False) -> Tuple[str, Optional[int]]:
+    """
+    Read a page's text layer and decide whether it needs OCR.
+
+    Returns the text plus the DPI to OCR it at, or None when the text layer is enough.
+    """
+    page_text = page.extract_text() or ""
+    if use_ocr and OCR_AVAILABLE and classify_page(page, page_text) in OCR_PAGE_CLASSES:
+        return page_text, choose_resolution(page)
+    return page_text, None
+
+
+def _merge_ocr(page_text: str, ocr_text: str) -> str:
+    # Sparse pages keep their text layer when OCR does not recover more
+    return ocr_text if len(ocr_text.strip()) > len(page_text.strip()) else page_text
+
+
+def _extract_pdf_page_range(args: Tuple[str, int, int, bool]) -> List[Tuple[str, Optional[int]]]:
+    """
+    Worker entry point: scan pages [start, end) of a PDF.
+
+    Each worker opens its own pdfplumber handle since they cannot be shared
+    across processes.
+    """
+    pdf_path, start, end, use_ocr = args
+    with pdfplumber.open(pdf_path) as pdf:
+        return [_scan_page(pdf.pages[i], use_ocr=use_ocr) for i in range(start, end)]
+
+
+def _page_ranges(page_count: int, workers: int) -> List[Tuple[int, int]]:
+    """Split [0, page_count) into at most `workers` contiguous, evenly sized ranges."""
+    workers = max(1, min(workers, page_count))
+    size, extra = divmod(page_count, workers)
+    ranges = []
+    start = 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _extract_pdf(pdf_path: str, use_ocr=False, workers: int = 1) -> dict:
+    """
+    Extract a PDF's text layer, then OCR only the pages that need it.
+
+    Text extraction is sharded by page range and OCR by page across up to
+    `workers` processes.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+        scan_workers = min(workers, page_count // MIN_PAGES_PER_WORKER)
+        if scan_workers <= 1:
+            scanned = [_scan_page(page, use_ocr=use_ocr) for page in pdf.pages]
+
+    if scan_workers > 1:
+        ranges = _page_ranges(page_count, scan_workers)
+        with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+            # map() yields results in submission order, so pages come back in document order
+            shards = pool.map(_extract_pdf_page_range, [(pdf_path, start, end, use_ocr) for start, end in ranges])
+            scanned = [page for shard in shards for page in shard]
+
+    requests = [(i, dpi) for i, (_, dpi) in enumerate(scanned) if dpi is not None]
+    ocr_texts = ocr_pages(pdf_path, requests, workers=workers)
+
+    pages = [_merge_ocr(text, ocr_texts[i]) if i in ocr_texts else text for i, (text, _) in enumerate(scanned)]
+    return {
+        "text": "".join(page_text + "\n" for page_text in pages),
+        "page_count": page_count,
+        "ocr_pages": [i + 1 for i in sorted(ocr_texts)],
+    }
+
+
+def _extract_text_from_pdf(pdf_path: str, use_ocr=False, workers: int = 1) -> str:
     """
     Extract full text from a PDF.
 
     args:
         pdf_path: path to the PDF file
         use_ocr: Whether to use OCR fro scanned PDFs
+        workers: number of processes to shard page ranges across (1 = serial)
 
     Returns:
         Full text as a single string
     """
-    text = ""
-    with pdfplumber.open(pdf_path) as pdf:
-        for i, page in enumerate(pdf.pages):
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-            elif use_ocr and OCR_AVAILABLE:
-                # fallback OCR
-                pil_image = page.to_image(resolution=300).original
-                page_text = pytesseract.image_to_string(pil_image)
-                text += page_text + "\n"
-            else:
-                text += "\n"
-    return text
+    return _extract_pdf(pdf_path, use_ocr=use_ocr, workers=workers)["text"]
 
 
 def _extract_text_from_docx(docx_path: str) -> str:
@@ -69,25 +136,87 @@ def _extract_text_from_txt(txt_path: str) -> str:
         return f.read()
 
 
-def extract_text(file_path: str, use_ocr=False) -> str:
+def extract_document(file_path: str, use_ocr=False, workers: int = 1) -> dict:
+    """
+    Unified document extractor that also reports how the text was obtained.
+
+    Args:
+        file_path: Path to document (PDF, DOCX, TXT)
+        use_ocr: OCR scanned pages of PDFs (only pages without a usable text layer are OCR'd)
+        workers: processes used for PDF page extraction and OCR; 0 or None uses every CPU
+
+    Returns:
+        dict with "text", "page_count" (None for non-PDF) and "ocr_pages" (1-based page numbers)
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+
+    if ext == ".pdf":
+        return _extract_pdf(file_path, use_ocr=use_ocr, workers=workers or os.cpu_count() or 1)
+    elif ext == ".docx":
+        return {"text": _extract_text_from_docx(file_path), "page_count": None, "ocr_pages": []}
+    elif ext == ".txt":
+        return {"text": _extract_text_from_txt(file_path), "page_count": None, "ocr_pages": []}
+    else:
+        raise ValueError(f"Unsupported file type: {ext}")
+
+
+def extract_text(file_path: str, use_ocr=False, workers: int = 1) -> str:
     """
     Unified document extractor.
 
     Args:
         file_path: Path to document (PDF, DOCX, TXT)
         use_ocr: use OCR for scanned PDFs
+        workers: processes used for PDF page extraction; 0 or None uses every CPU
 
     Returns:
         Full extracted text as a string
     """
+    return extract_document(file_path, use_ocr=use_ocr, workers=workers)["text"]
+
+
+# Non-PDF inputs have no pages; stream them in blocks of this many lines/paragraphs.
+STREAM_BLOCK_LINES = 200
+
+
+def iter_pages(file_path: str, use_ocr=False, ocr_pages_out: Optional[list] = None) -> Iterator[str]:
+    """
+    Streaming counterpart of `extract_text`.
+
+    Yields one page of text at a time (blocks of lines for DOCX/TXT) and
+    flushes pdfplumber's per-page object cache as soon as a page is done,
+    so memory stays bounded by a single page regardless of document size.
+    OCR runs inline; if `ocr_pages_out` is given, the 1-based numbers of
+    OCR'd pages are appended to it.
+    """
     ext = os.path.splitext(file_path)[1].lower()
 
     if ext == ".pdf":
-        return _extract_text_from_pdf(file_path, use_ocr=use_ocr)
+        with pdfplumber.open(file_path) as pdf:
+            for number, page in enumerate(pdf.pages, start=1):
+                try:
+                    page_text, dpi = _scan_page(page, use_ocr=use_ocr)
+                    if dpi is not None:
+                        page_text = _merge_ocr(page_text, ocr_page(page, dpi))
+                        if ocr_pages_out is not None:
+                            ocr_pages_out.append(number)
+                    yield page_text
+                finally:
+                    page.close()
     elif ext == ".docx":
-        return _extract_text_from_docx(file_path)
+        paragraphs = [para.text for para in docx.Document(file_path).paragraphs]
+        for i in range(0, len(paragraphs), STREAM_BLOCK_LINES):
+            yield "\n".join(paragraphs[i : i + STREAM_BLOCK_LINES])
     elif ext == ".txt":
-        return _extract_text_from_txt(file_path)
+        with open(file_path, "r", encoding="utf-8") as f:
+            block = []
+            for line in f:
+                block.append(line.rstrip("\n"))
+                if len(block) == STREAM_BLOCK_LINES:
+                    yield "\n".join(block)
+                    block = []
+            if block:
+                yield "\n".join(block)
     else:
         raise ValueError(f"Unsupported file type: {ext}")
 
@@ -158,22 +287,101 @@ def preprocess_text(text: str) -> str:
     return text
 
 
-def chunk_text(text: str, chunk_size=2000, overlap=200) -> List[dict]:
+def iter_clean_pages(pages: Iterable[str], window=5, repeated_threshold=2) -> Iterator[str]:
     """
-    Split text into overlapping chunks.
+    Streaming counterpart of `preprocess_text`.
+
+    Header/footer detection only looks at the `window` pages on either side
+    of the page being cleaned instead of the whole document, so at most
+    2 * window + 1 pages are held in memory.
+    """
+    buffer = deque()
+    counts = Counter()
+    emit_at = 0  # index in buffer of the next page to clean
+
+    def clean(lines):
+        kept = [line for line in lines if counts[line] < repeated_threshold]
+        return _normalize_text("\n".join(kept))
+
+    for page in pages:
+        lines = page.splitlines()
+        buffer.append(lines)
+        counts.update(lines)
+        if len(buffer) - emit_at > window:
+            cleaned = clean(buffer[emit_at])
+            if cleaned:
+                yield cleaned
+            emit_at += 1
+            if emit_at > window:
+                old = buffer.popleft()
+                counts.subtract(old)
+                for line in old:
+                    if counts[line] <= 0:
+                        del counts[line]
+                emit_at -= 1
+
+    while emit_at < len(buffer):
+        cleaned = clean(buffer[emit_at])
+        if cleaned:
+            yield cleaned
+        emit_at += 1
+
+
+def iter_chunks(pieces: Iterable[str], chunk_size=2000, overlap=200) -> Iterator[dict]:
     """
-    chunks = []
+    Split a stream of text pieces into overlapping chunks.
+
+    Pieces are treated as one continuous text, so the output is identical to
+    chunking their concatenation; only the current chunk plus one piece is
+    kept in memory.
+    """
+    buf = ""
     start = 0
-    text_len = len(text)
     chunk_id = 0
-    while start < text_len:
-        end = min(start + chunk_size, text_len)
-        chunks.append({"chunk_id": chunk_id, "text": text[start:end]})
-        chunk_id += 1
-        start = end - overlap
-        if end == text_len:
-            break
-    return chunks
+    for piece in pieces:
+        # Drop consumed text before appending so each character is copied a bounded number of times
+        buf = buf[start:] + piece
+        start = 0
+        # Only emit once text past the chunk end exists: the final chunk must not be followed by an overlap-only one
+        while len(buf) - start > chunk_size:
+            yield {"chunk_id": chunk_id, "text": buf[start : start + chunk_size]}
+            chunk_id += 1
+            start += chunk_size - overlap
+    if len(buf) > start:
+        yield {"chunk_id": chunk_id, "text": buf[start:]}
+
+
+def chunk_text(text: str, chunk_size=2000, overlap=200) -> List[dict]:
+    """
+    Split text into overlapping chunks.
+    """
+    return list(iter_chunks([text], chunk_size=chunk_size, overlap=overlap))
+
+
+def iter_document_pages(file_path: str, use_ocr=False, window=5, ocr_pages_out: Optional[list] = None) -> Iterator[str]:
+    """
+    Bounded-memory extraction -> cleaning pipeline.
+
+    Yields cleaned pages as pieces of one continuous text (pages after the
+    first are prefixed with a line break), ready for `iter_chunks` or the
+    token-aware chunker.
+    """
+    pages = iter_clean_pages(iter_pages(file_path, use_ocr=use_ocr, ocr_pages_out=ocr_pages_out), window=window)
+    for i, page in enumerate(pages):
+        yield page if i == 0 else "\n" + page
+
+
+def iter_document_chunks(
+    file_path: str, use_ocr=False, chunk_size=2000, overlap=200, window=5, ocr_pages_out: Optional[list] = None
+) -> Iterator[dict]:
+    """
+    Bounded-memory extraction -> cleaning -> chunking pipeline.
+
+    Equivalent to `chunk_text(preprocess_text(extract_text(...)))` except that
+    header/footer removal is limited to a sliding window of pages.
+    """
+    pages = iter_document_pages(file_path, use_ocr=use_ocr, window=window, ocr_pages_out=ocr_pages_out)
+    return iter_chunks(pages, chunk_size=chunk_size, overlap=overlap)
 
 
 # Example usage
@@ -0,0 +1,83 @@
+import re
+from typing import Iterable, List
+
+from document_processing.chunker import starts_with_heading
+
+# Stratified chunk sampling for very large documents. A sample keeps the
+# opening and closing chunks (abstracts, conclusions, signatures), the start
+# of every section it can afford, the chunks that mention the reader's
+# priority topics most, and fills the rest with evenly spaced chunks so no
+# stretch of the document goes unseen.
+
+EDGE_CHUNKS = 2
+# Share of the sample reserved for section starts and for priority-topic matches.
+SECTION_SHARE = 0.4
+PRIORITY_SHARE = 0.3
+# Confidence lost when only a small fraction of the document is analyzed.
+MAX_SAMPLING_PENALTY = 0.3
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def topic_overlap(text: str, priority_topics: Iterable[str]) -> float:
+    """Occurrences of priority-topic words per 100 words of text."""
+    terms = {w for topic in priority_topics for w in _words(topic) if len(w) > 2}
+    words = _words(text)
+    if not terms or not words:
+        return 0.0
+    return 100.0 * sum(w in terms for w in words) / len(words)
+
+
+def _spread(indices: List[int], count: int) -> List[int]:
+    """`count` evenly spaced members of `indices`."""
+    if count >= len(indices):
+        return list(indices)
+    if count <= 0:
+        return []
+    step = len(indices) / count
+    return [indices[int(i * step)] for i in range(count)]
+
+
+def select_sample(chunks: List[dict], max_chunks: int, priority_topics: Iterable[str] = ()) -> List[int]:
+    """
+    Indices (ascending) of at most `max_chunks` chunks representing the document.
+
+    Picks, in order of preference: the first and last EDGE_CHUNKS chunks,
+    evenly spread section starts (up to SECTION_SHARE of the sample), the
+    chunks with the highest priority-topic overlap (up to PRIORITY_SHARE),
+    then evenly spaced chunks from the remainder.
+    """
+    n = len(chunks)
+    if n <= max_chunks:
+        return list(range(n))
+    chosen = set()
+
+    def take(indices):
+        for i in indices:
+            if len(chosen) >= max_chunks:
+                return
+            chosen.add(i)
+
+    edge = min(EDGE_CHUNKS, max_chunks // 4)
+    take(list(range(edge)) + list(range(n - edge, n)))
+
+    sections = [i for i in range(n) if i not in chosen and starts_with_heading(chunks[i]["text"])]
+    take(_spread(sections, int(max_chunks * SECTION_SHARE)))
+
+    topics = list(priority_topics)
+    if topics:
+        scored = [(topic_overlap(chunks[i]["text"], topics), i) for i in range(n) if i not in chosen]
+        ranked = [i for score, i in sorted(scored, key=lambda x: (-x[0], x[1])) if score > 0]
+        take(ranked[: int(max_chunks * PRIORITY_SHARE)])
+
+    rest = [i for i in range(n) if i not in chosen]
+    take(_spread(rest, max_chunks - len(chosen)))
+    return sorted(chosen)
+
+
+def sampling_confidence_penalty(sample_rate: float) -> float:
+    return round(MAX_SAMPLING_PENALTY * (1.0 - sample_rate), 3)
@@ -24,11 +24,12 @@ def _load_backend(link: dict | None):
         return None
     p = str(link.get("provider", "")).lower()
     model = link.get("model")
+    options = {"chunk_mode": link["chunk_mode"]} if link.get("chunk_mode") else {}
     try:
         if p == "ollama" and OllamaBackend:
-            return OllamaBackend(model=model or "gemma3")
+            return OllamaBackend(model=model or "gemma3", **options)
         if p in ("hf", "huggingface") and HFBackend:
-            return HFBackend(model_name=model or "mistralai/Mistral-7B-Instruct-v0.2")
+            return HFBackend(model_name=model or "mistralai/Mistral-7B-Instruct-v0.2", **options)
     except Exception:
         return None
     return None
@@ -49,7 +50,6 @@ if st.button("Analyze"):
         st.error("Please upload a file to analyze.")
     else:
         tmp_file = None
-        tmp_ctx = None
         try:
             suffix = os.path.splitext(uploaded_file.name)[1] or ".txt"
             tmp_fd, tmp_path = tempfile.mkstemp(suffix=suffix)
@@ -57,12 +57,6 @@ if st.button("Analyze"):
                 f.write(uploaded_file.getbuffer())
             tmp_file = tmp_path
 
-            if context_md and context_md.strip():
-                tmp_ctx_fd, tmp_ctx_path = tempfile.mkstemp(suffix=".md")
-                with os.fdopen(tmp_ctx_fd, "w", encoding="utf-8") as f:
-                    f.write(context_md)
-                tmp_ctx = tmp_ctx_path
-
             backend = None
             if use_stub:
                 backend = StubBackend(
@@ -100,7 +94,8 @@ if st.button("Analyze"):
                         st.warning("Requested backend could not be initialized; continuing without backend.")
 
             with st.spinner("Analyzing document..."):
-                result = process_document(tmp_file, tmp_ctx or "context.md", backend=backend)
+                context_text = context_md if context_md and context_md.strip() else None
+                result = process_document(tmp_file, "context.md", backend=backend, context=context_text)
 
             st.success("Analysis complete")
 
@@ -159,8 +154,6 @@ if st.button("Analyze"):
             try:
                 if tmp_file and os.path.exists(tmp_file):
                     os.unlink(tmp_file)
-                if tmp_ctx and os.path.exists(tmp_ctx):
-                    os.unlink(tmp_ctx)
             except Exception:
                 pass
 
@@ -1,34 +1,62 @@
+import asyncio
 import json
+import os
 import pathlib
+import threading
+from typing import Optional
 
-from document_processing.processor import extract_text, preprocess_text, chunk_text
+from document_processing.processor import extract_document, extract_text, preprocess_text, iter_document_pages
+from document_processing.chunker import chunk_token_budget, chunking_report, iter_token_chunks, token_chunk_text
+from document_processing.cache import default_extraction_cache
+from document_processing.dedup import cluster_near_duplicates
+from document_processing.prefilter import DEFAULT_NOISE_THRESHOLD, noise_score
+from document_processing.sampling import sampling_confidence_penalty, select_sample
 from ai.document_reasoner import DocumentReasoner
 from ai.decision_engine import DecisionEngine
 from ai.backend.llm_ollama import OllamaBackend
+from ai.backend.llm_cache import CachedBackend, default_response_cache
 from ai.chunk_processor import ChunkProcessor
 from ai.context_loader import ContextLoader
 from storage.jsonl_store import JSONLStore
 
+# Processes used for PDF page extraction (0 = one per CPU).
+EXTRACT_WORKERS = int(os.environ.get("SMARTDOC_EXTRACT_WORKERS", "1"))
+# Files larger than this go through the bounded-memory streaming pipeline.
+STREAM_THRESHOLD_BYTES = int(os.environ.get("SMARTDOC_STREAM_THRESHOLD_BYTES", str(50 * 1024 * 1024)))
+# Shared on-disk cache of extracted text (None unless SMARTDOC_EXTRACTION_CACHE_DIR is set).
+EXTRACTION_CACHE = default_extraction_cache()
+# Documents with more distinct chunks than this analyze a stratified sample of SAMPLE_MAX_CHUNKS.
+SAMPLE_THRESHOLD_CHUNKS = int(os.environ.get("SMARTDOC_SAMPLE_THRESHOLD_CHUNKS", "200"))
+SAMPLE_MAX_CHUNKS = int(os.environ.get("SMARTDOC_SAMPLE_MAX_CHUNKS", "80"))
+# Shared LLM response cache (None unless SMARTDOC_LLM_CACHE_DIR is set).
+LLM_CACHE = default_response_cache()
+
+_default_backend = None
+_default_backend_lock = threading.Lock()
+
+
+def default_backend():
+    """Process-wide OllamaBackend, so its pooled HTTP client is reused across documents."""
+    global _default_backend
+    with _default_backend_lock:
+        if _default_backend is None:
+            _default_backend = OllamaBackend(model="gemma3")
+        return _default_backend
+
 
 def main(file_path: str, context_path: str = "context.md"):
     # Extract and clean text
     raw_text = extract_text(file_path, use_ocr=True)
     clean_text = preprocess_text(raw_text)
 
-    # Split sections into chunks (simple example: by 1000 chars)
-    chunks = []
-    chunk_size = 100
-    overlap = 20
-    chunks = chunk_text(text=clean_text, chunk_size=chunk_size, overlap=overlap)
-
     llm_client = OllamaBackend(model="gemma3")
 
+    # Split into chunks sized for the model's context window
+    chunks = token_chunk_text(clean_text, max_tokens=chunk_token_budget(llm_client))
+
     #  Process chunks with LLM
     processor = ChunkProcessor(llm_client)
-    chunk_results = []
-    for idx, chunk in enumerate(chunks):
-        chunk_result = processor.process_chunk(chunk["text"], idx)
-        chunk_results.append(chunk_result)
+    chunk_results = processor.process_chunks(chunks)
 
     #  Store chunk results
     store = JSONLStore("output/chunks.jsonl")
@@ -48,62 +76,203 @@ def main(file_path: str, context_path: str = "context.md"):
     print(f"Processed {len(chunks)} chunks and stored results at output/chunks.jsonl and document_analysis.json")
 
 
-def process_document(file_path: str, context_path: str, backend=None):
+def _as_dict(result):
+    if hasattr(result, "model_dump"):
+        return result.model_dump()
+    if hasattr(result, "dict"):
+        return result.dict()
+    return result
+
+
+def _fan_out(analysis: dict, cluster: list, chunks: list) -> dict:
+    """Copy a cluster representative's analysis to every member chunk, keyed by chunk index."""
+    representative = chunks[cluster[0]]
+    out = {cluster[0]: analysis}
+    for idx in cluster[1:]:
+        out[idx] = {
+            **analysis,
+            "chunk_id": chunks[idx]["chunk_id"],
+            "text": chunks[idx]["text"],
+            "duplicate_of": representative["chunk_id"],
+        }
+    return out
+
+
+def _with_response_cache(backend):
+    if LLM_CACHE is None or isinstance(backend, CachedBackend):
+        return backend
+    return CachedBackend(backend, LLM_CACHE)
+
+
+def _extract_chunks(file_path: str, max_tokens: int, extract_workers: int, extraction_cache):
+    """Cleaned chunks of the document, the OCR'd page numbers, and whether the extraction cache hit."""
+    # OCR is selective: only pages without a usable text layer are rendered and OCR'd
+    if os.path.getsize(file_path) > STREAM_THRESHOLD_BYTES:
+        ocr_pages = []
+        cache_hit = False
+        pages = iter_document_pages(file_path, use_ocr=True, ocr_pages_out=ocr_pages)
+        chunks = list(iter_token_chunks(pages, max_tokens=max_tokens))
+    else:
+        cache = extraction_cache or EXTRACTION_CACHE
+        if cache is not None:
+            extracted = cache.extract(file_path, use_ocr=True, workers=extract_workers)
+            clean_text = extracted["text"]
+        else:
+            extracted = extract_document(file_path, use_ocr=True, workers=extract_workers)
+            clean_text = preprocess_text(extracted["text"])
+        ocr_pages = extracted["ocr_pages"]
+        cache_hit = extracted.get("cache_hit", False)
+        chunks = token_chunk_text(clean_text, max_tokens=max_tokens)
+    return chunks, ocr_pages, cache_hit
+
+
+def _plan_document(file_path: str, context: ContextLoader, backend, extract_workers: int, extraction_cache) -> dict:
+    """Everything before the chunk LLM calls: context, extraction, chunking, prefiltering and dedup."""
     # -------------------------
     # 1. Load context.md rules (as parsed dict)
     # -------------------------
-    context_parsed = ContextLoader(context_path).load_parsed()
+    context_parsed = context.load_parsed()
 
     # -------------------------
-    # 2. Extract, chunk and analyze
+    # 2. Extract and chunk
     # -------------------------
-    raw_text = extract_text(file_path, use_ocr=True)
-    clean_text = preprocess_text(raw_text)
-    chunks = chunk_text(clean_text, chunk_size=1000, overlap=200)
-
-    ai = backend or OllamaBackend(model="gemma3")
+    ai = _with_response_cache(backend or default_backend())
     processor = ChunkProcessor(ai)
+    max_tokens = chunk_token_budget(ai)
 
-    chunk_summaries = []
-    for c in chunks:
-        analysis = processor.process_chunk(c["text"], c["chunk_id"])
-        if hasattr(analysis, "model_dump"):
-            chunk_summaries.append(analysis.model_dump())
-        elif hasattr(analysis, "dict"):
-            chunk_summaries.append(analysis.dict())
+    chunks, ocr_pages, cache_hit = _extract_chunks(file_path, max_tokens, extract_workers, extraction_cache)
+
+    # Obvious noise (page numbers, table debris) gets a synthetic result instead of LLM calls
+    noise_threshold = context_parsed.get("noise_threshold", DEFAULT_NOISE_THRESHOLD)
+    analyzed = {}
+    candidates = []
+    for i, c in enumerate(chunks):
+        noise = noise_score(c["text"])
+        if noise >= noise_threshold:
+            analyzed[i] = _as_dict(processor.low_information_result(c["text"], c["chunk_id"], noise))
         else:
-            chunk_summaries.append(analysis)
+            candidates.append(i)
+
+    # Near-duplicate chunks (repeated disclaimers, tables of contents) are analyzed once per cluster
+    clusters = [[candidates[j] for j in cl] for cl in cluster_near_duplicates([chunks[i]["text"] for i in candidates])]
+    representatives = [chunks[cluster[0]] for cluster in clusters]
+
+    # Very large documents: analyze a stratified sample, the rest is marked skipped
+    eligible = len(representatives)
+    sampling = {"sampled": False, "sample_rate": 1.0, "confidence_penalty": 0.0}
+    if eligible > SAMPLE_THRESHOLD_CHUNKS:
+        keep = select_sample(representatives, SAMPLE_MAX_CHUNKS, context_parsed.get("priority_topics", []))
+        kept = set(keep)
+        for j, cluster in enumerate(clusters):
+            if j in kept:
+                continue
+            for idx in cluster:
+                skipped = processor.skipped_result(chunks[idx]["text"], chunks[idx]["chunk_id"], reason="not_sampled")
+                analyzed[idx] = _as_dict(skipped)
+        clusters = [clusters[j] for j in keep]
+        representatives = [representatives[j] for j in keep]
+        rate = round(len(keep) / eligible, 3)
+        sampling = {
+            "sampled": True,
+            "sample_rate": rate,
+            "sampled_chunks": len(keep),
+            "eligible_chunks": eligible,
+            "confidence_penalty": sampling_confidence_penalty(rate),
+        }
 
     # metadata (expand later if needed)
     metadata = {
         "file_path": file_path,
         "chunk_count": len(chunks),
-        "ocr_used": False,  # set to True if OCR triggered
+        "ocr_used": bool(ocr_pages),
+        "ocr_pages": ocr_pages,
+        "extraction_cache_hit": cache_hit,
+        "low_information_chunks": len(chunks) - len(candidates),
+        "duplicate_chunks": len(candidates) - eligible,
+        "sampling": sampling,
+        "chunk_token_budget": max_tokens,
+        "token_report": chunking_report(
+            representatives, calls_per_chunk=processor.calls_per_chunk, prompt_tokens=processor.prompt_tokens
+        ),
     }
+    return {
+        "context": context_parsed,
+        "ai": ai,
+        "cascade_stats": ai.stats() if hasattr(ai, "escalate") else None,
+        "processor": processor,
+        "chunks": chunks,
+        "analyzed": analyzed,
+        "clusters": clusters,
+        "representatives": representatives,
+        "metadata": metadata,
+    }
+
+
+def _progress_hooks(plan: dict, progressive) -> dict:
+    """
+    on_result/should_stop hooks for process_chunks in progressive (early-exit) mode, or none.
 
+    progressive=None turns the mode on when context.md sets early_exit_confidence.
+    """
+    if progressive is None:
+        progressive = "early_exit_confidence" in plan["context"]
+    if not progressive:
+        plan["tracker"] = None
+        return {}
+    tracker = DecisionEngine(context_rules=plan["context"]).progressive(plan["metadata"], len(plan["representatives"]))
+    plan["tracker"] = tracker
+    return {"on_result": tracker.on_result, "should_stop": tracker.should_stop}
+
+
+def _collect_chunk_results(plan: dict, results: list) -> list:
+    """Fan the representatives' results out to their clusters and return chunk dicts in document order."""
+    results = [_as_dict(r) for r in results]
+    failed = [r for r in results if r["key_info"].get("error") == "CHUNK_FAILED"]
+    attempted = [r for r in results if not r["key_info"].get("skipped")]
+    if failed and len(failed) == len(attempted):
+        raise RuntimeError(f"All chunk analyses failed: {failed[0]['key_info']['detail']}")
+    plan["metadata"]["failed_chunks"] = len(failed)
+
+    analyzed = dict(plan["analyzed"])
+    for cluster, analysis in zip(plan["clusters"], results):
+        analyzed.update(_fan_out(analysis, cluster, plan["chunks"]))
+    chunk_summaries = [analyzed[i] for i in range(len(plan["chunks"]))]
+
+    plan["metadata"]["skipped_chunks"] = sum(1 for c in chunk_summaries if c["key_info"].get("skipped"))
+    if plan.get("tracker") is not None:
+        plan["metadata"]["early_exit"] = plan["tracker"].report()
+    return chunk_summaries
+
+
+def _score_document(plan: dict, chunk_summaries: list) -> dict:
     # -------------------------
     # 3. Decision Engine
     # -------------------------
-    engine = DecisionEngine(context_rules=context_parsed)
+    engine = DecisionEngine(context_rules=plan["context"])
 
-    combined = engine.combine_responses(chunk_summaries, metadata)
+    combined = engine.combine_responses(chunk_summaries, plan["metadata"])
     score = engine.compute_read_worthiness(combined)
-    confidence = engine.compute_confidence(chunk_summaries, metadata)
-    recommendation = engine.final_recommendation(score)
+    return {
+        "combined": combined,
+        "score": score,
+        "confidence": engine.compute_confidence(chunk_summaries, plan["metadata"]),
+        "recommendation": engine.final_recommendation(score),
+    }
 
-    # Additional document-level run via DocumentReasoner to extract insights/uncertainties
-    reasoner = DocumentReasoner(ai, context_path=context_path)
-    try:
-        doc_level = reasoner.combine(chunk_summaries)
-    except Exception:
-        doc_level = {"summary": combined["combined_summary"], "insights": [], "uncertainties": [], "confidence": 0.0}
 
-    # Decision details from the reasoner
-    decision_details = reasoner.decide_need_full_read(doc_level)
+def _doc_level_fallback(combined: dict) -> dict:
+    return {"summary": combined["combined_summary"], "insights": [], "uncertainties": [], "confidence": 0.0}
+
 
+def _final_output(plan: dict, chunk_summaries: list, scored: dict, doc_level: dict, decision_details: dict) -> dict:
     # -------------------------
     # 4. Final Output
     # -------------------------
+    combined = scored["combined"]
+    if plan.get("cascade_stats") is not None:
+        # cascade backends are shared and kept warm: report only this document's calls
+        # (calls of documents analyzed concurrently on the same backend are included too)
+        plan["metadata"]["cascade"] = plan["ai"].stats_delta(plan["cascade_stats"], plan["ai"].stats())
     return {
         "summary": combined["combined_summary"],
         "doc_summary": doc_level.get("summary", combined["combined_summary"]),
@@ -111,17 +280,123 @@ def process_document(file_path: str, context_path: str, backend=None):
         "uncertainties": doc_level.get("uncertainties", []),
         "doc_confidence": doc_level.get("confidence", 0.0),
         "topics": combined["combined_topics"],
-        "score": score,
-        "recommendation": recommendation,
+        "score": scored["score"],
+        "recommendation": scored["recommendation"],
         "need_full_read": decision_details.get("need_full_read", False),
         "read_reasons": decision_details.get("reasons", []),
-        "confidence": confidence,
-        "metadata": metadata,
+        "confidence": scored["confidence"],
+        "metadata": plan["metadata"],
         "chunks": chunk_summaries,
+        "context": plan["context"],
+    }
+
+
+def _json_parse_report(plan, reasoner) -> dict:
+    """How chunk and combine answers were parsed: clean, repaired locally, retried or failed."""
+    return {"chunks": plan["processor"].parse_stats.report(), "document": reasoner.parse_stats.report()}
+
+
+def process_document(
+    file_path: str,
+    context_path: str,
+    backend=None,
+    extract_workers: int = EXTRACT_WORKERS,
+    extraction_cache=None,
+    max_concurrency: Optional[int] = None,
+    progressive: Optional[bool] = None,
+    context: Optional[str] = None,
+):
+    """context: context.md text to use instead of reading context_path."""
+    loader = ContextLoader(context_path, text=context)
+    plan = _plan_document(file_path, loader, backend, extract_workers, extraction_cache)
+
+    # LLM calls run concurrently, bounded by max_concurrency (default: the backend's own limit)
+    # In progressive mode chunk calls stop once the recommendation is settled
+    hooks = _progress_hooks(plan, progressive)
+    results = plan["processor"].process_chunks(plan["representatives"], max_in_flight=max_concurrency, **hooks)
+    chunk_summaries = _collect_chunk_results(plan, results)
+    scored = _score_document(plan, chunk_summaries)
+
+    # Additional document-level run via DocumentReasoner to extract insights/uncertainties
+    reasoner = DocumentReasoner(plan["ai"], context_path=context_path, context_text=context)
+    try:
+        doc_level = reasoner.combine(chunk_summaries)
+        plan["metadata"]["doc_combine"] = {**reasoner.reduce_stats, **reasoner.key_info_report}
+    except Exception:
+        doc_level = _doc_level_fallback(scored["combined"])
+
+    # Decision details from the reasoner
+    decision_details = reasoner.decide_need_full_read(doc_level)
+    plan["metadata"]["json_parse"] = _json_parse_report(plan, reasoner)
+    return _final_output(plan, chunk_summaries, scored, doc_level, decision_details)
+
+
+def triage_document(
+    file_path: str,
+    context_path: str,
+    extract_workers: int = EXTRACT_WORKERS,
+    extraction_cache=None,
+    context: Optional[str] = None,
+):
+    """
+    LLM-free triage: scores the document against context.md topics lexically.
+
+    Cheap enough to run over every incoming document and send only those not
+    triaged "Not Relevant" through process_document.
+    """
+    context_parsed = ContextLoader(context_path, text=context).load_parsed()
+    max_tokens = chunk_token_budget()
+    chunks, ocr_pages, cache_hit = _extract_chunks(file_path, max_tokens, extract_workers, extraction_cache)
+    triage = DecisionEngine(context_rules=context_parsed).lexical_triage(c["text"] for c in chunks)
+    return {
+        "score": triage["score"],
+        "recommendation": triage["recommendation"],
+        "topics": [t for t, strength in triage["priority_topics"].items() if strength > 0],
+        "metadata": {
+            "file_path": file_path,
+            "mode": "lexical",
+            "chunk_count": len(chunks),
+            "ocr_used": bool(ocr_pages),
+            "ocr_pages": ocr_pages,
+            "extraction_cache_hit": cache_hit,
+            "topic_strengths": {"priority": triage["priority_topics"], "ignore": triage["ignore_topics"]},
+        },
         "context": context_parsed,
     }
 
 
+async def aprocess_document(
+    file_path: str,
+    context_path: str,
+    backend=None,
+    extract_workers: int = EXTRACT_WORKERS,
+    extraction_cache=None,
+    max_concurrency: Optional[int] = None,
+    progressive: Optional[bool] = None,
+    context: Optional[str] = None,
+):
+    """Async variant of `process_document` that never blocks the event loop."""
+    loader = ContextLoader(context_path, text=context)
+    # extraction, OCR and chunking are blocking CPU/disk work
+    plan = await asyncio.to_thread(_plan_document, file_path, loader, backend, extract_workers, extraction_cache)
+
+    hooks = _progress_hooks(plan, progressive)
+    results = await plan["processor"].aprocess_chunks(plan["representatives"], max_in_flight=max_concurrency, **hooks)
+    chunk_summaries = _collect_chunk_results(plan, results)
+    scored = _score_document(plan, chunk_summaries)
+
+    reasoner = DocumentReasoner(plan["ai"], context_path=context_path, context_text=context)
+    try:
+        doc_level = await reasoner.acombine(chunk_summaries)
+        plan["metadata"]["doc_combine"] = {**reasoner.reduce_stats, **reasoner.key_info_report}
+    except Exception:
+        doc_level = _doc_level_fallback(scored["combined"])
+
+    decision_details = reasoner.decide_need_full_read(doc_level)
+    plan["metadata"]["json_parse"] = _json_parse_report(plan, reasoner)
+    return _final_output(plan, chunk_summaries, scored, doc_level, decision_details)
+
+
 if __name__ == "__main__":
     import sys
 
@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+# Size-bounded, content-addressed JSON store on local disk.
+#
+# Entries are plain files written atomically (temp file + rename), so several
+# processes (e.g. uvicorn workers) can share one directory without locking.
+# A file's mtime is its creation time (used for TTL) and its atime the last
+# use: a hit touches the atime, and eviction removes the least recently used
+# files first.
+
+
+class DiskCache:
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024 * 1024, ttl: Optional[float] = None):
+        """
+        directory: cache root, created if missing
+        max_bytes: total size above which least recently used entries are evicted
+        ttl: seconds after which an entry is considered stale (None = never)
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # Scanning the directory is O(entries); only do it after enough new data was written
+        self._written_since_scan = max_bytes
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            st = path.stat()
+            now = time.time()
+            if self.ttl is not None and now - st.st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                return None
+            with path.open("r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path, (now, st.st_mtime))  # mark as recently used, keep creation time
+            return value
+        except (FileNotFoundError, json.JSONDecodeError):
+            # missing, evicted by another process, or a torn write from a crashed one
+            return None
+
+    def set(self, key: str, value: Any):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+        self._written_since_scan += len(data)
+        if self._written_since_scan >= self.max_bytes // 10:
+            self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        self._written_since_scan = 0
+        entries = []
+        total = 0
+        for path in self.directory.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_atime, st.st_size, path))
+            total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            path.unlink(missing_ok=True)
+            total -= size
+            if total <= self.max_bytes:
+                break
@@ -1,8 +1,130 @@
 import os
 import sys
 
+import pytest
+
 # make src available on sys.path for tests
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 SRC = os.path.join(ROOT, 'src')
 if SRC not in sys.path:
     sys.path.insert(0, SRC)
+
+
+def _build_pdf(pages):
+    """
+    Build a minimal multi-page PDF; each page is a list of text lines (or None for a blank page).
+
+    Lines starting with "%" are emitted as raw content-stream operators (e.g. "%72 72 200 200 re f").
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        ops = []
+        for i, line in enumerate(lines or []):
+            if line.startswith("%"):
+                ops.append(line[1:])
+                continue
+            escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            ops.append(f"BT /F1 12 Tf 72 {720 - 16 * i} Td ({escaped}) Tj ET")
+        stream = "\n".join(ops)
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_ref = len(objects)
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_ref} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{num} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for off in offsets:
+        out += f"{off:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return out
+
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    def _make(pages, name="doc.pdf"):
+        path = tmp_path / name
+        path.write_bytes(_build_pdf(pages))
+        return path
+
+    return _make
+
+
+@pytest.fixture
+def ollama_stand_in():
+    """
+    Start minimal local HTTP servers speaking enough of the Ollama API for OllamaBackend.
+
+    Each server answers /api/chat with "from <name>" and /api/ps with no models,
+    counts chat requests in `server.chats`, and answers 500 while `server.healthy`
+    is False. Setting `server.reject` to a status code answers chat requests with
+    that error instead. Returns a factory: ollama_stand_in(name) -> server with a `url`.
+    """
+    import json
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    servers = []
+
+    def _start(name, delay=0.0):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, code, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if not server.healthy:
+                    return self._reply(500, {"error": "down"})
+                self._reply(200, {"models": []})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not server.healthy:
+                    return self._reply(500, {"error": "down"})
+                with server.lock:
+                    server.chats += 1
+                if server.reject:
+                    return self._reply(server.reject, {"error": "rejected"})
+                time.sleep(delay)
+                self._reply(
+                    200,
+                    {
+                        "model": "gemma3",
+                        "created_at": "2024-01-01T00:00:00Z",
+                        "message": {"role": "assistant", "content": f"from {name}"},
+                        "done": True,
+                    },
+                )
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        server.daemon_threads = True
+        server.healthy = True
+        server.chats = 0
+        server.reject = None
+        server.lock = threading.Lock()
+        server.url = f"http://127.0.0.1:{server.server_address[1]}"
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield _start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
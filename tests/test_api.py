@@ -91,3 +91,17 @@ def test_analyze_unsupported_extension_returns_500():
     payload = r.json()
     assert "error" in payload
     assert "Unsupported file type: .abc" in payload["error"]["message"]
+
+
+def test_analyze_lexical_mode_needs_no_backend():
+    file_path = Path("tests/documents/sample.txt")
+    with file_path.open("rb") as f:
+        files = {"file": ("sample.txt", f, "text/plain")}
+        data = {"mode": "lexical", "context": "focus=methodology"}
+        r = client.post("/analyze", data=data, files=files)
+
+    assert r.status_code == 200
+    payload = r.json()
+    assert payload["metadata"]["mode"] == "lexical"
+    assert payload["topics"] == ["methodology"]
+    assert payload["recommendation"] in ("Full Read Recommended", "Key Info Enough")
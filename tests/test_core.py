@@ -1,4 +1,5 @@
 import json
+import pytest
 from pathlib import Path
 
 from ai.backend.stub_backend import StubBackend
@@ -140,3 +141,951 @@ def test_jsonl_store_save_load(tmp_path):
     loaded = store.load_all()
     assert len(loaded) >= 1
     assert loaded[0].chunk_id == 1
+
+
+def test_parallel_pdf_extraction_preserves_page_order(make_pdf, monkeypatch):
+    from document_processing import processor
+
+    monkeypatch.setattr(processor, "MIN_PAGES_PER_WORKER", 1)
+    pages = [[f"Page {i} body"] if i % 3 else None for i in range(10)]
+    pdf_path = str(make_pdf(pages))
+
+    serial = processor.extract_text(pdf_path, workers=1)
+    parallel = processor.extract_text(pdf_path, workers=3)
+    assert parallel == serial
+    assert serial.splitlines() == [f"Page {i} body" if i % 3 else "" for i in range(10)]
+    assert processor._page_ranges(10, 3) == [(0, 4), (4, 7), (7, 10)]
+
+
+def test_streaming_pipeline_matches_batch_chunking(make_pdf):
+    from document_processing.processor import extract_text, iter_document_chunks, iter_pages
+
+    pages = [["ACME Corp confidential", f"Section {i} discusses item {i} in detail."] for i in range(6)]
+    pdf_path = str(make_pdf(pages))
+
+    assert len(list(iter_pages(pdf_path))) == 6
+    expected = chunk_text(preprocess_text(extract_text(pdf_path)), chunk_size=50, overlap=10)
+    streamed = list(iter_document_chunks(pdf_path, chunk_size=50, overlap=10, window=2))
+    assert streamed == expected
+    assert all("ACME" not in c["text"] for c in streamed)
+
+
+def test_selective_ocr_skips_text_and_blank_pages(make_pdf, monkeypatch):
+    from document_processing import ocr, processor
+
+    long_line = "This page has a perfectly usable text layer with plenty of characters on it."
+    pages = [[long_line, long_line], None, ["%72 72 300 400 re f"]]
+    pdf_path = str(make_pdf(pages))
+
+    ocr_calls = []
+
+    def fake_ocr_page(page, resolution):
+        ocr_calls.append((page.page_number, resolution))
+        return "Recovered by OCR"
+
+    monkeypatch.setattr(processor, "OCR_AVAILABLE", True)
+    monkeypatch.setattr(ocr, "OCR_AVAILABLE", True)
+    monkeypatch.setattr(ocr, "ocr_page", fake_ocr_page)
+
+    extracted = processor.extract_document(pdf_path, use_ocr=True, workers=1)
+    # Only the vector-drawn page without a text layer is OCR'd; the blank page is skipped
+    assert extracted["ocr_pages"] == [3]
+    assert ocr_calls == [(3, ocr.DEFAULT_DPI)]
+    assert extracted["text"].splitlines()[-1] == "Recovered by OCR"
+    assert extracted["page_count"] == 3
+
+
+def test_extraction_cache_hits_on_same_content(tmp_path, monkeypatch):
+    from document_processing import cache as cache_module
+
+    first = tmp_path / "a.txt"
+    second = tmp_path / "renamed.txt"
+    first.write_text("Policy text\nPolicy text\nBody", encoding="utf-8")
+    second.write_text("Policy text\nPolicy text\nBody", encoding="utf-8")
+
+    calls = []
+    real_extract = cache_module.extract_document
+    monkeypatch.setattr(cache_module, "extract_document", lambda *a, **kw: calls.append(a) or real_extract(*a, **kw))
+
+    cache = cache_module.ExtractionCache(str(tmp_path / "cache"))
+    miss = cache.extract(str(first), use_ocr=True)
+    hit = cache.extract(str(second), use_ocr=True)
+    assert (miss["cache_hit"], hit["cache_hit"]) == (False, True)
+    assert hit["text"] == miss["text"] == preprocess_text(first.read_text(encoding="utf-8"))
+    assert len(calls) == 1
+    # different extractor options are a different entry
+    assert cache.extract(str(first), use_ocr=False)["cache_hit"] is False
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    import os
+    from storage.disk_cache import DiskCache
+
+    store = DiskCache(str(tmp_path), max_bytes=10_000)
+    for i, key in enumerate(["aa1", "bb2", "cc3"]):
+        store.set(key, "x" * 100)
+        path = store._path(key)
+        os.utime(path, (1000 + i, 1000 + i))
+    store.get("aa1")  # refresh the oldest entry
+    store.max_bytes = 250
+    store.evict()
+
+    assert store.get("aa1") is not None
+    assert store.get("bb2") is None
+    assert store.get("cc3") is not None
+
+
+def test_token_chunker_respects_budget_and_boundaries():
+    from document_processing.chunker import chunking_report, iter_token_chunks, token_chunk_text
+
+    sentences = [f"Clause {i} obliges the supplier to deliver item {i} on time." for i in range(40)]
+    text = "1. Scope\n" + " ".join(sentences[:20]) + "\n\n2. Payment Terms\n" + " ".join(sentences[20:])
+
+    chunks = token_chunk_text(text, max_tokens=120, overlap_tokens=20)
+    assert len(chunks) > 2
+    for c in chunks:
+        assert c["tokens"] <= 120
+        # every chunk ends at a sentence boundary and never on a dangling heading
+        assert c["text"].endswith(".")
+    assert any(c["text"].startswith("2. Payment Terms") for c in chunks)
+    assert all(c["overlap_tokens"] <= 20 for c in chunks)
+
+    # feeding the same text piecewise gives the same chunks
+    pieces = [text[i : i + 37] for i in range(0, len(text), 37)]
+    assert list(iter_token_chunks(pieces, max_tokens=120, overlap_tokens=20)) == chunks
+
+    report = chunking_report(chunks, calls_per_chunk=2, prompt_tokens=50)
+    assert report["chunk_count"] == len(chunks)
+    assert report["llm_input_tokens"] == 2 * report["chunk_tokens"] + 50 * len(chunks)
+
+
+def test_token_chunker_keeps_trailing_and_heading_only_text(tmp_path):
+    from document_processing.chunker import token_chunk_text
+    from main import process_document
+
+    # a heading at the very end has no section to open, so it stays in the last chunk
+    chunks = token_chunk_text("Some body text.\n\nAPPROVED BY THE BOARD")
+    assert [c["text"] for c in chunks] == ["Some body text.\n\nAPPROVED BY THE BOARD"]
+
+    invoice = "ACME CORP\nINVOICE NO 4411\nTOTAL DUE EUR 12,500\nPAYABLE WITHIN 30 DAYS"
+    chunks = token_chunk_text(invoice)
+    assert len(chunks) == 1 and chunks[0]["text"] == invoice.replace("\n", "\n\n")
+
+    doc = tmp_path / "invoice.txt"
+    doc.write_text(invoice)
+    result = process_document(str(doc), "context.md", backend=StubBackend())
+    assert result["metadata"]["chunk_count"] == 1
+
+
+def test_chunk_token_budget_follows_backend_model():
+    from document_processing.chunker import MAX_CHUNK_TOKENS, chunk_token_budget
+
+    class Small:
+        model = "tinyllama"
+        context_window = 1024
+
+    assert chunk_token_budget(Small()) == 128
+    assert chunk_token_budget(StubBackend()) == MAX_CHUNK_TOKENS
+
+
+def test_near_duplicate_chunks_are_analyzed_once(tmp_path):
+    from document_processing.dedup import cluster_near_duplicates
+
+    disclaimer = (
+        "This document is confidential and intended solely for the addressee. "
+        "Any disclosure, copying or distribution of its contents is strictly prohibited without consent."
+    )
+    texts = [
+        disclaimer,
+        "Quarterly revenue grew by twelve percent driven by the new legal services unit.",
+        disclaimer.replace("solely", "only"),
+        disclaimer,
+    ]
+    assert cluster_near_duplicates(texts, threshold=0.7) == [[0, 2, 3], [1]]
+    assert cluster_near_duplicates(texts[:2]) == [[0], [1]]
+
+    class CountingStub(StubBackend):
+        context_window = 1024 + 200  # 200-token chunks: one section each
+        calls = 0
+
+        def chat(self, prompt):
+            CountingStub.calls += 1
+            return super().chat(prompt)
+
+    # header/footer removal drops exact repeats, so vary one word per copy
+    long_disclaimer = (
+        disclaimer + " Recipients must delete this message and notify the sender immediately. "
+        "The sender accepts no liability for damage caused by software viruses or transmission errors. "
+        "Opinions expressed are those of the author and do not represent the views of the company. "
+        "Thank you for your cooperation."
+    )
+    variants = ["solely", "only", "exclusively"]
+    doc = tmp_path / "repeated.txt"
+    doc.write_text(
+        "\n\n".join(f"SECTION {i}\n{long_disclaimer.replace('solely', w)}" for i, w in enumerate(variants)),
+        encoding="utf-8",
+    )
+
+    from main import process_document
+
+    result = process_document(str(doc), "context.md", backend=CountingStub())
+
+    assert result["metadata"]["chunk_count"] == 3
+    assert result["metadata"]["duplicate_chunks"] == 2
+    assert [c["chunk_id"] for c in result["chunks"]] == [0, 1, 2]
+    assert [c.get("duplicate_of") for c in result["chunks"]] == [None, 0, 0]
+    assert "exclusively" in result["chunks"][2]["text"]
+    # two chunk calls for the single representative plus the document-level combine
+    assert CountingStub.calls == 3
+
+
+def test_noise_prefilter_skips_llm_for_garbage_chunks(tmp_path):
+    from document_processing.prefilter import noise_score
+
+    assert noise_score("Page 1 of 40\n2\n3\n- 4 -\nPage 5\n6\n7") >= 0.7
+    assert noise_score("12.5 | 13.2 | 14.8\n15.1 | 16.0 | 17.3\n$ 1,200 | $ 1,450\nQ1 Q2 Q3") >= 0.7
+    assert noise_score(Path("tests/documents/sample.txt").read_text(encoding="utf-8")) < 0.3
+
+    class FailingBackend(StubBackend):
+        def chat(self, prompt):
+            if "<CHUNK>" in prompt:
+                raise AssertionError("noise chunk reached the LLM")
+            return super().chat(prompt)
+
+    doc = tmp_path / "scan.txt"
+    doc.write_text("Page 1 of 40\n2\n3\n- 4 -\nPage 5\n6\n7", encoding="utf-8")
+    ctx = tmp_path / "context.md"
+    ctx.write_text("focus=legal\nnoise_threshold=0.6", encoding="utf-8")
+    assert ContextLoader(str(ctx)).load_parsed()["noise_threshold"] == 0.6
+
+    from main import process_document
+
+    result = process_document(str(doc), str(ctx), backend=FailingBackend())
+    assert result["metadata"]["low_information_chunks"] == 1
+    assert result["chunks"][0]["summary"] == "LOW INFORMATION CONTENT"
+    assert result["chunks"][0]["key_info"]["low_information"] is True
+
+
+def test_chunk_processor_combined_mode_uses_one_call():
+    calls = []
+
+    class CombinedStub(StubBackend):
+        chunk_mode = "combined"
+
+        def chat(self, prompt):
+            calls.append(prompt)
+            return super().chat(prompt)
+
+    stub = CombinedStub(
+        responses={
+            "in a single JSON object": "```json\n"
+            + json.dumps(
+                {
+                    "summary": "Combined chunk summary",
+                    "topics": ["finance"],
+                    "entities": ["legal"],
+                    "facts": ["fact1"],
+                    "numbers": ["12%"],
+                    "actions": [],
+                    "misc": [],
+                }
+            )
+            + "\n```"
+        }
+    )
+    processor = ChunkProcessor(backend=stub)
+    assert processor.mode == "combined" and processor.calls_per_chunk == 1
+
+    d = processor.process_chunk("Some legal and finance text.", 3).model_dump()
+    assert len(calls) == 1
+    assert d["summary"] == "Combined chunk summary"
+    assert d["key_info"]["numbers"] == ["12%"]
+    assert set(d["topics"]) == {"finance", "legal", "fact1"}
+
+    # the two-call mode stays available for comparison
+    assert ChunkProcessor(backend=stub, mode="split").calls_per_chunk == 2
+
+
+def test_process_chunks_is_concurrent_ordered_and_isolates_failures():
+    import threading
+    import time
+
+    state = {"in_flight": 0, "peak": 0}
+    lock = threading.Lock()
+
+    class SlowStub(StubBackend):
+        def chat(self, prompt):
+            if "chunk-3" in prompt:
+                raise ConnectionError("model host went away")
+            with lock:
+                state["in_flight"] += 1
+                state["peak"] = max(state["peak"], state["in_flight"])
+            time.sleep(0.02)
+            with lock:
+                state["in_flight"] -= 1
+            return super().chat(prompt)
+
+    processor = ChunkProcessor(backend=SlowStub())
+    chunks = [{"chunk_id": i, "text": f"chunk-{i}"} for i in range(8)]
+    results = processor.process_chunks(chunks, max_in_flight=3)
+
+    assert [r.chunk_id for r in results] == list(range(8))
+    assert 1 < state["peak"] <= 3
+    assert results[3].key_info["error"] == "CHUNK_FAILED"
+    assert "model host went away" in results[3].key_info["detail"]
+    assert all("error" not in r.key_info for i, r in enumerate(results) if i != 3)
+
+
+def test_aprocess_document_matches_sync_pipeline():
+    import asyncio
+    from main import aprocess_document, process_document
+
+    stub = StubBackend(
+        responses={
+            "Summarize the following text chunk": json.dumps({"summary": "Chunk summary", "topics": ["legal"]}),
+            "Extract the most important information": json.dumps({"entities": ["legal"], "facts": ["f1"]}),
+            "Combine all chunk information": json.dumps(
+                {
+                    "summary": "Combined summary",
+                    "insights": ["i1"],
+                    "uncertainties": [],
+                    "confidence": 0.7,
+                }
+            ),
+        }
+    )
+    path = str(Path("tests/documents/sample.txt"))
+    sync_result = process_document(path, "context.md", backend=stub)
+    async_result = asyncio.run(aprocess_document(path, "context.md", backend=stub))
+
+    assert async_result["doc_summary"] == "Combined summary"
+    assert async_result["chunks"] == sync_result["chunks"]
+    assert async_result["recommendation"] == sync_result["recommendation"]
+
+
+def test_ollama_backend_reuses_one_configured_client(monkeypatch, ollama_stand_in):
+    import pytest
+    from ai.backend import llm_ollama
+
+    if not llm_ollama.OLLAMA_AVAILABLE:
+        pytest.skip("ollama SDK not installed")
+
+    backend = llm_ollama.OllamaBackend(model="gemma3", keep_alive="1h", options={"num_ctx": 8192})
+    client = backend.client
+    calls = []
+    monkeypatch.setattr(client, "chat", lambda **kw: calls.append(kw) or {"message": {"content": "ok"}})
+
+    assert backend.chat("a") == "ok"
+    assert backend.chat("b") == "ok"
+    assert backend.client is client
+    assert [c["keep_alive"] for c in calls] == ["1h", "1h"]
+    assert calls[0]["options"] == {"num_ctx": 8192}
+    assert backend.context_window == 8192
+
+    # health probes share one short-timeout client instead of opening a pool each
+    server = ollama_stand_in("a")
+    backend = llm_ollama.OllamaBackend(host=server.url)
+    assert backend.health_check() and backend.health_check()
+    probe = backend._probe_client
+    server.healthy = False
+    assert not backend.health_check() and backend._probe_client is probe
+    assert backend.health_check(timeout=1.0) is False and backend._probe_client is not probe
+
+
+def test_process_chunks_submits_batches_to_chat_batch():
+    import asyncio
+
+    class BatchingStub(StubBackend):
+        batch_size = 3
+        max_concurrency = 1
+
+        def __init__(self):
+            super().__init__(responses={"in a single JSON object": json.dumps({"summary": "s", "entities": ["e"]})})
+            self.batches = []
+            self.single_calls = 0
+
+        def chat(self, prompt):
+            self.single_calls += 1
+            if "poison" in prompt:
+                raise RuntimeError("bad chunk")
+            return super().chat(prompt)
+
+        def chat_batch(self, prompts, schemas=None):
+            self.batches.append(len(prompts))
+            if any("poison" in p for p in prompts):
+                raise RuntimeError("batch failed")
+            return [StubBackend.chat(self, p) for p in prompts]
+
+        async def achat_batch(self, prompts, schemas=None):
+            return self.chat_batch(prompts)
+
+    chunks = [{"chunk_id": i, "text": f"chunk {i}"} for i in range(7)]
+    backend = BatchingStub()
+    processor = ChunkProcessor(backend, mode="combined")
+
+    results = processor.process_chunks(chunks)
+    assert backend.batches == [3, 3, 1]
+    assert backend.single_calls == 0
+    assert [r.chunk_id for r in results] == list(range(7))
+    assert all(r.summary == "s" for r in results)
+
+    async_results = asyncio.run(processor.aprocess_chunks(chunks))
+    assert [r.model_dump() for r in async_results] == [r.model_dump() for r in results]
+
+    # a failing batch is retried chunk by chunk, so only the bad chunk errors
+    chunks[4]["text"] = "poison"
+    results = processor.process_chunks(chunks)
+    assert [r.chunk_id for r in results] == list(range(7))
+    assert results[4].key_info["error"] == "CHUNK_FAILED"
+    assert all("error" not in r.key_info for i, r in enumerate(results) if i != 4)
+
+
+def test_cached_backend_serves_repeats_from_memory_then_disk(tmp_path):
+    from ai.backend.llm_cache import CachedBackend, ResponseCache
+    from storage.disk_cache import DiskCache
+
+    class CountingStub(StubBackend):
+        calls = 0
+
+        def chat(self, prompt):
+            CountingStub.calls += 1
+            return f"answer to {prompt}"
+
+    store = DiskCache(str(tmp_path / "llm"))
+    backend = CachedBackend(CountingStub(), ResponseCache(memory_size=2, store=store))
+    assert backend.chat("a") == "answer to a"
+    assert backend.chat("a") == "answer to a"
+    assert backend.chat_batch(["a", "b", "c"]) == ["answer to a", "answer to b", "answer to c"]
+    assert CountingStub.calls == 3
+    assert backend.generate("a") == "answer to a"  # generate is keyed separately
+    assert CountingStub.calls == 4
+
+    # a fresh worker process: empty memory tier, shared disk tier
+    other = CachedBackend(CountingStub(), ResponseCache(store=DiskCache(str(tmp_path / "llm"))))
+    assert other.chat("b") == "answer to b"
+    assert CountingStub.calls == 4
+    assert other.cache.stats()["disk_hits"] == 1
+    assert backend.cache.stats()["misses"] == 4
+
+
+def test_backend_registry_reuses_and_evicts_instances():
+    from ai.backend.registry import BackendRegistry
+    from ai.schema import BackendSpec
+
+    now = [0.0]
+
+    class FakeModel(StubBackend):
+        def __init__(self, spec):
+            super().__init__()
+            self.spec = spec
+
+        def memory_footprint(self):
+            return 10
+
+    registry = BackendRegistry(factory=FakeModel, idle_ttl=60, memory_budget_bytes=25, clock=lambda: now[0])
+    a = BackendSpec(provider="hf", model="a")
+
+    first = registry.get(a)
+    assert registry.get(BackendSpec(provider="hf", model="a")) is first
+    assert registry.stats()["created"] == 1
+
+    # idle instances are dropped and rebuilt on next use
+    now[0] = 100.0
+    assert registry.get(a) is not first
+
+    # the memory budget keeps only the two most recently used models
+    now[0] = 101.0
+    registry.get(BackendSpec(provider="hf", model="b"))
+    now[0] = 102.0
+    registry.get(BackendSpec(provider="hf", model="c"))
+    stats = registry.stats()
+    assert stats["loaded"] == 2 and stats["memory_bytes"] == 20
+
+    # preloaded backends are pinned against idle eviction
+    registry.preload([BackendSpec(provider="hf", model="pinned")])
+    pinned = registry.get(BackendSpec(provider="hf", model="pinned"))
+    now[0] = 1000.0
+    assert registry.get(BackendSpec(provider="hf", model="pinned")) is pinned
+
+
+def test_document_reasoner_reduces_long_documents_hierarchically():
+    import asyncio
+
+    class RecordingStub(StubBackend):
+        context_window = 1024 + 512
+        prompts = []
+
+        def chat(self, prompt):
+            RecordingStub.prompts.append(prompt)
+            return json.dumps({"summary": "partial", "insights": ["i"], "uncertainties": [], "confidence": 0.6})
+
+    chunks = [
+        ChunkResult(chunk_id=i, text="t", summary=f"Summary of part {i}. " * 20, key_info={"facts": [f"f{i}"]})
+        for i in range(40)
+    ]
+    backend = RecordingStub()
+    reasoner = DocumentReasoner(backend, context_path="context.md")
+    result = reasoner.combine(chunks)
+
+    assert result["summary"] == "partial"
+    assert reasoner.reduce_stats["levels"] >= 2
+    assert reasoner.reduce_stats["calls"] == len(RecordingStub.prompts)
+    from document_processing.chunker import estimate_tokens
+
+    assert all(estimate_tokens(p) <= reasoner.token_budget() for p in RecordingStub.prompts)
+    # every chunk reached exactly one first-level prompt
+    assert sum(p.count("Summary of part") for p in RecordingStub.prompts) == 40 * 20
+
+    sync_stats = dict(reasoner.reduce_stats)
+    assert asyncio.run(reasoner.acombine(chunks))["summary"] == "partial"
+    assert reasoner.reduce_stats == sync_stats
+
+    # short inputs still take a single call
+    RecordingStub.prompts.clear()
+    reasoner.combine(chunks[:2])
+    assert len(RecordingStub.prompts) == 1
+
+
+def test_key_info_compaction_merges_dedupes_and_drops_errors():
+    from ai.compaction import compact_summaries, compaction_report, merge_key_info
+
+    key_infos = [
+        {"entities": ["ACME Corp", "Bob"], "facts": ["Due in 30 days"], "numbers": []},
+        {"entities": ["acme  corp", "Alice"], "facts": ["Due in 30 days"], "numbers": ["30"]},
+        {"error": "INVALID_JSON", "raw": "not json at all " * 50},
+        {"low_information": True, "noise_score": 0.9},
+        {"error": "CHUNK_FAILED", "detail": "TimeoutError"},
+    ]
+    assert merge_key_info(key_infos) == {
+        "entities": ["ACME Corp", "Bob", "Alice"],
+        "facts": ["Due in 30 days"],
+        "numbers": ["30"],
+    }
+    assert compact_summaries(["A.", "", "LOW INFORMATION CONTENT", "A.", "B."]) == ["A.", "B."]
+
+    report = compaction_report(key_infos)
+    assert report["key_info_tokens_compact"] < report["key_info_tokens_raw"]
+    assert report["key_info_tokens_saved"] == report["key_info_tokens_raw"] - report["key_info_tokens_compact"]
+
+    prompt = DocumentReasoner(StubBackend(), context_path="context.md").build_prompt(
+        [{"summary": "s", "key_info": k} for k in key_infos]
+    )
+    assert "INVALID_JSON" not in prompt and "not json at all" not in prompt
+    assert '"entities":["ACME Corp","Bob","Alice"]' in prompt
+
+
+def test_progressive_mode_stops_once_recommendation_settles():
+    import asyncio
+
+    class CountingStub(StubBackend):
+        max_concurrency = 1
+
+        def __init__(self):
+            super().__init__(responses={"in a single JSON object": json.dumps({"summary": "s", "topics": ["cooking"]})})
+            self.calls = 0
+
+        def chat(self, prompt):
+            self.calls += 1
+            return super().chat(prompt)
+
+    engine = DecisionEngine(context_rules={"priority_topics": ["legal"], "sensitivity": 0.5})
+    chunks = [{"chunk_id": i, "text": f"chunk {i}"} for i in range(40)]
+    backend = CountingStub()
+    processor = ChunkProcessor(backend, mode="combined")
+
+    tracker = engine.progressive({}, total_chunks=len(chunks))
+    results = processor.process_chunks(chunks, on_result=tracker.on_result, should_stop=tracker.should_stop)
+    # settled after min_chunks (4), but skipping 36 of 40 chunks costs too much confidence;
+    # 14 analyzed chunks is the first point where 1.0 - 0.3 * 26/40 reaches 0.8
+    assert backend.calls == tracker.seen == 14
+    assert [r.chunk_id for r in results] == list(range(40))
+    assert sum(bool(r.key_info.get("skipped")) for r in results) == 26
+    report = tracker.report()
+    assert report["recommendation"] == "Not Relevant" and report["confidence_penalty"] == 0.195
+    final = engine.compute_confidence([r.model_dump() for r in results], {"early_exit": report})
+    assert final == pytest.approx(0.805)
+
+    tracker = engine.progressive({}, total_chunks=len(chunks))
+    results = asyncio.run(
+        processor.aprocess_chunks(chunks, on_result=tracker.on_result, should_stop=tracker.should_stop)
+    )
+    assert tracker.seen == 14
+    assert sum(bool(r.key_info.get("skipped")) for r in results) == 26
+
+    # a few chunks of a long document never settle it, however one-sided they are
+    tracker = engine.progressive({}, total_chunks=30)
+    for _ in range(3):
+        tracker.on_result({"topics": ["cooking"]})
+    assert tracker.confidence < 0.8 and not tracker.should_stop()
+
+    # a score near a recommendation boundary never reaches the confidence threshold
+    tracker = DecisionEngine(context_rules={"priority_topics": ["a"], "sensitivity": 0.5}).progressive({}, 40)
+    for topic in ["a", "b", "c"] * 5:
+        tracker.on_result({"topics": [topic]})
+    assert tracker.score == pytest.approx(1 / 3) and not tracker.should_stop()
+
+
+def test_large_documents_analyze_a_stratified_sample(tmp_path, monkeypatch):
+    import main
+    from document_processing.sampling import select_sample
+
+    chunks = [{"chunk_id": i, "text": f"Plain body text number {i} about nothing much."} for i in range(100)]
+    for i in (10, 30, 50, 70, 90):
+        chunks[i]["text"] = f"SECTION {i}\n\nBody of section {i}."
+    chunks[42]["text"] = "The legal risk in this contract is a legal risk."
+
+    picked = select_sample(chunks, 20, priority_topics=["legal risk"])
+    assert len(picked) == 20 and picked == sorted(picked)
+    assert {0, 1, 98, 99, 42, 10, 30, 50, 70, 90} <= set(picked)
+
+    # end to end: 12 distinct paragraphs, sampled down to 6
+    doc = tmp_path / "big.txt"
+    doc.write_text("\n\n".join(f"Paragraph {i} discusses topic {i} " + f"with detail {i}. " * 30 for i in range(12)))
+    monkeypatch.setattr(main, "SAMPLE_THRESHOLD_CHUNKS", 5)
+    monkeypatch.setattr(main, "SAMPLE_MAX_CHUNKS", 6)
+
+    class TinyWindow(StubBackend):
+        context_window = 1024 + 200
+
+    result = main.process_document(str(doc), "context.md", backend=TinyWindow())
+    sampling = result["metadata"]["sampling"]
+    assert sampling["sampled"] and sampling["sampled_chunks"] == 6
+    assert sampling["sample_rate"] == pytest.approx(6 / sampling["eligible_chunks"])
+    assert result["metadata"]["skipped_chunks"] == sampling["eligible_chunks"] - 6
+    assert result["confidence"] == pytest.approx(1.0 - sampling["confidence_penalty"])
+
+
+def test_router_balances_and_fails_over_across_hosts(ollama_stand_in):
+    from concurrent.futures import ThreadPoolExecutor
+    from ai.backend import llm_ollama
+    from ai.backend.llm_router import RouterBackend
+
+    if not llm_ollama.OLLAMA_AVAILABLE:
+        pytest.skip("ollama SDK not installed")
+
+    a, b, c = (ollama_stand_in(name, delay=0.05) for name in "abc")
+    router = RouterBackend.from_hosts(
+        [a.url, b.url, c.url], router_options={"failure_threshold": 1, "cooldown": 60}, model="gemma3"
+    )
+
+    # least-outstanding balancing spreads concurrent calls over every host
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        answers = list(pool.map(router.chat, ["hi"] * 12))
+    assert a.chats + b.chats + c.chats == 12
+    assert min(a.chats, b.chats, c.chats) >= 3
+    assert set(answers) == {"from a", "from b", "from c"}
+
+    # a failing host is failed over and then skipped while its circuit is open
+    b.healthy = False
+    before = b.chats
+    answers = [router.chat("hi") for _ in range(6)]
+    assert "from b" not in answers
+    assert router.stats()[b.url]["circuit_open"]
+    assert b.chats == before
+
+    # health probes close the circuit again once the host recovers
+    b.healthy = True
+    assert router.check_health() == {a.url: True, b.url: True, c.url: True}
+    assert not router.stats()[b.url]["circuit_open"]
+
+    # a rejected request (prompt too long, unknown model) is the caller's error, not the host's
+    before = a.chats + b.chats + c.chats
+    for server in (a, b, c):
+        server.reject = 400
+    with pytest.raises(llm_ollama.ollama.ResponseError) as error:
+        router.chat("hi")
+    assert error.value.status_code == 400
+    assert a.chats + b.chats + c.chats == before + 1
+    assert not any(s["circuit_open"] or s["consecutive_failures"] for s in router.stats().values())
+    for server in (a, b, c):
+        server.reject = None
+
+    # every host down: the last error surfaces
+    for server in (a, b, c):
+        server.healthy = False
+    with pytest.raises(llm_ollama.ollama.ResponseError):
+        router.chat("hi")
+
+
+def test_cascade_escalates_only_uncertain_answers():
+    import asyncio
+    from ai.backend.llm_cascade import CascadeBackend
+
+    class Model(StubBackend):
+        def __init__(self, name, answers):
+            super().__init__()
+            self.name, self.answers, self.prompts = name, answers, []
+
+        def chat(self, prompt):
+            self.prompts.append(prompt)
+            return self.answers.get(prompt, json.dumps({"summary": self.name, "confidence": 0.9}))
+
+    small = Model("small", {"garbled": "not json", "unsure": json.dumps({"summary": "?", "confidence": 0.2})})
+    large = Model("large", {})
+    cascade = CascadeBackend(small, large)
+
+    schema = {"type": "object"}
+    assert json.loads(cascade.chat("easy"))["summary"] == "small"
+    # free text (e.g. a split-mode summary) isn't expected to be JSON
+    assert cascade.chat("garbled") == "not json"
+    assert json.loads(cascade.chat_json("garbled", schema))["summary"] == "large"
+    assert json.loads(asyncio.run(cascade.achat("unsure")))["summary"] == "large"
+    before = cascade.stats()
+    outputs = cascade.chat_batch(["easy", "garbled", "garbled"], schemas=[schema, schema, None])
+    assert outputs[2] == "not json"
+    assert [json.loads(o)["summary"] for o in outputs[:2]] == ["small", "large"]
+    assert large.prompts == ["garbled", "unsure", "garbled"]
+
+    stats = cascade.stats()
+    assert stats["calls"] == 7 and stats["escalated"] == 3
+    assert stats["invalid_json"] == 2 and stats["low_confidence"] == 1
+    assert stats["escalation_rate"] == 0.429
+    delta = CascadeBackend.stats_delta(before, stats)
+    assert delta["calls"] == 3 and delta["escalated"] == 1 and delta["escalation_rate"] == 0.333
+
+    # a borderline document-level decision is re-asked of the large model
+    borderline = json.dumps({"summary": "s", "insights": ["a", "b", "c"], "uncertainties": [], "confidence": 0.9})
+    small.answers = {}
+    small.chat = lambda prompt: borderline
+    reasoner = DocumentReasoner(cascade, context_path="context.md")
+    before = cascade.stats()
+    result = reasoner.combine([{"summary": "x", "key_info": {}}])
+    assert result["summary"] == "large"
+    assert reasoner.reduce_stats == {"levels": 1, "calls": 2, "escalated": 1}
+    delta = CascadeBackend.stats_delta(before, cascade.stats())
+    assert delta["calls"] == 1 and delta["requested"] == 1 and delta["escalation_rate"] == 1.0
+
+    # the large model's own borderline answer is final: no second large-model call
+    small.chat = lambda prompt: json.dumps({"summary": "s", "insights": [], "uncertainties": [], "confidence": 0.2})
+    items = [{"summary": "x", "key_info": {}}]
+    answer = {"summary": "l", "insights": [], "uncertainties": [], "confidence": 0.45}
+    large.answers = {reasoner.build_prompt(items): json.dumps(answer)}
+    large.prompts.clear()
+    before = cascade.stats()
+    result = asyncio.run(reasoner.acombine(items))
+    assert result["summary"] == "l" and len(large.prompts) == 1
+    assert reasoner.reduce_stats == {"levels": 1, "calls": 2, "escalated": 1}
+    delta = CascadeBackend.stats_delta(before, cascade.stats())
+    assert delta["escalated"] == 1 and delta["low_confidence"] == 1 and delta["escalation_rate"] == 1.0
+
+    # a large model with JSON mode re-answers under the document schema
+    large.supports_json_mode = True
+    large.chat_json = lambda prompt, schema=None: json.dumps({"summary": "large json", "schema": schema is not None})
+    assert json.loads(cascade.escalate("p", {"type": "object"})) == {"summary": "large json", "schema": True}
+
+
+def test_malformed_json_is_repaired_locally_or_retried_once():
+    from ai.json_repair import extract_json
+
+    assert extract_json('Sure! Here is the JSON:\n```json\n{"summary": "s", "topics": ["a",],}\n```') == {
+        "summary": "s",
+        "topics": ["a"],
+    }
+    assert extract_json("{'summary': 'py', 'ok': True}") == {"summary": "py", "ok": True}
+    assert extract_json('{"summary": "cut off", "topics": ["a", "b') == {"summary": "cut off", "topics": ["a", "b"]}
+    assert extract_json("no json here") is None
+    # an echoed prompt's schema example comes before the real answer
+    echoed = (
+        'Return JSON like {"summary": "3-6 sentences", "topics": ["main topics"]}\n{"summary": "real", "topics": []}'
+    )
+    assert extract_json(echoed) == {"summary": "real", "topics": []}
+    # bracketed prose after the answer is not the answer
+    answer = {"summary": "ok", "insights": ["a"], "confidence": 0.8}
+    assert extract_json(json.dumps(answer) + "\n\nReferences: [1]") == answer
+    assert extract_json(f"Result: {json.dumps(answer)} Note: confidence is on a [0, 1] scale.") == answer
+    assert extract_json("Topics: [1, 2]") == [1, 2]
+
+    class JsonModel(StubBackend):
+        supports_json_mode = True
+
+        def __init__(self, answers):
+            super().__init__()
+            self.answers, self.schemas = answers, []
+
+        def chat_json(self, prompt, schema=None):
+            self.schemas.append(schema)
+            return self.answers.pop(0)
+
+    good = json.dumps({"summary": "ok", "topics": ["x"], "entities": ["Acme"]})
+    backend = JsonModel(["I cannot comply", good, '{"summary": "fenced", "facts": ["f",]}'])
+    processor = ChunkProcessor(backend=backend, mode="combined")
+    first = processor.process_chunk("text one", 0)
+    second = processor.process_chunk("text two", 1)
+    assert first.summary == "ok" and "Acme" in first.topics
+    assert second.summary == "fenced" and second.key_info["facts"] == ["f"]
+    assert backend.schemas[0]["required"] == ["summary"]
+    report = processor.parse_stats.report()
+    assert report["retried"] == 1 and report["parsed"] == 1 and report["repaired"] == 1 and report["failed"] == 0
+
+    doc = json.dumps({"summary": "doc", "insights": ["a"], "uncertainties": [], "confidence": 0.8})
+    reasoner = DocumentReasoner(JsonModel(["garbage", "still garbage", doc]), context_path="context.md")
+    result = reasoner.combine([{"summary": "x", "key_info": {}}])
+    # one retry only: the unrecoverable answer falls back to plain text
+    assert result["summary"] == "still garbage" and result["confidence"] == 0.3
+    assert reasoner.parse_stats.report() == {
+        "parsed": 0,
+        "repaired": 0,
+        "retried": 1,
+        "failed": 1,
+        "failure_rate": 1.0,
+    }
+
+
+def test_lexical_triage_scores_documents_without_llm(tmp_path):
+    from main import triage_document
+
+    engine = DecisionEngine(
+        context_rules={"priority_topics": ["risk", "red flags"], "ignore_topics": ["marketing"], "sensitivity": 0.8}
+    )
+    relevant = engine.lexical_triage(["Key risks: several red flags in the audit.", "Risk owners are listed below."])
+    assert relevant["recommendation"] == "Full Read Recommended"
+    assert relevant["priority_topics"]["red flags"] > 0 and relevant["priority_topics"]["risk"] > 0
+    # words of a phrase apart don't count as the phrase
+    assert engine.lexical_triage(["a red car and some flags"])["priority_topics"]["red flags"] == 0
+    assert engine.lexical_triage(["Quarterly marketing newsletter."])["recommendation"] == "Not Relevant"
+    mixed = engine.lexical_triage(["One risk noted.", "Marketing plan for marketing team."])
+    assert mixed["score"] < engine.lexical_triage(["One risk noted.", "Plan for the team."])["score"]
+
+    doc = tmp_path / "memo.txt"
+    doc.write_text("".join(f"Clause {i}: the finance team flagged legal risk number {i}.\n" for i in range(40)))
+    ctx = tmp_path / "context.md"
+    ctx.write_text("focus=legal,finance\nsensitivity=high\n")
+    result = triage_document(str(doc), str(ctx))
+    assert result["recommendation"] == "Full Read Recommended"
+    assert sorted(result["topics"]) == ["finance", "legal"]
+    assert result["metadata"]["mode"] == "lexical"
+
+
+def test_context_rules_match_stemmed_phrases_and_score_in_batches():
+    from ai.context_loader import ContextRules, compile_rules
+
+    rules = {"priority_topics": ["Risk", "red flags", "licensing"], "ignore_topics": ["marketing"], "sensitivity": 0.5}
+    compiled = ContextRules(rules)
+    assert compiled.classify("Legal Risks") == (True, False)
+    assert compiled.classify("red flag") == (True, False)
+    assert compiled.classify("licensed software") == (True, False)
+    assert compiled.classify("budget") == (False, False)
+    assert compiled.classify("Marketing plan") == (False, True)
+
+    engine = DecisionEngine(context_rules=rules)
+    assert engine.rules is compile_rules(dict(rules))
+    topic_sets = [["legal risks", "budget"], ["marketing plan"], [], ["red flags"]]
+    scores = engine.score_topic_sets(topic_sets)
+    assert scores == [engine.compute_read_worthiness({"combined_topics": t}) for t in topic_sets]
+    assert scores == [0.5, 0.0, 0.0, 1.0]
+
+
+def test_topic_embeddings_match_inflections_and_are_cached():
+    from ai.context_loader import ContextRules
+    from ai.embeddings import CachedEmbedder, HashingEmbedder
+
+    embedder = CachedEmbedder(HashingEmbedder())
+    rules = ContextRules({"priority_topics": ["invoice", "finance"], "ignore_topics": ["advertising"]}, embedder)
+    assert rules.classify("Invoices") == (True, False)
+    assert rules.classify("financial") == (True, False)
+    assert rules.classify("advertisements") == (False, True)
+    assert rules.classify("legal") == (False, False)
+
+    # one embedding per distinct string, across calls and duplicates
+    misses = embedder.stats()["misses"]
+    scores = rules.read_worthiness_many([["invoices", "weather"], ["invoices", "Invoices"], []])
+    assert scores == [0.5, 1.0, 0.0]
+    assert embedder.stats()["misses"] == misses + 2  # "invoices", "weather"
+
+    strict = ContextRules({"priority_topics": ["finance"], "topic_similarity": 0.99}, embedder)
+    assert strict.classify("financial") == (False, False)
+
+    # a shared ending is not a shared meaning: negations and look-alikes don't match
+    rules = ContextRules({"priority_topics": ["legal", "risk"], "ignore_topics": ["security"]}, embedder)
+    for topic in ("illegal", "insecurity", "brisk", "unlawful"):
+        assert rules.classify(topic) == (False, False), topic
+    engine = DecisionEngine({"priority_topics": ["legal", "risk"], "ignore_topics": ["security"], "sensitivity": 0.8})
+    assert engine.compute_read_worthiness({"combined_topics": ["illegal"]}) == 0.0
+    assert engine.compute_read_worthiness({"combined_topics": ["brisk"]}) == 0.0
+    # "insecurity" costs no ignore penalty: it scores like any unrelated topic
+    unrelated = engine.compute_read_worthiness({"combined_topics": ["legal", "weather"]})
+    assert engine.compute_read_worthiness({"combined_topics": ["legal", "insecurity"]}) == unrelated
+
+
+def test_context_loader_caches_until_the_file_changes(tmp_path, monkeypatch):
+    import builtins
+    import os
+
+    ctx = tmp_path / "context.md"
+    ctx.write_text("focus=legal\nsensitivity=low\n")
+    opened = []
+    real_open = builtins.open
+    monkeypatch.setattr(builtins, "open", lambda path, *a, **kw: opened.append(path) or real_open(path, *a, **kw))
+
+    first = ContextLoader(str(ctx)).load_parsed()
+    again = ContextLoader(str(ctx)).load_parsed()
+    assert again is first and opened.count(str(ctx)) == 1
+    with pytest.raises(TypeError):
+        first["sensitivity"] = 0.9
+    with pytest.raises(TypeError):
+        first["priority_topics"].append("risk")
+
+    ctx.write_text("focus=finance\nsensitivity=low\n")
+    os.utime(ctx, ns=(ctx.stat().st_atime_ns, ctx.stat().st_mtime_ns + 1_000_000))
+    changed = ContextLoader(str(ctx)).load_parsed()
+    assert changed["priority_topics"] == ["finance"] and opened.count(str(ctx)) == 2
+
+    # text given directly never touches the disk, and equal content shares one parse
+    direct = ContextLoader("missing.md", text="focus=finance\nsensitivity=low").load_parsed()
+    assert direct is changed and "missing.md" not in opened
+
+
+def test_batched_json_answers_are_retried_once_each():
+    class Batcher(StubBackend):
+        supports_json_mode = True
+        batch_size = 4
+
+        def __init__(self):
+            super().__init__()
+            self.calls = 0
+
+        def chat_batch(self, prompts, schemas=None):
+            self.calls += len(prompts)
+            return ["garbage"] * len(prompts)
+
+        def chat_json(self, prompt, schema=None):
+            self.calls += 1
+            return "still garbage"
+
+    backend = Batcher()
+    processor = ChunkProcessor(backend=backend, mode="combined", max_json_retries=1)
+    processor.process_batch([{"chunk_id": 0, "text": "a"}, {"chunk_id": 1, "text": "b"}])
+    # one batched attempt plus one re-ask per prompt
+    assert backend.calls == 4
+    assert processor.parse_stats.report()["retried"] == 2
+
+
+def test_cache_skips_broken_json_and_expires_memory_entries():
+    from ai.backend.llm_cache import CachedBackend, ResponseCache
+
+    class Flaky(StubBackend):
+        def __init__(self, answers):
+            super().__init__()
+            self.answers = answers
+
+        def chat(self, prompt):
+            return self.answers.pop(0)
+
+    backend = CachedBackend(Flaky(["not json", '{"ok": true}', "prose"]), ResponseCache())
+    schema = {"type": "object"}
+    # the broken answer isn't cached, so a retry reaches the model
+    assert backend.chat_json("p", schema) == "not json"
+    assert backend.chat_json("p", schema) == '{"ok": true}'
+    assert backend.chat_json("p", schema) == '{"ok": true}'
+    # batch prompts without a schema are free text and cached as-is
+    assert backend.chat_batch(["q"]) == ["prose"]
+    assert backend.chat_batch(["q"]) == ["prose"]
+    assert backend.chat_batch(["p"], schemas=[schema]) == ['{"ok": true}']
+
+    now = [0.0]
+    cache = ResponseCache(ttl=60, clock=lambda: now[0])
+    cache.set("k", "v")
+    now[0] = 59
+    assert cache.get("k") == "v"
+    now[0] = 61
+    assert cache.get("k") is None